@@ -0,0 +1,91 @@
+"""
+Benchmark of LOOP 3 (shop visit and sister engine change flags).
+
+Compares the grouped-shift implementation against the previous per-ESN loop
+(src/backups/Loop_3_flag_sv_and_eng_change_backup.py) on synthetic fleets of
+increasing size.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_loop_3
+    python -m benchmarks.bench_loop_3 --esns 100 500 1000 --rows-per-esn 20
+"""
+import os
+import argparse
+import time
+
+# Silence the progress bar of the legacy loop
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import numpy as np
+import pandas as pd
+from src.Loop_3_flag_sv_and_eng_change_v1 import Loop_3_flag_sv_and_eng_change
+from src.backups.Loop_3_flag_sv_and_eng_change_backup import (
+    Loop_3_flag_sv_and_eng_change as Loop_3_legacy)
+
+
+def make_fleet(n_esn: int, rows_per_esn: int = 20, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a synthetic LOOP 3 input with n_esn engines and rows_per_esn new reports each.
+
+    Parameters
+    ----------
+    Args:
+        - n_esn (int): number of engines
+        - rows_per_esn (int): number of reports per engine
+        - seed (int): random generator seed
+
+    Returns
+    -------
+        - df (pd.DataFrame): frame with 'ESN', 'NEW_FLAG', 'reportdatetime', 'SISTER_ESN'
+          and 'days_since_prev' columns
+    """
+    rng = np.random.default_rng(seed)
+    n = n_esn * rows_per_esn
+    esn = np.repeat(np.arange(70000, 70000 + n_esn), rows_per_esn)
+    gaps = rng.exponential(5.0, n)
+    gaps[::rows_per_esn] = 0
+    days = gaps.reshape(n_esn, rows_per_esn).cumsum(axis=1).ravel()
+    sister = esn + 10000 + (rng.random(n) < 0.02).cumsum() % 3
+    return pd.DataFrame({
+        "ESN": esn,
+        "NEW_FLAG": 1,
+        "reportdatetime": pd.Timestamp("2024-01-01") + pd.to_timedelta(days, unit="D"),
+        "SISTER_ESN": sister,
+        "days_since_prev": np.round(gaps, 5),
+    })
+
+
+def time_call(func, df: pd.DataFrame, repeat: int = 3) -> float:
+    """Best wall-clock time in seconds over repeat calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(df, flight_phase="bench", DebugOption=0)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(esn_counts: list, rows_per_esn: int, repeat: int) -> pd.DataFrame:
+    results = []
+    for n_esn in esn_counts:
+        df = make_fleet(n_esn, rows_per_esn)
+        t_new = time_call(Loop_3_flag_sv_and_eng_change, df, repeat)
+        t_old = time_call(Loop_3_legacy, df, 1)
+        results.append({
+            "ESNs": n_esn,
+            "rows": len(df),
+            "legacy_s": round(t_old, 4),
+            "vectorized_s": round(t_new, 4),
+            "speedup": round(t_old / t_new, 1),
+        })
+        print(results[-1], flush=True)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LOOP 3 scaling benchmark")
+    parser.add_argument("--esns", type=int, nargs="+", default=[100, 500, 1000, 2500, 5000])
+    parser.add_argument("--rows-per-esn", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(main(args.esns, args.rows_per_esn, args.repeat).to_string(index=False))
@@ -0,0 +1,411 @@
+"""
+Stage-level benchmark suite with scaling curves and regression gates.
+
+Runs df_merger_new, LOOP 0 ... LOOP 9 (there is no LOOP 1), merge_flight_phases
+(legacy group scan and as-of join) and the whole Live_Data_Mode pipeline on
+synthetic fleets of increasing size (src/utils/synthetic_fleet.py, no SQL), and
+records for each stage the wall time, the CPU time and the peak RSS (worker
+processes included).
+
+The results are compared to a JSON baseline: the run fails (exit code 1) when a
+stage is slower or heavier than its baseline beyond the tolerance. Baselines are
+machine specific, write one with --update-baseline on the machine the gate runs on.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_stages --update-baseline
+    python -m benchmarks.bench_stages
+    python -m benchmarks.bench_stages --aircraft 5 20 80 --flights 200 --tolerance 0.3
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import time
+
+# Silence the progress bars of the loops
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import numpy as np
+import pandas as pd
+import psutil
+from src.utils.synthetic_fleet import make_fleet_data
+from src.utils.data_ing import clean_query_data
+from src.utils.df_merger_new_v2 import cast_query_dtypes, df_merger_new
+from src.utils.days_difference_v1 import days_difference
+from src.utils.merge_flight_phases_v1 import merge_flight_phases, merge_flight_phases_asof
+from src.utils.Initialise_Algorithm_Settings_engine_type_specific import (
+    Initialise_Algorithm_Settings_engine_type_specific, Xrates_dic_vector_norm)
+from src.Loop_0_Calculate_Deltas_v1 import Loop_0_delta_calc as Loop0
+from src.Loop_2_E2E_v1 import Loop_2_E2E as Loop2
+from src.Loop_3_flag_sv_and_eng_change_v1 import Loop_3_flag_sv_and_eng_change as Loop3
+from src.Loop_4_movavg_mod_v1 import Loop_4_movavg as Loop4
+from src.Loop_5_performance_trend import Loop5_performance_trend as Loop5
+from src.Loop_6_fit_signatures import Loop_6_fit_signatures as Loop6
+from src.Loop_7_IPC_HPC_PerfShift import Loop_7_IPC_HPC_PerfShift as Loop7
+from src.Loop_8_Summary_Stats import Loop_8_Summary_Stats as Loop8
+from src.Loop_9_combine_DSC import Loop_9_combine_DSC as Loop9
+from src.Live_Data_Mode_debug_v1 import Live_Data_Mode
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "bench_stages.json")
+METRICS = ["wall_s", "cpu_s", "peak_rss_mb"]
+# Relative increase over the baseline allowed before a stage is flagged
+DEFAULT_TOLERANCE = {"wall_s": 0.25, "cpu_s": 0.25, "peak_rss_mb": 0.15}
+# Absolute increase below which a change is noise (short stages, allocator slack)
+NOISE_FLOOR = {"wall_s": 0.05, "cpu_s": 0.05, "peak_rss_mb": 20.0}
+XRATES_FILE = "T1000 Pack B Xrates General Version 1_plus_one_extra_line.xlsx"
+PHASE_COLUMNS = ['ESN', 'operator', 'ACID', 'ENGPOS', 'DSCID', 'reportdatetime', 'row_sum']
+
+
+def _tree_usage(process: psutil.Process) -> tuple:
+    """
+    CPU seconds by pid and total RSS (bytes) of a process and its worker processes.
+    Only the private pages of the workers are counted: forked workers share the pages
+    of the parent, which would be counted once per worker otherwise.
+    """
+    cpu, rss = {}, 0
+    for proc in [process, *process.children(recursive=True)]:
+        try:
+            times = proc.cpu_times()
+            memory = proc.memory_info()
+        except psutil.NoSuchProcess:
+            continue
+        cpu[proc.pid] = times.user + times.system
+        rss += memory.rss if proc is process else memory.rss - getattr(memory, "shared", 0)
+    return cpu, rss
+
+
+class ResourceSampler:
+    """
+    Context manager measuring the wall time, the CPU time and the peak RSS of the
+    current process and of its worker processes (e.g. the LOOP 6 pool) while the
+    block runs. The RSS is sampled by a background thread every interval seconds.
+
+    Parameters
+    ----------
+    Args:
+        - interval (float): RSS sampling period in seconds
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.metrics = {}
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, _tree_usage(self.process)[1])
+
+    def __enter__(self):
+        self._cpu_start, self._peak = _tree_usage(self.process)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._t0
+        self._stop.set()
+        self._thread.join()
+        cpu_end, rss_end = _tree_usage(self.process)
+        # Processes started during the block count from 0, the ones gone are lost
+        cpu = sum(seconds - self._cpu_start.get(pid, 0.0) for pid, seconds in cpu_end.items())
+        self.metrics = {
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_rss_mb": round(max(self._peak, rss_end) / 2**20, 1),
+        }
+        return False
+
+
+def measure(func, *args, repeat: int = 1, copy_args: bool = True, **kwargs) -> tuple:
+    """
+    Runs func(*args, **kwargs) repeat times and keeps the best of each metric.
+
+    Parameters
+    ----------
+    Args:
+        - func (callable): function to measure
+        - repeat (int): number of calls
+        - copy_args (bool): pass deep copies of the DataFrame (and dict of DataFrames)
+          arguments, so that each call starts from the same input
+
+    Returns
+    -------
+        - tuple: (result of the last call, {"wall_s", "cpu_s", "peak_rss_mb"})
+    """
+    def fresh(arg):
+        if not copy_args:
+            return arg
+        if isinstance(arg, pd.DataFrame):
+            return arg.copy()
+        if isinstance(arg, dict):
+            return {key: fresh(value) for key, value in arg.items()}
+        return arg
+
+    best = {}
+    result = None
+    for _ in range(repeat):
+        call_args = [fresh(arg) for arg in args]
+        call_kwargs = {key: fresh(value) for key, value in kwargs.items()}
+        with ResourceSampler() as sampler:
+            result = func(*call_args, **call_kwargs)
+        best = {metric: min(best.get(metric, np.inf), value) for metric, value in sampler.metrics.items()}
+    return result, best
+
+
+def prepare_inputs(n_aircraft: int, flights_per_aircraft: int, seed: int = 0) -> dict:
+    """
+    Synthetic query outputs of the three flight phases, cleaned and typed as
+    query_run returns them (input of df_merger_new).
+    """
+    data_dict = make_fleet_data(n_aircraft=n_aircraft, flights_per_aircraft=flights_per_aircraft, seed=seed)
+    return {flight_phase: cast_query_dtypes(clean_query_data(data, flight_phase))
+            for flight_phase, data in data_dict.items()}
+
+
+def _flag_new(df: pd.DataFrame) -> pd.DataFrame:
+    # First run: every row is new (rest of merge_query_data)
+    df["NEW_FLAG"] = 1
+    return days_difference(df).sort_values(by='reportdatetime', ascending=False).reset_index(drop=True)
+
+
+def _add_stage(results: dict, stage: str, metrics: dict):
+    # Phases run one after the other: times add up, the peak is the highest one
+    total = results.setdefault(stage, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+    total["wall_s"] = round(total["wall_s"] + metrics["wall_s"], 4)
+    total["cpu_s"] = round(total["cpu_s"] + metrics["cpu_s"], 4)
+    total["peak_rss_mb"] = max(total["peak_rss_mb"], metrics["peak_rss_mb"])
+
+
+def run_stages(inputs: dict, lim_dict: dict, Xrates: dict, repeat: int = 1,
+               pipeline: bool = True, legacy_merge: bool = True) -> dict:
+    """
+    Measures each stage on the output of the previous one, in the current directory
+    (see run_suite, the loops read and write Fleetstore_Data there).
+
+    Parameters
+    ----------
+    Args:
+        - inputs (dict): {flight_phase: pd.DataFrame} from prepare_inputs
+        - lim_dict (dict), Xrates (dict): algorithm settings
+        - repeat (int): number of calls per stage (best kept)
+        - pipeline (bool): also measure the whole Live_Data_Mode pipeline
+        - legacy_merge (bool): also measure the legacy merge_flight_phases group scan
+
+    Returns
+    -------
+        - dict: {stage: {"wall_s", "cpu_s", "peak_rss_mb"}}, times summed over the phases
+    """
+    stages = [
+        ("LOOP 0", Loop0, {"DebugOption": 0}),
+        ("LOOP 2", Loop2, {"DebugOption": 0}),
+        ("LOOP 3", Loop3, {"DebugOption": 0}),
+        ("LOOP 4", Loop4, {"DebugOption": 0}),
+        ("LOOP 5", Loop5, {"DebugOption": 0}),
+        ("LOOP 6", Loop6, {"Xrates": Xrates, "DebugOption": 0}),
+        ("LOOP 7", Loop7, {"save_csv": False}),
+        ("LOOP 8", Loop8, {"save_csv": False, "Lim_dict": lim_dict}),
+    ]
+    results = {}
+    data_dict = {}
+    for flight_phase, df in inputs.items():
+        df, metrics = measure(df_merger_new, df, flight_phase=flight_phase, cast_dtypes=False, repeat=repeat)
+        _add_stage(results, "df_merger_new", metrics)
+        df = _flag_new(df)
+        pipeline_input = df.copy()
+        for name, function, kwargs in stages:
+            df, metrics = measure(function, df, flight_phase=flight_phase, repeat=repeat, **kwargs)
+            _add_stage(results, name, metrics)
+        data_dict[flight_phase] = (df, pipeline_input)
+    pipeline_inputs = {flight_phase: frames[1] for flight_phase, frames in data_dict.items()}
+    data_dict = {flight_phase: frames[0] for flight_phase, frames in data_dict.items()}
+
+    data_dict, metrics = measure(Loop9, data_dict, Lim_dict=lim_dict, save_csv=False, repeat=repeat)
+    results["LOOP 9"] = metrics
+    data_dict = data_dict[0]
+    phases = {flight_phase: data_dict[flight_phase][PHASE_COLUMNS] for flight_phase in data_dict}
+    merge_args = (phases['take-off'], phases['climb'], phases['cruise'])
+    if legacy_merge:
+        results["merge_flight_phases"] = measure(merge_flight_phases, *merge_args, repeat=repeat)[1]
+    results["merge_flight_phases_asof"] = measure(merge_flight_phases_asof, *merge_args, repeat=repeat)[1]
+
+    if pipeline:
+        results["Live_Data_Mode"] = measure(Live_Data_Mode, pipeline_inputs, repeat=repeat)[1]
+    return results
+
+
+def scaling_exponents(runs: list) -> dict:
+    """
+    Slope of log(wall time) against log(rows) for each stage: 1 is linear, 2 quadratic.
+
+    Parameters
+    ----------
+    Args:
+        - runs (list): [{"rows": int, "stages": {stage: metrics}}] at increasing sizes
+
+    Returns
+    -------
+        - dict: {stage: exponent}, stages measured at fewer than two sizes are left out
+    """
+    exponents = {}
+    stages = {stage for run in runs for stage in run["stages"]}
+    for stage in sorted(stages):
+        points = [(run["rows"], run["stages"][stage]["wall_s"]) for run in runs
+                  if stage in run["stages"] and run["stages"][stage]["wall_s"] > 0]
+        if len(points) < 2:
+            continue
+        rows, wall = np.log(np.array(points, dtype=float)).T
+        exponents[stage] = round(float(np.polyfit(rows, wall, 1)[0]), 2)
+    return exponents
+
+
+def run_suite(aircraft_counts: list, flights_per_aircraft: int = 200, repeat: int = 1, seed: int = 0,
+              pipeline: bool = True, legacy_merge: bool = True) -> dict:
+    """
+    Runs the stages at each fleet size in a scratch working directory (the loops
+    and Live_Data_Mode read and write ./Fleetstore_Data), so that the repository
+    data is neither read nor overwritten.
+
+    Returns
+    -------
+        - dict: {"runs": [{"aircraft", "rows", "stages"}], "scaling": {stage: exponent}}
+    """
+    root_dir = os.getcwd()
+    lim_dict, Xrates = Initialise_Algorithm_Settings_engine_type_specific()
+    Xrates = Xrates_dic_vector_norm(Xrates)
+    runs = []
+    for n_aircraft in aircraft_counts:
+        inputs = prepare_inputs(n_aircraft, flights_per_aircraft, seed)
+        n_rows = sum(len(df) for df in inputs.values())
+        with tempfile.TemporaryDirectory() as work_dir:
+            # Live_Data_Mode reads the Xrates from ./src/utils
+            os.makedirs(os.path.join(work_dir, "src", "utils"))
+            os.makedirs(os.path.join(work_dir, "Fleetstore_Data"))
+            shutil.copy(os.path.join(root_dir, "src", "utils", XRATES_FILE),
+                        os.path.join(work_dir, "src", "utils"))
+            os.chdir(work_dir)
+            try:
+                stages = run_stages(inputs, lim_dict, Xrates, repeat, pipeline, legacy_merge)
+            finally:
+                os.chdir(root_dir)
+        runs.append({"aircraft": n_aircraft, "rows": n_rows, "stages": stages})
+        print(f"{n_aircraft} aircraft, {n_rows} rows: "
+              + ", ".join(f"{stage} {metrics['wall_s']:.2f}s" for stage, metrics in stages.items()), flush=True)
+    return {"runs": runs, "scaling": scaling_exponents(runs)}
+
+
+def compare_to_baseline(suite: dict, baseline: dict, tolerance: dict = None, noise_floor: dict = None) -> list:
+    """
+    Stages slower or heavier than the baseline run of the same fleet size.
+
+    A metric regresses when it exceeds the baseline by more than the relative
+    tolerance and by more than the absolute noise floor.
+
+    Parameters
+    ----------
+    Args:
+        - suite (dict): run_suite output
+        - baseline (dict): run_suite output stored as baseline
+        - tolerance (dict, optional): {metric: relative increase allowed}
+        - noise_floor (dict, optional): {metric: absolute increase ignored}
+
+    Returns
+    -------
+        - list: [{"aircraft", "stage", "metric", "baseline", "value", "change"}]
+    """
+    tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+    noise_floor = {**NOISE_FLOOR, **(noise_floor or {})}
+    baseline_runs = {run["aircraft"]: run["stages"] for run in baseline.get("runs", [])}
+    regressions = []
+    for run in suite["runs"]:
+        reference = baseline_runs.get(run["aircraft"], {})
+        for stage, metrics in run["stages"].items():
+            if stage not in reference:
+                continue
+            for metric in METRICS:
+                base, value = reference[stage][metric], metrics[metric]
+                if value - base > noise_floor[metric] and value > base * (1 + tolerance[metric]):
+                    regressions.append({
+                        "aircraft": run["aircraft"], "stage": stage, "metric": metric,
+                        "baseline": base, "value": value,
+                        "change": round(value / base - 1, 3) if base else float("inf")})
+    return regressions
+
+
+def load_baseline(path: str = BASELINE_PATH):
+    """Stored baseline, None if there is none yet."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(suite: dict, path: str = BASELINE_PATH):
+    """Writes the suite results as the new baseline (atomic replace)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(suite, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def report(suite: dict) -> pd.DataFrame:
+    """One row per stage, wall time per fleet size and scaling exponent."""
+    table = pd.DataFrame({f"{run['rows']} rows": {stage: metrics["wall_s"] for stage, metrics in run["stages"].items()}
+                          for run in suite["runs"]})
+    table["exponent"] = pd.Series(suite["scaling"])
+    peak = pd.Series({stage: metrics["peak_rss_mb"] for stage, metrics in suite["runs"][-1]["stages"].items()})
+    table["peak_rss_mb"] = peak
+    return table
+
+
+def main(aircraft_counts: list, flights_per_aircraft: int, repeat: int, baseline_path: str,
+         update_baseline: bool, tolerance: dict, pipeline: bool = True, legacy_merge: bool = True) -> int:
+    suite = run_suite(aircraft_counts, flights_per_aircraft, repeat, pipeline=pipeline, legacy_merge=legacy_merge)
+    suite["settings"] = {"flights_per_aircraft": flights_per_aircraft, "repeat": repeat,
+                         "cpu_count": os.cpu_count(), "python": sys.version.split()[0],
+                         "pandas": pd.__version__, "numpy": np.__version__}
+    print(report(suite).to_string())
+
+    if update_baseline:
+        save_baseline(suite, baseline_path)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        print(f"No baseline at {baseline_path}, run with --update-baseline to create it")
+        return 0
+    if baseline.get("settings", {}).get("flights_per_aircraft") != flights_per_aircraft:
+        print("Warning: the baseline was recorded with a different number of flights per aircraft")
+    regressions = compare_to_baseline(suite, baseline, tolerance)
+    if not regressions:
+        print("No regression against the baseline")
+        return 0
+    print("Regressions against the baseline:")
+    print(pd.DataFrame(regressions).to_string(index=False))
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage-level benchmark suite with regression gates")
+    parser.add_argument("--aircraft", type=int, nargs="+", default=[5, 20, 80],
+                        help="fleet sizes (aircraft, two engines each)")
+    parser.add_argument("--flights", type=int, default=200, help="flights per aircraft")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE["wall_s"],
+                        help="relative increase of the wall and CPU times allowed")
+    parser.add_argument("--rss-tolerance", type=float, default=DEFAULT_TOLERANCE["peak_rss_mb"],
+                        help="relative increase of the peak RSS allowed")
+    parser.add_argument("--no-pipeline", action="store_true", help="skip the whole Live_Data_Mode run")
+    parser.add_argument("--no-legacy-merge", action="store_true", help="skip the legacy merge_flight_phases")
+    args = parser.parse_args()
+    tolerance = {"wall_s": args.tolerance, "cpu_s": args.tolerance, "peak_rss_mb": args.rss_tolerance}
+    sys.exit(main(args.aircraft, args.flights, args.repeat, args.baseline, args.update_baseline,
+                  tolerance, pipeline=not args.no_pipeline, legacy_merge=not args.no_legacy_merge))
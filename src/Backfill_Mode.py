@@ -0,0 +1,107 @@
+"""
+Historical backfill: seeds the Fleetstore data of a new fleet from a date range too
+large for a single query.
+
+The range is split into time windows, fetched per flight phase with a bounded number
+of queries at once (see src.utils.backfill.run_backfill). The loops then process the
+windows in chronological order, each window being merged with the outputs of the
+previous ones as in Live_Data_Mode. Fetched and processed windows are recorded in
+Fleetstore_Data/backfill/manifest.json: running the same command again after a crash
+resumes where it stopped.
+
+Usage (from the working directory holding 'Queries' and 'Fleetstore_Data'):
+    python -m src.Backfill_Mode --start 2024-01-01 --end 2025-01-01
+    python -m src.Backfill_Mode --start 2024-01-01 --end 2025-01-01 --window-days 14 --workers 2
+"""
+import os
+import argparse
+import pandas as pd
+from src.utils.log_file import log_message
+from src.utils.watermark_ledger import WatermarkLedger
+from src.utils.backfill import backfill_phases, plan_windows, run_backfill, window_data_dict, window_key
+from src.Live_Data_Mode_debug_v1 import Live_Data_Mode
+
+
+def Backfill_Mode(
+    start,
+    end,
+    window_days: float = 7,
+    flight_phases: list = None,
+    max_workers: int = 4,
+    chunksize: int = None,
+    pushdown: bool = False,
+    run_loops: bool = True,
+):
+    """
+    Fetches [start, end) window by window, then runs Live_Data_Mode on each window not
+    processed yet, oldest first. The watermarks of the flight phases (and timestamp.txt) are
+    then set to the latest report fetched, so that Live_Data_Mode carries on from there.
+
+    Parameters
+    ----------
+    Args:
+        - start: backfill start (inclusive)
+        - end: backfill end (exclusive)
+        - window_days (float): length of the windows in days
+        - flight_phases (list, optional): flight phases to backfill, all if None
+        - max_workers (int): maximum number of window queries running at once
+        - chunksize (int, optional): stream the queries chunksize rows at a time
+        - pushdown (bool): push the limits and Celsius conversion down to the server
+        - run_loops (bool): process the fetched windows (False only fetches them)
+    """
+    root_dir = os.getcwd()
+    manifest = run_backfill(root_dir, start, end, window_days=window_days, flight_phases=flight_phases,
+                            max_workers=max_workers, chunksize=chunksize, pushdown=pushdown)
+    if not run_loops:
+        return
+
+    windows = plan_windows(start, end, window_days)
+    phases = backfill_phases(os.path.join(root_dir, 'Queries'), flight_phases)
+    working_dir = os.path.join(root_dir, "working_data")
+    # Shared with the live runs: the fits of the backfill are reused by them
+    fit_cache_path = os.path.join(working_dir, "fit_cache.db")
+    for window in windows:
+        if manifest.is_processed(window):
+            continue
+        if not all(manifest.is_fetched(flight_phase, window) for flight_phase in phases):
+            # The windows after a missing one would be processed out of order
+            log_message(f"Backfill stopped at window {window_key(window)}: not fetched yet, run it again")
+            return
+        data_dict = window_data_dict(root_dir, manifest, window)
+        if data_dict:
+            log_message(f"Backfill window {window_key(window)}: processing {list(data_dict)}")
+            stage_errors = Live_Data_Mode(data_dict=data_dict, fit_cache_path=fit_cache_path)
+            if stage_errors:
+                # Not marked: the window (and the ones after it) are processed again by the next run
+                log_message(f"Backfill stopped at window {window_key(window)}: failed stages "
+                            f"{sorted(stage_errors)}, run it again")
+                return
+        manifest.mark_processed(window)
+
+    # Carry on with the live queries from the end of the backfill
+    ledger = WatermarkLedger(os.path.join(working_dir, "watermarks.json"))
+    for flight_phase in phases:
+        latest = [entry["latest"] for entry in manifest.data["fetched"][flight_phase].values() if entry["latest"]]
+        if latest:
+            ledger.observe(flight_phase, pd.DataFrame({"reportdatetime": latest}))
+    ledger.commit()
+    os.makedirs(working_dir, exist_ok=True)
+    with open(os.path.join(working_dir, "timestamp.txt"), 'w', encoding='utf-8') as f_out:
+        f_out.write(windows[-1][1].strftime('%Y-%m-%d %H:%M:%S'))
+    log_message(f"Backfill completed, timestamp.txt set to {windows[-1][1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--start", required=True, help="backfill start, e.g. 2024-01-01")
+    parser.add_argument("--end", required=True, help="backfill end (exclusive)")
+    parser.add_argument("--window-days", type=float, default=7)
+    parser.add_argument("--phases", nargs="+", default=None, help="e.g. cruise climb")
+    parser.add_argument("--workers", type=int, default=4, help="window queries at once")
+    parser.add_argument("--chunksize", type=int, default=None)
+    parser.add_argument("--pushdown", action="store_true")
+    parser.add_argument("--fetch-only", action="store_true")
+    args = parser.parse_args()
+    Backfill_Mode(args.start, args.end, window_days=args.window_days, flight_phases=args.phases,
+                  max_workers=args.workers, chunksize=args.chunksize, pushdown=args.pushdown,
+                  run_loops=not args.fetch_only)
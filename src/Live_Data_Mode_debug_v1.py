@@ -1,11 +1,15 @@
-import asyncio
 import os
 from datetime import datetime as dt
-from src.utils.async_main import main as async_main
+from src.utils.pipeline_runner import run_dag
+from src.utils.async_main import shutdown_process_pool
 from src.utils.log_file import log_message
 from src.utils.Initialise_Algorithm_Settings_engine_type_specific import Initialise_Algorithm_Settings_engine_type_specific, Xrates_dic_vector_norm
 from src.utils.data_ing import data_ingestion
 from src.utils.print_time_now import print_time_now
+from src.utils.tail_state_store import TailStateStore
+from src.utils.watermark_ledger import WatermarkLedger
+from src.utils.storage import data_path, read_frame, write_frame
+from src.utils.snapshot_writer import start_snapshot_sink, stop_snapshot_sink
 from functools import partial
 
 
@@ -20,9 +24,31 @@ from src.Loop_8_Summary_Stats import Loop_8_Summary_Stats as Loop8
 from src.Loop_9_combine_DSC import Loop_9_combine_DSC as Loop9
 
 
-def Live_Data_Mode():
+def _combine_with_stored(data_dict: dict, stored_dict: dict, **kwargs) -> tuple:
+    """
+    Loop 9 on the processed flight phases and on the stored outputs of the phases not
+    processed by the run (see Live_Data_Mode). Only the processed phases are returned.
+    """
+    combined_dict, df_combined = Loop9(data_dict={**stored_dict, **data_dict}, **kwargs)
+    return {flight_phase: combined_dict[flight_phase] for flight_phase in data_dict}, df_combined
+
+
+def Live_Data_Mode(data_dict: dict = None, fit_cache_path: str = None) -> set:
     """
     function to group all the functions and loops neccesary to run IPC Rotor 8 script.
+
+    Parameters
+    ----------
+    Args:
+        - data_dict (dict, optional): already ingested {flight_phase: pd.DataFrame} (e.g. a
+          backfill window, see Backfill_Mode), the SQL queries are run if None
+        - fit_cache_path (str, optional): SQLite file of the persistent LOOP 6 fit cache,
+          working_data/fit_cache.db if None
+
+    Returns
+    -------
+        - set: (flight_phase, stage name) of the loops that failed (logged and skipped by
+          run_dag), empty if every loop succeeded. The outputs of the failed phases are not saved
     """
     
     Live_Data_Mode_time_start = print_time_now()
@@ -40,151 +66,85 @@ def Live_Data_Mode():
     lim_dict, Xrates = Initialise_Algorithm_Settings_engine_type_specific()
     Xrates = Xrates_dic_vector_norm(Xrates)
 
+    # Loop snapshots (debug dumps) are written by a background thread, off the hot path.
+    # stage_every={"LOOP_6": 0} skips a stage, {"LOOP_4": 5} keeps one snapshot in 5
+    start_snapshot_sink(fmt="parquet", max_queue=4, stage_every={})
+
     # Data SQL queries and historical data ingestion (if available)
-    data_dict = data_ingestion(root_dir)
+    # With use_tail_state, only the bounded per-ESN history of the ESNs with new data is processed
+    use_tail_state = False
+    # The phase queries run concurrently on one pooled connection engine
+    max_parallel_queries = 3
+    # Rows fetched at a time, each chunk cleaned on arrival (bounded memory for backfills), None: whole query
+    query_chunksize = None
+    # Limits filter and Celsius conversion done by the server, optionally the Loop 0 deltas too
+    query_pushdown = False
+    query_pushdown_deltas = False
+    # Each phase query only fetches the rows above its own watermark (optionally one per operator),
+    # the watermarks are committed once the outputs are saved (except for the phases with a failed loop)
+    ledger = None
+    if data_dict is None:
+        ledger = WatermarkLedger(os.path.join(root_dir, "working_data", "watermarks.json"), per_operator=False)
+        data_dict = data_ingestion(root_dir, use_tail_state=use_tail_state,
+                                   max_parallel_queries=max_parallel_queries,
+                                   chunksize=query_chunksize, pushdown=query_pushdown,
+                                   pushdown_deltas=query_pushdown and query_pushdown_deltas,
+                                   ledger=ledger)
     log_message(" Data extraction completed!")
-
+    # Phases without new rows (all above their watermark) or whose query failed are not
+    # processed, their previous outputs are kept
+    data_dict = {flight_phase: df for flight_phase, df in data_dict.items() if df is not None and not df.empty}
+    if not data_dict:
+        log_message(" No new data to process")
+        stop_snapshot_sink()
+        if ledger is not None:
+            ledger.commit()
+        return set()
+    # ... but they still take part in the Loop 9 join, with their stored output
+    stored_dict = {}
+    for flight_phase in ['cruise', 'climb', 'take-off']:
+        path_output_data = data_path(Fleetstore_data_dir, f"data_output_{flight_phase}", "parquet")
+        if flight_phase not in data_dict and os.path.exists(path_output_data):
+            stored_dict[flight_phase] = read_frame(path_output_data)
+    if stored_dict:
+        log_message(f" No new data for {list(stored_dict)}, stored outputs used by Loop 9")
+
+    # LOOP 6 fits kept between runs: rows already fitted (history, overlapping windows) are not solved again
+    if fit_cache_path is None:
+        fit_cache_path = os.path.join(root_dir, "working_data", "fit_cache.db")
+    os.makedirs(os.path.dirname(fit_cache_path), exist_ok=True)
+
+    stage_errors = set()
     run_loops = True
     if run_loops == True:
-        # LOOP 0 - DELTA CALCULATION
         log_message(" Start data processing")
-        process_func = Loop0
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(data_dict, Fleetstore_data_dir, Loop0))
-
-            log_message(
-                f"Completed {process_func.display_name}  at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-        # LOOP 2 - E2E calculation
-        process_func = Loop2
-        log_message(f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(data_dict, Fleetstore_data_dir, Loop2))
-
-            log_message(
-                f"    Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-        # LOOP 3 - Shop Visit SV and Engine change checks
-        process_func = Loop3
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(data_dict, Fleetstore_data_dir, Loop3))
-            log_message(
-            f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-        # LOOP 4 - Moving average 21 pts
-        process_func = Loop4
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(data_dict, Fleetstore_data_dir, Loop4))
-            log_message(
-            f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-
-
-        # LOOP 5 - changes in E2E deltas over lagged windows
-        process_func = Loop5
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(data_dict, Fleetstore_data_dir, Loop5))
-            log_message(
-            f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-        # LOOP 6 - signatures fit
-        process_func = Loop6
-        # Set how to process Loop 6
-        process_async = True
-        
-        if process_async == True:
-            try:
-                # LOOP 6 - signatures fit
-                log_message(
-                    f"Start LOOP 6 - signatures fit at {str(print_time_now())}")
-                data_dict = asyncio.run(async_main(
-                                                    data_dict = data_dict, 
-                                                    Fleetstore_data_dir=Fleetstore_data_dir, 
-                                                    process_function = process_func,
-                                                    Xrates = Xrates))
-                log_message(
-                    f"Completed LOOP 6 - signatures fit at {str(print_time_now())}")
-            except Exception as e:
-                log_message(f"Could not run LOOP 6 - signatures fit: {e}")
-        
-        else:
-            try:
-                # LOOP 6 - signatures fit
-                flight_phases = data_dict.keys()
-                print(flight_phases)
-                for flight_phase in flight_phases:
-                    log_message(
-                    f"Start {process_func.__name__} flight phase: {flight_phase} at {str(print_time_now())}")
-                    try:
-                        data_dict = process_func(  data_dict[flight_phase],
-                                                            flight_phase,
-                                                            Xrates)
-                        log_message(
-                        f"Completed {process_func.__name__} flight phase: {flight_phase} at {str(print_time_now())}")
-                    except Exception as e:
-                        log_message(f"Could not run {process_func.__name__} flight phase: {flight_phase} at {str(print_time_now())}: {e}")
-            except Exception as e:
-                log_message(f"Could not run {process_func.__name__} flight phase: {flight_phase} at {str(print_time_now())}: {e}")
-            
-            
-
-        # LOOP 7 - IPC HPC Performance Shift
-        process_func = Loop7
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(
-                    data_dict = data_dict, 
-                    Fleetstore_data_dir=Fleetstore_data_dir, 
-                    process_function = process_func))
-            log_message(
-                    f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}")
-
-         # LOOP 8 - Summary Stats
-        process_func = Loop8
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict = asyncio.run(async_main(
-                    data_dict = data_dict, 
-                    Fleetstore_data_dir=Fleetstore_data_dir, 
-                    process_function = process_func,
-                    Lim_dict = lim_dict))
-            log_message(
-                    f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}") 
-
-         # LOOP 9 - Combine DSC
-        process_func = Loop9
-        log_message(
-            f"Start {process_func.__name__} at {str(print_time_now())}")
-        try:
-            data_dict, df_combined = process_func(data_dict=data_dict, Lim_dict=lim_dict)
-            log_message(
-                    f"Completed {process_func.display_name} at {str(print_time_now())}")
-        except Exception as e:
-            log_message(f"Could not execute {process_func.display_name}: {e}") 
+        # Loops 0-8 run as an independent pipeline per flight phase, in a single event loop:
+        # a phase starts its next loop without waiting for the other phases.
+        # Loop 9 joins the phases. pipeline_concurrency limits the loops running at once
+        pipeline_concurrency = len(data_dict)
+        # "process" runs the loops in a shared worker process pool (frames exchanged through
+        # shared memory), so the phases are not serialised by the GIL. "thread" or "inline" otherwise
+        pipeline_executor = "thread"
+        # Worker processes the ESNs of a phase are split across in the per-ESN loops (-1: all the cores)
+        esn_n_jobs = 1
+        stages = [
+            ("LOOP 0 - Delta calculation", Loop0,
+             {"reuse_query_deltas": query_pushdown and query_pushdown_deltas}),
+            ("LOOP 2 - E2E calculation", Loop2, {}),
+            ("LOOP 3 - SV and engine change", Loop3, {}),
+            ("LOOP 4 - Moving average", Loop4, {"n_jobs": esn_n_jobs}),
+            ("LOOP 5 - Performance trend", Loop5, {}),
+            ("LOOP 6 - Signatures fit", Loop6, {"Xrates": Xrates, "fit_cache_path": fit_cache_path}),
+            ("LOOP 7 - IPC HPC PerfShift", Loop7, {}),
+            ("LOOP 8 - Stats Summary", Loop8, {"Lim_dict": lim_dict}),
+        ]
+        join = ("LOOP 9 - Combine DSC", _combine_with_stored, {"stored_dict": stored_dict, "Lim_dict": lim_dict})
+        data_dict, loop_9_output, stage_timings = run_dag(
+            data_dict, stages, join=join, max_concurrency=pipeline_concurrency,
+            executor=pipeline_executor, errors=stage_errors)
+        shutdown_process_pool()
+        if loop_9_output is not None:
+            data_dict, df_combined = loop_9_output
     
     ##########################################################################
 
@@ -202,10 +162,40 @@ def Live_Data_Mode():
     ##########################################################################
     # Data output save
     ##########################################################################
+    # Wait for the queued loop snapshots before writing the outputs
+    stop_snapshot_sink()
+
+    # A phase with a failed loop keeps its previous output and its watermark: its rows are
+    # fetched and processed again by the next run (saving them now would duplicate them).
+    # Loop 9 failing fails every phase
+    failed_phases = {flight_phase for flight_phase, _ in stage_errors}
+    if "all" in failed_phases:
+        failed_phases = set(data_dict)
+
+    # Parquet keeps the dtypes for the next run, CSV is an optional export
+    export_csv = False
     for flight_phase in data_dict.keys():
-        path_output_data = os.path.join(Fleetstore_data_dir, f"data_output_{flight_phase}.csv")
-        data_dict[flight_phase].to_csv(path_output_data, index=False)
+        if flight_phase in failed_phases:
+            log_message(f"{flight_phase.capitalize()} data not saved, failed stages")
+            continue
+        if use_tail_state:
+            # The run only holds the ESNs with new data: they are merged back into the
+            # stored history instead of overwriting it
+            tail_state = TailStateStore(Fleetstore_data_dir, flight_phase)
+            tail_state.update(data_dict[flight_phase])
+            data_dict[flight_phase] = tail_state.merge_history(data_dict[flight_phase])
+        path_output_data = data_path(Fleetstore_data_dir, f"data_output_{flight_phase}", "parquet")
+        write_frame(data_dict[flight_phase], path_output_data)
+        if export_csv:
+            write_frame(data_dict[flight_phase], data_path(Fleetstore_data_dir, f"data_output_{flight_phase}", "csv"))
         log_message(f"{flight_phase.capitalize()} data saved to: {path_output_data}")
+    if ledger is not None:
+        for flight_phase in failed_phases:
+            ledger.discard(flight_phase)
+        ledger.commit()
+    if stage_errors:
+        log_message(f"{Live_Data_Mode.__name__} completed with failed stages: {sorted(stage_errors)}")
+    return stage_errors
 
 if __name__ == "__main__":
     Live_Data_Mode()
\ No newline at end of file
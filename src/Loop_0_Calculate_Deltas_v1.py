@@ -1,17 +1,26 @@
 import os
+import numpy as np
 import pandas as pd
 from src.utils.log_file import log_message
+from src.utils.snapshot_writer import save_snapshot
+from src.utils.parameter_table import compute_deltas, delta_table
 
 def Loop_0_delta_calc(
     df: pd.DataFrame,
     flight_phase: str = None,
     n: int = 5,
-    DebugOption: int = 1
+    DebugOption: int = 1,
+    float32: bool = False,
+    reuse_query_deltas: bool = False
 ) -> pd.DataFrame:
     """
     Function computes the percentage deltas of actual engine parameters from their nominal
     (baseline) values.
 
+    The parameter -> nominal pairs come from the mapping table in src.utils.parameter_table
+    and the deltas of the new rows (NEW_FLAG == 1) are computed in a single NumPy pass,
+    old rows are left untouched.
+
     Parameters
     ----------
      - df : pd.DataFrame, Input DataFrame containing the following columns:
@@ -22,6 +31,9 @@ def Loop_0_delta_calc(
      - flight_phase: str, string indicating flight phase
      - n: int, (default = 5) decimal digit to round
      - DebugOption : int, optional (default = 1), switch to create a copy of the output data in csv format.
+     - float32 : bool, optional (default = False), switch to compute the deltas in float32.
+     - reuse_query_deltas : bool, optional (default = False), keep the deltas already returned by
+            the query (see query_builder.render_query), only the new rows without them are computed.
 
     Returns
     -------
@@ -30,49 +42,30 @@ def Loop_0_delta_calc(
     """
     # Define function's dysplay name
     Loop_0_delta_calc.display_name = "LOOP 0 - DELTA CALCULATION"
-    
-    #create df copy to avoid warnings
-    df_out = df.copy()
-    
-    # Split the dataframe between old and new data
-    df_new = df_out[df_out['NEW_FLAG']==1].copy()
-    df_old = df_out[df_out['NEW_FLAG']==0]
-
-    # Compute deltas
-    df_new['PS26__DEL_PC'] = round(
-        (df_new['P25__PSI'] - df_new['PS26S__NOM_PSI']) * 100 / df_new['PS26S__NOM_PSI'], n)
-    df_new['T25__DEL_PC'] = round(
-        (df_new['T25__DEGC'] - df_new['TS25S__NOM_K']) * 100 / df_new['TS25S__NOM_K'], n)
-    df_new['P30__DEL_PC'] = round(
-        (df_new['P30__PSI'] - df_new['PS30S__NOM_PSI']) * 100 / df_new['PS30S__NOM_PSI'], n)
-    df_new['T30__DEL_PC'] = round(
-        (df_new['T30__DEGC'] - df_new['TS30S__NOM_K']) * 100 / df_new['TS30S__NOM_K'], n)
-    df_new['TGTU__DEL_PC'] = round(
-        (df_new['TGTU_A__DEGC'] - df_new['TGTS__NOM_K']) * 100 / df_new['TGTS__NOM_K'], n)
-    df_new['NL__DEL_PC'] = round(
-        (df_new['NL__PC'] - df_new['NL__NOM_PC']) * 100 / df_new['NL__NOM_PC'], n)
-    df_new['NI__DEL_PC'] = round(
-        (df_new['NI__PC'] - df_new['NI__NOM_PC']) * 100 / df_new['NI__NOM_PC'], n)
-    df_new['NH__DEL_PC'] = round(
-        (df_new['NH__PC'] - df_new['NH__NOM_PC']) * 100 / df_new['NH__NOM_PC'], n)
-    df_new['FF__DEL_PC'] = round(
-        (df_new['FF__LBHR'] - df_new['FF__NOM_LBHR']) * 100 / df_new['FF__NOM_LBHR'], n)
-    df_new['P160__DEL_PC'] = round(
-        (df_new['PS160__PSI'] - df_new['P135S__NOM_PSI']) *100 /df_new['P135S__NOM_PSI'], n)
-    
-    # Concatenate back old and new data
-    df_conc = pd.concat([df_old, df_new], ignore_index=True)
-    # Remove duplicates
-    df_conc = df_conc.sort_values(
-        by='reportdatetime',
-        ascending=True).drop_duplicates(keep='last')
+
+    # Sort old to new data, this is the only copy made of the input frame
+    order = np.argsort(df['reportdatetime'].to_numpy(), kind='stable')
+    df_conc = df.take(order)
+
+    # Compute deltas on the (new rows x parameters) block only
+    new_mask = (df_conc['NEW_FLAG'] == 1).to_numpy()
+    delta_cols = delta_table()['delta'].tolist()
+    if reuse_query_deltas and all(col in df_conc.columns for col in delta_cols):
+        new_mask &= df_conc[delta_cols].isna().any(axis=1).to_numpy()
+    deltas = compute_deltas(df_conc, mask=new_mask, n=n, float32=float32)
+
+    # Write the deltas back, old rows keep their values (NaN if the column is new)
+    for col in delta_cols:
+        if col not in df_conc.columns:
+            df_conc[col] = np.full(len(df_conc), np.nan, dtype=deltas.dtype)
+    df_conc.loc[new_mask, delta_cols] = deltas
 
     # Saves function output to CSV file
     if DebugOption == 1:
         dtypes_txt = False
         if dtypes_txt == True:
             with open(f'Loop_0_{flight_phase}_input_df_dtypes.txt', 'w') as f:
-                f.write(str(df_out.dtypes.to_string()))
+                f.write(str(df.dtypes.to_string()))
             with open(f'Loop_0_{flight_phase}_output_df_dtypes.txt', 'w') as f:
                 f.write(str(df_conc.dtypes.to_string()))
         # Get current dir and Fleetstore_Data dir
@@ -82,8 +75,7 @@ def Loop_0_delta_calc(
             os.makedirs(FleetStore_dir)
         # Save a temporary CSV file for debugging or traceability
         path_temp = os.path.join(FleetStore_dir, f"LOOP_0_{flight_phase}.csv")
-        log_message(f"        File saved to: {path_temp}")
-        df_conc.to_csv(path_temp)
+        save_snapshot(df_conc, path_temp, stage="LOOP_0", index=True)
 
     return df_conc
 
@@ -1,9 +1,70 @@
 from src.utils.load_data import load_temp_data as ltd
 import pandas as pd
+import numpy as np
 import os
 from src.utils.enforce_dtypes import enforce_dtypes
 from src.utils.log_file import log_message
-from tqdm import tqdm
+from src.utils.snapshot_writer import save_snapshot
+
+
+def e2e_pairing(
+        df_new: pd.DataFrame,
+        input_columns: list,
+        keys: list = ['ACID', 'reportdatetime']) -> pd.DataFrame:
+    """
+    Columnar pairing engine for the engine-to-engine (E2E) deltas.
+
+    Keeps only the (ACID, reportdatetime) groups with exactly two unique ESNs, sorts them
+    by group and ESN, maps every row to its sister row through positional indices and
+    computes all the '_E2E' differences as one array subtraction. Within a group the
+    first engine is paired with the second one and every other row with the first one.
+
+    Parameters
+    ----------
+    Args:
+        - df_new (pd.DataFrame): new rows with 'ACID', 'reportdatetime', 'ESN' and the input columns
+        - input_columns (list): parameter columns to compute the E2E deltas for,
+          missing columns give NaN deltas
+        - keys (list): columns identifying a single aircraft report
+
+    Returns
+    -------
+        - df_out (pd.DataFrame): rows of the valid groups, ordered by keys and ESN, with
+          'SISTER_ESN' and '[PARAM]_E2E' columns
+    """
+    # Rows with missing keys are not grouped
+    df_valid = df_new.dropna(subset=keys)
+
+    # Group size count: keep only pairs with exactly 2 unique ESNs
+    n_esn = df_valid.groupby(keys)['ESN'].transform('nunique')
+    df_out = df_valid[(n_esn == 2).to_numpy()]
+
+    # Sort by group, then by ESN so that engine order is consistent
+    df_out = df_out.sort_values(by=keys + ['ESN'], kind='stable').reset_index(drop=True)
+
+    # Sorted-pair index: position of each row's sister within df_out
+    group_id = df_out.groupby(keys, sort=False).ngroup().to_numpy()
+    position = np.arange(len(df_out))
+    is_first = np.ones(len(df_out), dtype=bool)
+    is_first[1:] = group_id[1:] != group_id[:-1]
+    first_pos = np.maximum.accumulate(np.where(is_first, position, 0))
+    sister_pos = np.where(is_first, position + 1, first_pos)
+
+    # Add the ESN of the sister engine
+    df_out['SISTER_ESN'] = df_out['ESN'].to_numpy()[sister_pos]
+
+    # All E2E deltas in a single array subtraction
+    values = np.full((len(df_out), len(input_columns)), np.nan)
+    for j, param in enumerate(input_columns):
+        if param in df_out.columns:
+            values[:, j] = pd.to_numeric(df_out[param], errors='coerce').to_numpy(
+                dtype=float, na_value=np.nan)
+    deltas = np.round(values - values[sister_pos], 5)
+    for j, param in enumerate(input_columns):
+        df_out[param + '_E2E'] = deltas[:, j]
+
+    return df_out
+
 
 def Loop_2_E2E(
         df: pd.DataFrame,
@@ -50,54 +111,10 @@ def Loop_2_E2E(
         'FF__DEL_PC', 'P160__DEL_PC'
     ]
 
-    grouped = df_new.groupby(['ACID', 'reportdatetime'])
-
-    # Filter: keep only ACID+reportdatetime pairs with exactly 2 unique ESNs
-    valid_groups = grouped.filter(lambda x: x['ESN'].nunique() == 2)
-
-    # Group by ACID and reportdatetime
-    valid_groups_by_pair = valid_groups.groupby(['ACID', 'reportdatetime'])
-
-    # Initialize a list to store each processed row's results
-    result_rows = []
-
-    # Iterate over each valid group of (ACID, reportdatetime)
-    for (acid, rdt), group in tqdm(valid_groups_by_pair,
-                                   desc=f"        LOOP 2 {flight_phase} progress", unit="group"):
-
-        # Sort the group by ESN so that engine order is consistent
-        group_sorted = group.sort_values('ESN').reset_index(drop=True)
-
-        # Assign engine 1 and engine 2
-        eng1 = group_sorted.iloc[0]
-        eng2 = group_sorted.iloc[1]
-
-        # For each engine in the pair
-        for i, row in group_sorted.iterrows():
-            # Assign the "sister" engine: if this is eng1, sister is eng2 and
-            # vice versa
-            sister = eng2 if i == 0 else eng1
-
-            # Convert the row to a dictionary for output
-            data = row.to_dict()
-
-            # Add the ESN of the sister engine
-            data['SISTER_ESN'] = int(sister['ESN'])
-
-            # Calculate E2E deltas for each input parameter
-            for param in input_columns:
-                try:
-                    delta = float(row[param]) - float(sister[param])
-                except (ValueError, KeyError):
-                    # Assign NaN if conversion or lookup fails
-                    delta = float('nan')
-                data[param + '_E2E'] = round(delta, 5)
-
-            # Add the enriched row to the result list
-            result_rows.append(data)
-
-    # Create a DataFrame from all result rows
-    df_out = pd.DataFrame(result_rows)
+    df_out = e2e_pairing(df_new, input_columns)
+    if df_out.empty:
+        # No valid pairs: nothing to add to the old data
+        df_out = pd.DataFrame([])
     df_out = enforce_dtypes(df_out, dtypes_list)
 
     # Concatenate back old and new data(df_out)
@@ -124,8 +141,7 @@ def Loop_2_E2E(
             os.makedirs(FleetStore_dir)
         # Save a temporary CSV file for debugging or traceability
         path_temp = os.path.join(FleetStore_dir, f"LOOP_2_{flight_phase}.csv")
-        log_message(f"        File saved to: {path_temp}")
-        df_conc.to_csv(path_temp)
+        save_snapshot(df_conc, path_temp, stage="LOOP_2", index=True)
     return df_conc
 
 
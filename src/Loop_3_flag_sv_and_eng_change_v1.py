@@ -1,8 +1,8 @@
 import os
 import pandas as pd
-from tqdm import tqdm
 from src.utils.enforce_dtypes import enforce_dtypes
 from src.utils.log_file import log_message
+from src.utils.snapshot_writer import save_snapshot
 from src.utils.load_data import load_temp_data as ltd
 
 def Loop_3_flag_sv_and_eng_change(
@@ -60,38 +60,19 @@ def Loop_3_flag_sv_and_eng_change(
     dtypes_list = df_old.dtypes
 
 
-    df_new['FlagSV'] = 0  # Set up new column for SV shop visit
-    df_new['FlagSisChg'] = 0  # Set up new column for engine change
-    # Identify ESNs with new data
-    esns_with_new = df_new.loc[df_new['NEW_FLAG'] == 1, 'ESN'].unique()
-
-    for esn in tqdm(
-            esns_with_new,
-            desc=f"        LOOP 3 {flight_phase} progress",
-            unit="ESN"):
-
-        df_esn = df_new[df_new['ESN'] == esn].copy()
-        indices = df_esn.index.tolist()
-
-        for idx_pos, i in enumerate(indices):
-
-            if idx_pos == 0:
-                # First row for this ESN
-                df_new.at[i, 'FlagSV'] = 1
-                df_new.at[i, 'FlagSisChg'] = 0
-            else:
-                prev_idx = indices[idx_pos - 1]
-                # Check if time gap is too large
-                if df_new.at[i, 'days_since_prev'] > min_sv_dur:
-                    df_new.at[i, 'FlagSV'] = 1
-                else:
-                    df_new.at[i, 'FlagSV'] = 0
-                # Check for sister ESN change
-                if df_new.at[i, 'SISTER_ESN'] == df_new.at[prev_idx, 'SISTER_ESN']:
-                    df_new.at[i, 'FlagSisChg'] = 0
-                else:
-                    df_new.at[i, 'FlagSisChg'] = 1
-    
+    # Rows are in time order, so the first occurrence of an ESN is its first new report
+    has_esn = df_new['ESN'].notna()
+    first_row = has_esn & ~df_new['ESN'].duplicated()
+
+    # Previous SISTER_ESN of the same ESN (NaN for the first row)
+    prev_sister = df_new.groupby('ESN', sort=False)['SISTER_ESN'].shift()
+    sister_changed = (df_new['SISTER_ESN'] != prev_sister).fillna(True)
+
+    # Shop visit: first row for this ESN or time gap too large
+    df_new['FlagSV'] = (first_row | (has_esn & (df_new['days_since_prev'] > min_sv_dur))).astype(int)
+    # Sister ESN change with respect to the previous row of the same ESN
+    df_new['FlagSisChg'] = (has_esn & ~first_row & sister_changed).astype(int)
+
     df_new = enforce_dtypes(df_new, dtypes_list)
     
     # Concatenate back old and new data
@@ -111,8 +92,7 @@ def Loop_3_flag_sv_and_eng_change(
             os.makedirs(FleetStore_dir)
         # Save a temporary CSV file for debugging or traceability
         path_temp = os.path.join(FleetStore_dir, f"LOOP_3_{flight_phase}.csv")
-        log_message(f"        File saved to: {path_temp}")
-        df_conc.to_csv(path_temp)
+        save_snapshot(df_conc, path_temp, stage="LOOP_3", index=True)
     return df_conc
 
 
@@ -3,6 +3,8 @@ import numpy as np
 import os
 from tqdm import tqdm
 from src.utils.log_file import log_message, debug_info, f_lineno
+from src.utils.snapshot_writer import save_snapshot
+from src.utils.esn_sharding import map_esn_shards
 from src.utils.load_data import load_temp_data as ltd
 
 def min_adjusted_value(index_list: list[int], other_integer: int, window_length: int = 21) -> int:
@@ -50,11 +52,67 @@ def min_adjusted_value(index_list: list[int], other_integer: int, window_length:
 
 
 
+def _movavg_esns(
+        df: pd.DataFrame,
+        flight_phase: str,
+        E2E_cols: list,
+        E2E_MAV_cols: list,
+        win_size: int) -> pd.DataFrame:
+    """
+    Per-ESN kernel of Loop 4: robust moving average of the new rows of each ESN of df
+    with NEW_FLAG == 1 (df holds all the rows of these ESNs, sorted old to new).
+
+    Returns
+    -------
+     - `pd.DataFrame`: new rows with the moving averages, ESN by ESN
+    """
+    # Filter ESNs with NEW_FLAG == 1
+    esns = df.loc[df['NEW_FLAG'] == 1, 'ESN'].unique()
+    esn_temp_container = []
+
+    for esn in tqdm(esns, desc=f" LOOP 4 {flight_phase} progress", unit="ESN"):
+
+        # Filter rows for current ESN
+        esn_mask = df['ESN'] == esn
+        df_esn = df[esn_mask].sort_values(by='reportdatetime', ascending=True).reset_index(drop=True).copy()
+        df_esn_new = df_esn[df_esn['NEW_FLAG']==1].copy()
+        df_esn_new_idx_list = df_esn_new.index.to_list()
+        df_esn_old = df_esn[df_esn['NEW_FLAG']==0].copy()
+        df_esn_old_idx_list = df_esn_old.index.to_list()
+
+        min_idx_df_new = min(df_esn_new_idx_list)
+        idx_start = min_adjusted_value(
+            index_list = df_esn_old_idx_list, 
+            other_integer = min_idx_df_new, 
+            window_length = win_size)
+        df_temp = df_esn.iloc[idx_start:].copy()
+        # print("df_temp:\n",df_temp[["reportdatetime","FlagSV", "FlagSisChg", "PS26__DEL_PC_E2E", "PS26__DEL_PC_E2E_MAV_NO_STEPS"]])
+        # Rolling mean (average) over the last `win_size` flights
+        mask = (df_temp['FlagSV'] == 0) & (df_temp['FlagSisChg'] == 0)
+        df_temp[E2E_MAV_cols] = (
+            df_temp[E2E_cols]
+            .where(mask)                     # mask first
+            .rolling(win_size, min_periods=win_size)
+            .mean()
+            .round(5)
+        )
+        
+        ### df_temp = df_temp[df_temp['NEW_FLAG']==1].sort_values(
+        ### by='reportdatetime', ascending=False).drop_duplicates(keep='last').copy()
+        df_temp = df_temp[df_temp['NEW_FLAG']==1]
+        esn_temp_container.append(df_temp)
+
+    if not esn_temp_container:
+        return df.iloc[:0]
+    return pd.concat(esn_temp_container, ignore_index=True)
+
+
 def Loop_4_movavg(
         df: pd.DataFrame,
         flight_phase: str = None,
         WindowSemiWidth: int = 10,
-        DebugOption: int = 1) -> pd.DataFrame:
+        DebugOption: int = 1,
+        n_jobs: int = 1) -> pd.DataFrame:
     """
     Applies a robust moving average (using trimmed mean) to selected columns of a DataFrame,
     grouped by ESN where NEW_FLAG == 1, and handles discontinuities and missing data.
@@ -67,6 +125,8 @@ def Loop_4_movavg(
      - `WindowSemiWidth` : int, optional
         Semi-width of the moving window (default is 10). The full window size is 2 * WindowSemiWidth + 1.
      - `DebugOption` : int, optional (default = 1), switch to create a copy of the output data in csv format.
+     - `n_jobs` : int, optional (default = 1), number of worker processes the ESNs are split across
+        (-1 for all the cores, see map_esn_shards).
 
     Returns
     -------
@@ -112,46 +172,16 @@ def Loop_4_movavg(
     df_old = df[df['NEW_FLAG'] == 0].copy()
     df_new = df[df['NEW_FLAG'] == 1].copy()
 
-    # Filter ESNs with NEW_FLAG == 1
-    esns = df_new['ESN'].unique()
-    # .reset_index(drop=True)
-    esn_temp_container = []
-
-    for esn in tqdm(esns, desc=f" LOOP 4 {flight_phase} progress", unit="ESN"):
-
-        # Filter rows for current ESN
-        esn_mask = df['ESN'] == esn
-        df_esn = df[esn_mask].sort_values(by='reportdatetime', ascending=True).reset_index(drop=True).copy()
-        df_esn_new = df_esn[df_esn['NEW_FLAG']==1].copy()
-        df_esn_new_idx_list = df_esn_new.index.to_list()
-        df_esn_old = df_esn[df_esn['NEW_FLAG']==0].copy()
-        df_esn_old_idx_list = df_esn_old.index.to_list()
-
-        min_idx_df_new = min(df_esn_new_idx_list)
-        idx_start = min_adjusted_value(
-            index_list = df_esn_old_idx_list, 
-            other_integer = min_idx_df_new, 
-            window_length = win_size)
-        df_temp = df_esn.iloc[idx_start:].copy()
-        # print("df_temp:\n",df_temp[["reportdatetime","FlagSV", "FlagSisChg", "PS26__DEL_PC_E2E", "PS26__DEL_PC_E2E_MAV_NO_STEPS"]])
-        # Rolling mean (average) over the last `win_size` flights
-        mask = (df_temp['FlagSV'] == 0) & (df_temp['FlagSisChg'] == 0)
-        df_temp[E2E_MAV_cols] = (
-            df_temp[E2E_cols]
-            .where(mask)                     # mask first
-            .rolling(win_size, min_periods=win_size)
-            .mean()
-            .round(5)
-        )
-        
-        ### df_temp = df_temp[df_temp['NEW_FLAG']==1].sort_values(
-        ### by='reportdatetime', ascending=False).drop_duplicates(keep='last').copy()
-        df_temp = df_temp[df_temp['NEW_FLAG']==1]
-        esn_temp_container.append(df_temp)
-        #############
-    # print(debug_info())
-    df_out_for_loop = pd.concat(esn_temp_container, ignore_index=True)
-    # print(debug_info())
+    # Moving averages of the ESNs with new data, ESN shards run in parallel if n_jobs > 1
+    df_out_for_loop = map_esn_shards(
+        df,
+        _movavg_esns,
+        n_jobs=n_jobs,
+        esns=df_new['ESN'].unique(),
+        flight_phase=flight_phase,
+        E2E_cols=E2E_cols,
+        E2E_MAV_cols=E2E_MAV_cols,
+        win_size=win_size)
     if not df_old.empty:
         df_out = pd.concat([df_old, df_out_for_loop], ignore_index=True)
     else:
@@ -168,8 +198,7 @@ def Loop_4_movavg(
         current_dir = os.getcwd()
         fleetore_dir = os.path.join(current_dir, "Fleetstore_Data")
         path_temp = os.path.join(fleetore_dir, f"LOOP_4_{flight_phase}_mod_v1.csv")
-        log_message(f" File saved to: {path_temp}")
-        df_out.to_csv(path_temp)
+        save_snapshot(df_out, path_temp, stage="LOOP_4", index=True)
 
     return df_out
 
@@ -2,7 +2,7 @@ import os
 import pandas as pd
 import numpy as np
 from src.utils.log_file import log_message
-from tqdm import tqdm  # For showing a progress bar in loops
+from src.utils.snapshot_writer import save_snapshot
 
 # Custom data loading function (not used in this function but likely
 # available for debug or future use)
@@ -58,53 +58,56 @@ def Loop5_performance_trend(
     # Get the list of ESNs (engine serial numbers) that have NEW_FLAG = 1
     # These are the engines for which the lag delta calculation should be
     # applied
-    esns_with_new_data = df_out[df_out["NEW_FLAG"] == 1]["ESN"].unique()
-
-    # Loop through each ESN with new data, showing progress using tqdm
-    for esn in tqdm(
-            esns_with_new_data,
-            desc=f" LOOP 5 {flight_phase} progress",
-            unit="ESN"):
-
-        # Filter the DataFrame to only include rows for this ESN
-        df_esn = df_out[df_out["ESN"] == esn]
-
-        # Get the index positions of the rows for this ESN
-        idx_esn = df_esn.index
-
-        # Loop through each lag window (e.g., 50, 100, 200, 400 points)
-        for lag in Lag:
-
-            # Loop through each point in the ESN's data
-            for i in range(len(idx_esn)):
-                idx_now = idx_esn[i]  # Index of the current row
-
-                # Skip if there isn't enough history to calculate the lag
-                if i - lag < 0:
-                    continue
-
-                # Index of the row 'lag' steps before
-                idx_prev = idx_esn[i - lag]
-
-                # For each of the E2E MAV columns, calculate the difference
-                # over the lag
-                for col in e2e_mav21_cols:
-                    # Define the name for the new lagged column
-                    col_lag = f"{col}_LAG_{lag}"
-
-                    # If the lagged column doesn't already exist, initialize it
-                    # with NaN values
-                    if col_lag not in df_out.columns:
-                        df_out[col_lag] = np.nan
-
-                    # Get the current and previous values for the column
-                    val_now = df_out.at[idx_now, col]
-                    val_prev = df_out.at[idx_prev, col]
-
-                    # If both values are valid (not NaN), compute the
-                    # difference and store it
-                    if not pd.isna(val_now) and not pd.isna(val_prev):
-                        df_out.at[idx_now, col_lag] = round(val_now - val_prev,5)
+    esns_with_new_data = df_out.loc[df_out["NEW_FLAG"] == 1, "ESN"].dropna().unique()
+
+    # Row positions of those ESNs, grouped by ESN and in time order within each group
+    rows_esn = np.flatnonzero(df_out["ESN"].isin(esns_with_new_data).to_numpy())
+    codes = pd.factorize(df_out["ESN"].to_numpy()[rows_esn])[0]
+    order = np.argsort(codes, kind="stable")
+    rows_esn, codes = rows_esn[order], codes[order]
+
+    # Position of each row within its ESN history
+    position = np.arange(len(rows_esn))
+    is_first = np.ones(len(rows_esn), dtype=bool)
+    is_first[1:] = codes[1:] != codes[:-1]
+    rank = position - np.maximum.accumulate(np.where(is_first, position, 0))
+
+    # (rows x columns) block of the E2E MAV values, missing columns as NaN
+    values = np.full((len(rows_esn), len(e2e_mav21_cols)), np.nan)
+    for j, col in enumerate(e2e_mav21_cols):
+        if col in df_out.columns:
+            values[:, j] = df_out[col].to_numpy(dtype=float, na_value=np.nan)[rows_esn]
+
+    lag_columns = {}
+    for lag in Lag:
+        # Rows with at least 'lag' points of history for the same ESN
+        has_history = rank >= lag
+        # Skip the lag if no ESN has enough history to calculate it
+        if not has_history.any():
+            continue
+
+        # Values 'lag' steps before (same ESN), NaN where there isn't enough history
+        values_prev = np.full_like(values, np.nan)
+        values_prev[lag:] = values[:-lag] if lag > 0 else values
+        values_prev[~has_history] = np.nan
+
+        # Difference over the lag, only where both values are valid (not NaN)
+        valid = ~np.isnan(values) & ~np.isnan(values_prev)
+        deltas = np.round(values - values_prev, 5)
+
+        for j, col in enumerate(e2e_mav21_cols):
+            # Name for the new lagged column
+            col_lag = f"{col}_LAG_{lag}"
+            # Existing values are kept where the difference can't be computed
+            if col_lag in df_out.columns:
+                lag_values = df_out[col_lag].to_numpy(dtype=float, na_value=np.nan, copy=True)
+            else:
+                lag_values = np.full(len(df_out), np.nan)
+            lag_values[rows_esn] = np.where(valid[:, j], deltas[:, j], lag_values[rows_esn])
+            lag_columns[col_lag] = lag_values
+
+    if lag_columns:
+        df_out = df_out.assign(**lag_columns)
 
     # Remove duplicates
     df_out = df_out.sort_values(
@@ -123,11 +126,8 @@ def Loop5_performance_trend(
         # Construct the full file path, including flight phase name
         path_temp = os.path.join(fleetore_dir, f"LOOP_5_{flight_phase}.csv")
 
-        # Print the file path to the console
-        log_message(f" File saved to: {path_temp}")
-
-        # Write the modified DataFrame to CSV
-        df_out.to_csv(path_temp)
+        # Write the modified DataFrame snapshot
+        save_snapshot(df_out, path_temp, stage="LOOP_5", index=True)
 
     # Return the DataFrame with new lagged delta columns
     return df_out
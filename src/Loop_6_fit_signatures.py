@@ -2,8 +2,12 @@ import asyncio
 import os
 from datetime import datetime as dt
 from src.utils.log_file import log_message
+from src.utils.snapshot_writer import save_snapshot
 from src.utils.print_time_now import print_time_now
 from src.utils.enforce_string_dtype import enforce_string_dtype
+from src.utils.signature_solver import (
+    stack_signature_combos, signature_bounds, solve_signature_fits)
+from src.utils.fit_cache import FitCache, fit_fingerprint
 """
 Loop 6: Fit Signatures to Flight Phase Data with Optional Parallelism
 ======================================================================
@@ -13,7 +17,11 @@ with optional multi-core parallel execution, designed to process flight data
 for different phases and compute fits to precomputed signature matrices.
 
 Features:
-- Optional parallel execution using ProcessPoolExecutor
+- Batched least-squares solver (src/utils/signature_solver.py)
+- Optional persistent cache of the fits (src/utils/fit_cache.py)
+- Optional pruned combination search, exact or top-k approximate
+- Optional parallel execution using ProcessPoolExecutor, with the observation
+  matrices in shared memory and contiguous row blocks per task
 - Safe handling of dtypes to prevent pandas FutureWarnings
 - Google-style docstrings and line-by-line comments
 - Optional max_workers parameter to control parallelism
@@ -25,24 +33,35 @@ import pandas as pd
 from tqdm import tqdm
 import itertools
 from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 
 # --- Global variables for worker processes ---
 _signature_combos = None
 _obs_mag_cols = None
 _lag_list = None
 _df_new = None
+_signature_stacks = None
 
 def _init_worker(signature_combos, obs_mag_cols, lag_list, df_new):
     """Initializer to set global variables in each worker process."""
-    global _signature_combos, _obs_mag_cols, _lag_list, _df_new
+    global _signature_combos, _obs_mag_cols, _lag_list, _df_new, _signature_stacks
     _signature_combos = signature_combos
     _obs_mag_cols = obs_mag_cols
     _lag_list = lag_list
     _df_new = df_new
+    _signature_stacks = None  # Built on first use by _get_signature_stacks
+
+
+def _get_signature_stacks():
+    """Stacked pseudo-inverses of the worker's signature combinations, computed once."""
+    global _signature_stacks
+    if _signature_stacks is None:
+        _signature_stacks = stack_signature_combos(_signature_combos)
+    return _signature_stacks
 
 
 def process_row(idx):
-    """Worker function to process a single row index."""
+    """Fits a single row index (the process pool works on row blocks, see _fit_row_block)."""
     row = _df_new.loc[idx].copy() # Copy the row to avoid modifying the shared DataFrame
 
     for lag in _lag_list:
@@ -58,41 +77,147 @@ def process_row(idx):
             # Skip if any column is missing
             continue
 
+        # Best fit over all signature combinations
+        fits = solve_signature_fits(
+            obs_vec[None, :], _signature_combos, stacks=_get_signature_stacks())
+
         # Skip if NaNs are present
-        if np.isnan(obs_vec).any():
+        if np.isnan(fits['obs_mag'][0]):
             continue
+        row[f"OBS_MAGNITUDE{lag}"] = fits['obs_mag'][0]
 
-        obs_mag = np.linalg.norm(obs_vec) # Compute magnitude of observation vector
-        row[f"OBS_MAGNITUDE{lag}"] = obs_mag
-        if obs_mag == 0.0:
-            continue # Skip zero vectors
+        pos = fits['combo'][0]
+        if pos >= 0:
+            ids = _signature_combos[pos][2]
+            for i in range(3):
+                row[f"VAR{i + 1}_SHIFT{lag}"] = fits['coeffs'][0, i]
+                row[f"VAR{i + 1}_MAGNITUDE{lag}"] = fits['magnitudes'][0, i]
+                row[f"VAR{i + 1}_IDENTIFIER{lag}"] = str(ids[i]) if i < len(ids) else pd.NA
 
-        best_fit = None
-        best_err = np.inf
+            row[f"ERROR_REL{lag}"] = fits['error_rel'][0]
+            row[f"ERROR_MAGNITUDE{lag}"] = fits['error_mag'][0]
 
-        # Loop through all signature combinations
-        for F, norms, ids in _signature_combos:
-            coeffs, *_ = np.linalg.lstsq(F, obs_vec, rcond=None) # Solve linear least squares
-            fit_vec = F @ coeffs # Compute fitted vector
-            err = np.linalg.norm(obs_vec - fit_vec) / obs_mag # Relative error
-            magnitudes = np.abs(coeffs * norms) # Magnitudes for each coefficient
+    return idx, row
 
-            # Check if this combination meets thresholds
-            if err < 0.3 and np.sum(magnitudes) < 5 * obs_mag and err < best_err:
-                best_fit = (coeffs, err, magnitudes, ids, fit_vec)
-                best_err = err
 
-        if best_fit:
-            coeffs, err, magnitudes, ids, fit_vec = best_fit
-            for i in range(3):
-                row[f"VAR{i + 1}_SHIFT{lag}"] = coeffs[i] if i < len(coeffs) else np.nan
-                row[f"VAR{i + 1}_MAGNITUDE{lag}"] = magnitudes[i] if i < len(magnitudes) else np.nan
-                row[f"VAR{i + 1}_IDENTIFIER{lag}"] = str(ids[i]) if i < len(ids) else pd.NA
+def _observation_matrix(df_new, lag, obs_mag_cols):
+    """
+    (rows x parameters) observation matrix of a lag, None if any of its columns is missing.
+    """
+    shift_columns_lag = [col + str(lag) for col in obs_mag_cols]
+    if not all(col in df_new.columns for col in shift_columns_lag):
+        return None
+    return np.column_stack([
+        pd.to_numeric(df_new[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        for col in shift_columns_lag])
 
-            row[f"ERROR_REL{lag}"] = err
-            row[f"ERROR_MAGNITUDE{lag}"] = np.linalg.norm(obs_vec - fit_vec)
 
-    return idx, row
+def _write_fit_columns(df_new, lag, fits, signature_combos):
+    """
+    Writes the solver output of a lag into df_new, column-wise. Rows with NaNs, zero
+    vectors or no accepted fit keep their preallocated values.
+    """
+    has_obs = ~np.isnan(fits['obs_mag'])
+    df_new.loc[has_obs, f"OBS_MAGNITUDE{lag}"] = fits['obs_mag'][has_obs]
+
+    fitted = fits['combo'] >= 0
+    if not fitted.any():
+        return
+
+    # Numeric results in a single assignment
+    numeric_cols = ([f"VAR{i + 1}_SHIFT{lag}" for i in range(3)]
+                    + [f"VAR{i + 1}_MAGNITUDE{lag}" for i in range(3)]
+                    + [f"ERROR_REL{lag}", f"ERROR_MAGNITUDE{lag}"])
+    df_new.loc[fitted, numeric_cols] = np.column_stack([
+        fits['coeffs'][fitted], fits['magnitudes'][fitted],
+        fits['error_rel'][fitted], fits['error_mag'][fitted]])
+
+    # Signature identifiers of the selected combinations
+    ids = [signature_combos[pos][2] for pos in fits['combo'][fitted]]
+    for i in range(3):
+        df_new.loc[fitted, f"VAR{i + 1}_IDENTIFIER{lag}"] = pd.array(
+            [str(sig[i]) if i < len(sig) else pd.NA for sig in ids], dtype="string")
+
+
+# --- Global variables for block worker processes ---
+_obs_shm = None
+_obs_blocks = None
+_solver_options = None
+
+def _init_block_worker(signature_combos, signature_stacks, solver_options, shm_name, shape):
+    """
+    Initializer of the block workers: attaches the shared observation matrices
+    (lags x rows x parameters) and sets the signature combinations and solver options.
+    """
+    global _signature_combos, _signature_stacks, _solver_options, _obs_shm, _obs_blocks
+    _signature_combos = signature_combos
+    _signature_stacks = signature_stacks
+    _solver_options = solver_options
+    _obs_shm = shared_memory.SharedMemory(name=shm_name)
+    _obs_blocks = np.ndarray(shape, dtype=float, buffer=_obs_shm.buf)
+
+
+def _fit_row_block(task):
+    """
+    Worker function fitting a contiguous block of rows for every lag.
+
+    Returns
+    -------
+        - tuple: (start, stop, fits) with one dict of compact NumPy arrays per lag
+    """
+    start, stop, groups = task
+    fits = [
+        solve_signature_fits(
+            _obs_blocks[k, start:stop], _signature_combos,
+            stacks=_get_signature_stacks(), groups=groups, **_solver_options)
+        for k in range(_obs_blocks.shape[0])]
+    return start, stop, fits
+
+
+def _fit_blocks_parallel(obs_blocks, signature_combos, stacks, solver_options, groups,
+                         block_size, max_workers, flight_phase):
+    """
+    Fits the (lags x rows x parameters) observation matrices with a process pool.
+    The matrices are placed in shared memory and the workers are given contiguous
+    row blocks (with the ESN group of each row for the warm start of the pruned search).
+
+    Returns
+    -------
+        - all_fits (list): one dict of solver output arrays per lag
+    """
+    n_lags, n_rows, _ = obs_blocks.shape
+    all_fits = [None] * n_lags
+    if block_size is None:
+        n_workers = max_workers or os.cpu_count() or 1
+        block_size = max(solver_options['chunk_size'], -(-n_rows // (4 * n_workers)))
+    tasks = [(start, min(start + block_size, n_rows),
+              None if groups is None else groups[start:start + block_size])
+             for start in range(0, n_rows, block_size)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(obs_blocks.nbytes, 1))
+    try:
+        np.ndarray(obs_blocks.shape, dtype=float, buffer=shm.buf)[:] = obs_blocks
+        with ProcessPoolExecutor(
+            initializer=_init_block_worker,
+            initargs=(signature_combos, stacks, solver_options, shm.name, obs_blocks.shape),
+            max_workers=max_workers
+        ) as executor:
+            for start, stop, fits in tqdm(
+                    executor.map(_fit_row_block, tasks),
+                    total=len(tasks),
+                    desc=f" LOOP 6 {flight_phase} parallel",
+                    unit="block"):
+                for k, fits_lag in enumerate(fits):
+                    if all_fits[k] is None:
+                        all_fits[k] = {
+                            key: np.empty((n_rows,) + values.shape[1:], dtype=values.dtype)
+                            for key, values in fits_lag.items()}
+                    for key, values in fits_lag.items():
+                        all_fits[k][key][start:stop] = values
+    finally:
+        shm.close()
+        shm.unlink()
+    return all_fits
 
 
 def Loop_6_fit_signatures(
@@ -102,7 +227,14 @@ def Loop_6_fit_signatures(
     lag_list: list = [50, 100, 200, 400],
     DebugOption: int = 1,
     use_parallel: bool = True,
-    max_workers: int = None
+    max_workers: int = None,
+    chunk_size: int = 64,
+    block_size: int = None,
+    fit_cache_path: str = None,
+    fit_cache_max_entries: int = 500_000,
+    pruned_search: bool = False,
+    exact: bool = True,
+    top_k: int = 4
 ) -> pd.DataFrame:
     """
     Fit observed magnitude shifts against signature vectors for up to 3 signatures using least squares.
@@ -121,6 +253,15 @@ def Loop_6_fit_signatures(
         - DebugOption (int, optional): If 1, saves output CSV. Defaults to 1.
         - use_parallel (bool, optional): If True, uses multi-core parallel processing.
         - max_workers (int, optional): Maximum number of processes for parallel execution.
+        - chunk_size (int, optional): Rows fitted together by the batched solver.
+        - block_size (int, optional): Rows per parallel task, by default about 4 tasks per worker.
+        - fit_cache_path (str, optional): SQLite file of the persistent fit cache, disabled if None.
+        - fit_cache_max_entries (int, optional): Maximum number of cached fits (LRU eviction).
+        - pruned_search (bool, optional): Skip the combinations that can't beat the best fit,
+          warm started from the previous row of the same ESN. Defaults to the exhaustive search.
+        - exact (bool, optional): Pruned search returning the exhaustive search result (True),
+          or approximate screening of the top_k combinations per row (False).
+        - top_k (int, optional): Combinations solved per row in the approximate screening.
 
     Returns:
     --------
@@ -180,33 +321,54 @@ def Loop_6_fit_signatures(
         'NH__DEL_PC_E2E_MAV_NO_STEPS_LAG_',
         'FF__DEL_PC_E2E_MAV_NO_STEPS_LAG_'
     ]
-    # Parallel or sequential execution
-    if use_parallel:
+    # Observation matrices of the lags with all their columns available
+    obs_by_lag = {lag: _observation_matrix(df_new, lag, obs_mag_cols) for lag in lag_list}
+    obs_by_lag = {lag: obs for lag, obs in obs_by_lag.items() if obs is not None}
+    stacks = stack_signature_combos(signature_combos)
+    solver_options = dict(chunk_size=chunk_size, pruned=pruned_search, exact=exact, top_k=top_k,
+                          bounds=signature_bounds(signature_combos, stacks) if pruned_search else None)
+    # ESN of every row (rows in time order), used to warm start the pruned search
+    groups = pd.factorize(df_new["ESN"])[0] if "ESN" in df_new.columns else None
+
+    # Cached fits: rows found in the cache are not solved again (NaN rows are skipped)
+    cache = None
+    cached = {}
+    obs_to_solve = obs_by_lag
+    if fit_cache_path is not None and obs_by_lag:
+        search = "exact" if exact or not pruned_search else f"top_{top_k}"
+        cache = FitCache(fit_cache_path, fit_fingerprint(signature_combos, search=search),
+                         max_entries=fit_cache_max_entries)
+        obs_to_solve = {}
+        for lag, obs in obs_by_lag.items():
+            keys, hit, fits = cache.lookup(obs)
+            cached[lag] = (keys, hit, fits)
+            n_keys = sum(key is not None for key in keys)
+            log_message(f"        LOOP 6 {flight_phase} lag {lag}: fit cache hits {int(hit.sum())}, "
+                        f"misses {n_keys - int(hit.sum())}")
+            obs_to_solve[lag] = np.where(hit[:, None], np.nan, obs)
 
-        with ProcessPoolExecutor(
-            initializer=_init_worker,
-            initargs=(signature_combos, obs_mag_cols, lag_list, df_new),
-            max_workers=max_workers
-        ) as executor:
-            results = list(
-                tqdm(
-                    executor.map(process_row, df_new.index),
-                    total=len(df_new),
-                    desc=f" LOOP 6 {flight_phase} parallel",
-                    unit="row"
-                )
-            )
-
-        # Merge results
-        for idx, updated_row in results:
-            for col in updated_row.index:
-                df_new.at[idx, col] = updated_row[col]
+    # Parallel or sequential execution
+    if use_parallel and obs_to_solve:
+        all_fits = _fit_blocks_parallel(
+            np.stack(list(obs_to_solve.values())), signature_combos, stacks, solver_options,
+            groups, block_size, max_workers, flight_phase)
+        solved = dict(zip(obs_to_solve, all_fits))
     else:
-        # Sequential processing
-        for idx in tqdm(df_new.index, desc=f" LOOP 6 {flight_phase} sequential", unit="row"):
-            _, updated_row = process_row(idx)
-            for col in updated_row.index:
-                df_new.at[idx, col] = updated_row[col]
+        # Sequential processing: batched solver over all the new rows, one lag at a time
+        solved = {}
+        for lag in tqdm(obs_to_solve, desc=f" LOOP 6 {flight_phase} sequential", unit="lag"):
+            solved[lag] = solve_signature_fits(
+                obs_to_solve[lag], signature_combos, stacks=stacks, groups=groups, **solver_options)
+
+    for lag, fits in solved.items():
+        if cache is not None:
+            keys, hit, fits_cached = cached[lag]
+            cache.store(keys, fits, ~hit)
+            for key in fits:
+                fits[key][hit] = fits_cached[key][hit]
+        _write_fit_columns(df_new, lag, fits, signature_combos)
+    if cache is not None:
+        cache.close()
 
     # Concatenate old and new rows
     df_out = pd.concat([df_old, df_new]).sort_index()
@@ -221,8 +383,7 @@ def Loop_6_fit_signatures(
     # Save CSV if DebugOption enabled
     if DebugOption == 1:
         path_temp = os.path.join(os.getcwd(), "Fleetstore_Data", f"LOOP_6_{flight_phase}.csv")
-        log_message(f"File saved to: {path_temp}")
-        df_out.to_csv(path_temp, index=False)
+        save_snapshot(df_out, path_temp, stage="LOOP_6")
 
     return df_out
 
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import numpy as np
 from src.utils.log_file import log_message
+from src.utils.snapshot_writer import save_snapshot
 
 
 def Loop_7_IPC_HPC_PerfShift(
@@ -91,8 +92,7 @@ def Loop_7_IPC_HPC_PerfShift(
     if save_csv:
         
         path_temp = os.path.join(os.getcwd(), "Fleetstore_Data", f"LOOP_7_{flight_phase}_efficiency_negated.csv")
-        df_final.to_csv(path_temp, index=False)
-        log_message(f"File saved to: {path_temp}")
+        save_snapshot(df_final, path_temp, stage="LOOP_7")
         
     return df_final
 
@@ -4,6 +4,61 @@ import numpy as np
 from tqdm import tqdm
 
 from src.utils.log_file import log_message
+from src.utils.snapshot_writer import save_snapshot
+
+
+def _rolling_summary(values: pd.Series, esn: pd.Series, lag: int, thresholds: np.ndarray) -> tuple:
+    """
+    Rolling max, mean and exceedance fractions over the last lag points of each ESN.
+
+    Max and mean use the grouped pandas rolling window. The fractions are computed
+    for every threshold at once from cumulative counts: for each row, the points
+    above the threshold in the window divided by the window length (NaN values
+    count as not above), NaN when the window has no valid point.
+
+    Parameters
+    ----------
+    Args:
+        - values (pd.Series): shift values, in time order
+        - esn (pd.Series): ESN of each value
+        - lag (int): window length
+        - thresholds (np.ndarray): exceedance thresholds
+
+    Returns
+    -------
+        - rolling_max (np.ndarray): shape (n,)
+        - rolling_mean (np.ndarray): shape (n,)
+        - fractions (np.ndarray): shape (n, len(thresholds))
+    """
+    n_rows = len(values)
+    codes = pd.factorize(esn)[0]
+    rolling = pd.Series(values.to_numpy(dtype=float)).groupby(codes, sort=False).rolling(lag, min_periods=1)
+    rolling_max = rolling.max().droplevel(0).sort_index().to_numpy()
+    rolling_mean = rolling.mean().droplevel(0).sort_index().to_numpy()
+
+    # Rows of each ESN made contiguous, time order kept
+    order = np.argsort(codes, kind="stable")
+    v = values.to_numpy(dtype=float)[order]
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, n_rows])
+    position = np.arange(n_rows) - np.repeat(starts, counts)
+
+    # Window [lo, i] of each row, shorter at the start of an ESN history
+    window = np.minimum(position + 1, lag)
+    lo = np.arange(n_rows) + 1 - window
+
+    cum_valid = np.r_[0, np.cumsum(~np.isnan(v))]
+    n_valid = cum_valid[1:] - cum_valid[lo]
+    cum_above = np.vstack([np.zeros((1, len(thresholds)), dtype=np.int64),
+                           np.cumsum(v[:, None] > thresholds[None, :], axis=0)])
+    fractions = (cum_above[1:] - cum_above[lo]) / window[:, None]
+    fractions[n_valid == 0] = np.nan
+
+    unsorted = np.empty_like(fractions)
+    unsorted[order] = fractions
+    return rolling_max, rolling_mean, unsorted
+
 
 def Loop_8_Summary_Stats(
         df: pd.DataFrame,
@@ -60,84 +115,61 @@ def Loop_8_Summary_Stats(
     df_new = df[df['NEW_FLAG'] == 1].copy()
     df_old = df[df['NEW_FLAG'] == 0]
     if not df_new.empty:
-        esn_with_new_data = df_new["ESN"].unique()
         threshold_list = Lim_dict['EtaThresh']
-        loop_8_list_merged = []
-        print(f"{flight_phase} - start ESN for loop")
-        for esn in tqdm(esn_with_new_data, desc=f" LOOP 8 {flight_phase} ", unit="ESN"):
-            df_esn_temp = df[df["ESN"] == esn].copy()
-            # Loop over each lag window (e.g. 50, 100, 200, 400 flights)
-            for Lag in lag_list:
-                # Loop over both components: IPC and HPC
-                for comp in ["IPC", "HPC"]:
-                    # Build the name of the input column, e.g. "IPC_DAMAGE_SHIFT50"
-                    shift_col = f"{comp}_DAMAGE_SHIFT{Lag}"
-                    
-                    # Add lag/component if the column doees not exist
-                    if shift_col not in df_esn_temp.columns:
-                        df_esn_temp[shift_col] = np.nan
-                        # Skip this lag/component if the column does not exist
-                        #continue
-
-                    # Define output column names for max and mean
-                    max_col = f"{comp}_MAX{Lag}"
-                    mean_col = f"{comp}_MEAN{Lag}"
-
-                    # Filter df_esn_temp to include only rows with signature = f"{comp} ETA" in any column
-                    # listed in xrate_identifier_columns
-                    xrate_identifier_columns = [f"VAR1_IDENTIFIER{Lag}",f"VAR2_IDENTIFIER{Lag}",f"VAR3_IDENTIFIER{Lag}"]
-                    Xrate_to_match = f"{comp} ETA"
-                    df_esn_temp_comp = df_esn_temp[df_esn_temp[xrate_identifier_columns].eq(Xrate_to_match).any(axis=1)]
-
-                    # Get the indexes 
-                    df_esn_temp_comp_idx = df_esn_temp_comp.index
-
-
-                    # Rolling maximum over the last "Lag" flights
-                    # Example: for Lag=50, at row i, it looks back at the last 50 rows of df_new[shift_col] and takes the max
-                    rolling_max = df_esn_temp_comp[shift_col].rolling(Lag, min_periods=1).max()
-                    df_esn_temp.loc[df_esn_temp_comp_idx, max_col] = rolling_max
-
-                    # Rolling mean (average) over the last "Lag" flights
-                    rolling_mean = df_esn_temp_comp[shift_col].rolling(Lag, min_periods=1).mean()
-                    df_esn_temp.loc[df_esn_temp_comp_idx, mean_col] = rolling_mean
-                    
-                    # For each threshold value, compute the fraction of points above threshold
-                    for thr in threshold_list:
-                        # Build output column name, e.g. "IPC_FRACTION_GT_0.5_50"
-                        frac_col = f"{comp}_FRACTION_GT_{thr}_{Lag}"
-
-                        # rolling(Lag) → gives a moving window of size "Lag"
-                        # .apply(...) → lets us define our own function to compute on each window
-                        # lambda x: np.mean(x > thr) → custom function:
-                        #   - "x" is a numpy array containing the window values
-                        #   - "x > thr" produces a boolean array (True/False)
-                        #   - np.mean(...) converts True/False to 1/0 and averages them
-                        #   - Result = fraction of points above threshold
-                        df_esn_temp.loc[df_esn_temp_comp_idx, frac_col] = (
-                            df_esn_temp_comp[shift_col].rolling(Lag, min_periods=1)
-                            .apply(lambda x: np.mean(x > thr), raw=True)
-                        )
-
-                        # Concatenste with df_old_temp
-                        # Concatenate the two DataFrames
-                        df_old_temp = df_old[df_old["ESN"] == esn].copy()
-
-                        combined = pd.concat([df_esn_temp, df_old_temp], ignore_index=True)
-                        # combined_cols = combined.columns
-                        #columns_to_exclude_from_duplicate_check = max_col+ mean_col + frac_col
-                        # cols_to_check_for_duplicates = [col for col in combined_cols if col not in columns_to_exclude_from_duplicate_check]
-                        cols_to_check_for_duplicates = ['ESN','operator','ACID','ENGPOS','DSCID','reportdatetime']
-                        # Remove duplicates based on specific columns (e.g., 'id' and 'name')
-                        deduplicated = combined.drop_duplicates(subset=cols_to_check_for_duplicates, keep='last')
-            loop_8_list_merged.append(deduplicated)
-
-        # Merge the esn specific processed dataframe
-        df_final = pd.concat(loop_8_list_merged, ignore_index=True).sort_values(
+        thresholds = np.asarray(threshold_list, dtype=float)
+
+        # Only ESNs with new data are processed, only new rows are written
+        esn_with_new_data = df_new["ESN"].unique()
+        in_scope = df["ESN"].isin(esn_with_new_data).to_numpy()
+        is_new = (df['NEW_FLAG'] == 1).to_numpy()
+
+        # Output columns, in creation order, written at once after the loops
+        stats_columns = {}
+        for Lag in tqdm(lag_list, desc=f" LOOP 8 {flight_phase} ", unit="lag"):
+            # Loop over both components: IPC and HPC
+            for comp in ["IPC", "HPC"]:
+                # Build the name of the input column, e.g. "IPC_DAMAGE_SHIFT50"
+                shift_col = f"{comp}_DAMAGE_SHIFT{Lag}"
+
+                # Add lag/component if the column does not exist
+                if shift_col not in df.columns:
+                    df[shift_col] = np.nan
+
+                # Rows with signature = f"{comp} ETA" in any column listed in xrate_identifier_columns
+                xrate_identifier_columns = [f"VAR1_IDENTIFIER{Lag}", f"VAR2_IDENTIFIER{Lag}", f"VAR3_IDENTIFIER{Lag}"]
+                Xrate_to_match = f"{comp} ETA"
+                comp_rows = in_scope & df[xrate_identifier_columns].eq(Xrate_to_match).any(axis=1).to_numpy()
+
+                rolling_max, rolling_mean, fractions = _rolling_summary(
+                    df.loc[comp_rows, shift_col], df.loc[comp_rows, "ESN"], Lag, thresholds)
+
+                # Rolling max, mean and fraction of points above each threshold
+                # e.g. "IPC_MAX50", "IPC_MEAN50", "IPC_FRACTION_GT_0.2_50"
+                out_cols = [f"{comp}_MAX{Lag}", f"{comp}_MEAN{Lag}"] + [
+                    f"{comp}_FRACTION_GT_{thr}_{Lag}" for thr in threshold_list]
+                out_values = [rolling_max, rolling_mean] + list(fractions.T)
+
+                # Write the new rows only, old rows keep their values
+                write_rows = is_new[comp_rows]
+                write_idx = np.flatnonzero(comp_rows)[write_rows]
+                for col, values in zip(out_cols, out_values):
+                    if col not in stats_columns:
+                        stats_columns[col] = (df[col].to_numpy(dtype=float, copy=True)
+                                              if col in df.columns else np.full(len(df), np.nan))
+                    stats_columns[col][write_idx] = values[write_rows]
+
+        df = df.assign(**stats_columns)
+
+        # Concatenate new and old rows once, old rows win on duplicated keys
+        cols_to_check_for_duplicates = ['ESN','operator','ACID','ENGPOS','DSCID','reportdatetime']
+        combined = pd.concat([df[df['NEW_FLAG'] == 1], df_old], ignore_index=True)
+        deduplicated = combined.drop_duplicates(subset=cols_to_check_for_duplicates, keep='last')
+        df_final = deduplicated.sort_values(
                 by='reportdatetime',
-                ascending=True).reset_index(
+                ascending=True,
+                kind='stable').reset_index(
                 drop=True).drop_duplicates(keep='last')
-        
+
     else: # No new data
         df_final = df_old
 
@@ -145,8 +177,7 @@ def Loop_8_Summary_Stats(
     # Optionally save results to CSV
     if save_csv:
         path_temp = os.path.join(os.getcwd(), "Fleetstore_Data", f"LOOP_8_{flight_phase}.csv")
-        df_final.to_csv(path_temp, index=False)
-        log_message(f"File saved to: {path_temp}")
+        save_snapshot(df_final, path_temp, stage="LOOP_8")
 
     return df_final
 
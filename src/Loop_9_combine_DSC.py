@@ -7,7 +7,9 @@ from src.utils.print_time_now import print_time_now
 from tqdm import tqdm
 from typing import Dict, Tuple
 from src.utils.log_file import log_message, f_lineno as line
-from src.utils.merge_flight_phases_v1 import merge_flight_phases, merged_data_evaluation
+from src.utils.snapshot_writer import save_snapshot
+from src.utils.storage import write_frame
+from src.utils.merge_flight_phases_v1 import merge_flight_phases_asof, merged_data_evaluation
 
 
 
@@ -90,8 +92,7 @@ def Loop_9_combine_DSC(
         func_name = Loop_9_combine_DSC.__name__
         if save_csv:
             path_temp = os.path.join(os.getcwd(), "Fleetstore_Data", f"{func_name}_{flight_phase}_whole.csv")
-            df_final.to_csv(path_temp, index=False)
-            log_message(f"File saved to: {path_temp}")
+            save_snapshot(df_final, path_temp, stage="LOOP_9")
 
     #####################################################################################
     #####################################################################################
@@ -104,11 +105,15 @@ def Loop_9_combine_DSC(
 
      # save guard for function return in case merge_flight_phases fails
     df_merged = pd.DataFrame()
+    missing_phases = [fp for fp in ['take-off', 'climb', 'cruise'] if fp not in dict_temp]
+    if missing_phases:
+        log_message(f"Could not run {merge_flight_phases_asof.__name__}: no data for {missing_phases}")
+        return data_dict, df_merged
     
     try:
-        df_merged = merge_flight_phases(df_takeoff = dict_temp['take-off'],
-                                        df_climb = dict_temp['climb'],
-                                        df_cruise = dict_temp['cruise'])
+        df_merged = merge_flight_phases_asof(df_takeoff = dict_temp['take-off'],
+                                             df_climb = dict_temp['climb'],
+                                             df_cruise = dict_temp['cruise'])
         df_merged, df_DN = merged_data_evaluation(df_merged, Num) 
 
         # Remove duplicates
@@ -116,19 +121,18 @@ def Loop_9_combine_DSC(
             by='reportdatetime_takeoff',
             ascending=True).drop_duplicates(keep='last')
     
-        # (Optional) save out
+        # (Optional) save out. These are deliverables, not debug dumps: always written
+        # as CSV, outside the snapshot sink (and its format override)
         if save_csv:
             path_out_df_merged = os.path.join(os.getcwd(), "Fleetstore_Data",
                                     f"{Loop_9_combine_DSC.__name__}_merged_output.csv")
-            df_merged.to_csv(path_out_df_merged, index=False)
+            write_frame(df_merged, path_out_df_merged)
 
             path_out_df_DN = os.path.join(os.getcwd(), "Fleetstore_Data",
                                     f"{Loop_9_combine_DSC.__name__}_DN_output.csv")
-            df_DN.to_csv(path_out_df_DN, index=False)
-            
-            log_message(f"File saved to: {os.path.join(os.getcwd(), 'Fleetstore_Data')}")
+            write_frame(df_DN, path_out_df_DN)
     except Exception as e:
-        log_message(f"Could not run {merge_flight_phases.__name__}: {e}")
+        log_message(f"Could not run {merge_flight_phases_asof.__name__}: {e}")
     return data_dict, df_merged
 
 # ==============================
@@ -143,6 +147,7 @@ if __name__ == "__main__":
         Xrates_dic_vector_norm,
     )
     from src.utils.async_main import main as async_main
+    from src.utils.storage import data_path, write_frame
 
     root = os.getcwd()
     data_folder = os.path.join(root, "Fleetstore_Data")
@@ -173,8 +178,8 @@ if __name__ == "__main__":
         # Data output save
         ##########################################################################
         for flight_phase in data_dict.keys():
-            path_output_data = os.path.join(data_folder, f"data_output_{flight_phase}.csv")
-            data_dict[flight_phase].to_csv(path_output_data, index=False)
+            path_output_data = data_path(data_folder, f"data_output_{flight_phase}", "parquet")
+            write_frame(data_dict[flight_phase], path_output_data)
             log_message(f"{flight_phase.capitalize()} data saved to: {path_output_data}")
     except Exception as e:
         log_message(f"Could not run  {func.__name__}: {e}")
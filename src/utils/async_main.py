@@ -3,9 +3,131 @@ import asyncio
 import pandas as pd
 from functools import partial
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime as dt
 from src.utils.log_file import LOG_FILE, log_message
 from src.utils.load_data import load_temp_data as ltd
+from src.utils.frame_transport import (
+    frame_from_shared_memory,
+    frame_to_shared_memory,
+    release_shared_memory,
+)
+from src.utils.snapshot_writer import stop_snapshot_sink
+
+# Executors a flight phase stage can run in:
+# - "thread": worker thread of the event loop (the GIL serialises the Python-heavy loops)
+# - "process": shared worker process pool, frames exchanged through shared memory
+# - "inline": called directly in the event loop thread (debugging, profiling)
+EXECUTORS = ("thread", "process", "inline")
+
+# Worker process pool, created at the first "process" stage and reused by the next ones
+_process_pool = None
+_process_pool_workers = None
+
+
+def _init_stage_worker():
+    """
+    Initialiser of the pool worker processes: the snapshot sink thread of the parent
+    process does not exist in the workers, they write their snapshots synchronously.
+    """
+    stop_snapshot_sink()
+
+
+def get_process_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Returns the worker process pool shared by the stages, created on first use.
+    The pool is recreated if a different number of workers is requested.
+
+    Parameters
+    ----------
+    Args:
+        - max_workers (int, optional): number of worker processes, os.cpu_count() if None
+
+    Returns
+    -------
+        - ProcessPoolExecutor: shared pool
+    """
+    global _process_pool, _process_pool_workers
+    if _process_pool is not None and max_workers is not None and max_workers != _process_pool_workers:
+        shutdown_process_pool()
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_stage_worker)
+        _process_pool_workers = max_workers
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """
+    Stops the worker process pool, if any.
+    """
+    global _process_pool, _process_pool_workers
+    pool, _process_pool, _process_pool_workers = _process_pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def _run_stage_in_worker(process_function, handle: tuple, flight_phase: str, kwargs: dict) -> tuple:
+    """
+    Runs a stage in a pool worker: reads the input frame from shared memory (freed by
+    the parent process) and writes the output frame to a new block (freed by the parent).
+    """
+    df = frame_from_shared_memory(handle, unlink=False)
+    df = process_function(df=df, flight_phase=flight_phase, **kwargs)
+    return frame_to_shared_memory(df)
+
+
+async def run_stage(
+    process_function,
+    df: pd.DataFrame,
+    flight_phase: str,
+    executor: str = "thread",
+    pool_workers: int = None,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Runs a stage on the data of one flight phase, as process_function(df=df,
+    flight_phase=flight_phase, **kwargs), in the requested executor.
+
+    With the "process" executor the frames are not pickled: they are written to shared
+    memory as Arrow IPC streams and only the block names go through the pool pipes.
+    process_function and kwargs are pickled, so they must be module-level objects.
+
+    Parameters
+    ----------
+    Args:
+        - process_function: stage function
+        - df (pd.DataFrame): input data
+        - flight_phase (str): flight phase
+        - executor (str): "thread", "process" or "inline"
+        - pool_workers (int, optional): number of processes of the shared pool
+        - kwargs: other arguments of process_function
+
+    Returns
+    -------
+        - pd.DataFrame: processed data
+    """
+    global _process_pool
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}, expected one of {EXECUTORS}")
+    if executor == "inline":
+        return process_function(df=df, flight_phase=flight_phase, **kwargs)
+    if executor == "thread":
+        return await asyncio.to_thread(process_function, df=df, flight_phase=flight_phase, **kwargs)
+
+    handle = frame_to_shared_memory(df)
+    try:
+        pool = get_process_pool(pool_workers)
+        loop = asyncio.get_running_loop()
+        output_handle = await loop.run_in_executor(
+            pool, _run_stage_in_worker, process_function, handle, flight_phase, kwargs)
+    except BrokenProcessPool:
+        # A worker died: the next stage gets a new pool
+        _process_pool = None
+        raise
+    finally:
+        release_shared_memory(handle)
+    return frame_from_shared_memory(output_handle)
 
 
 async def process_flight_phase(
@@ -13,10 +135,13 @@ async def process_flight_phase(
     data_dict: dict,
     Fleetstore_data_dir: str,
     process_function,
+    executor: str = "thread",
+    pool_workers: int = None,
     **kwargs
 ) -> tuple:
     """
     Async processing of a single flight phase with timing and error handling.
+    The stage runs in the executor given (see run_stage).
 
     Returns
     -------
@@ -34,11 +159,12 @@ async def process_flight_phase(
         # Remove Xrates from kwargs if already bound via partial
         # safe_kwargs = {k: v for k, v in kwargs.items() if k != "Xrates"}
 
-        # Run processing in a background thread
-        df = await asyncio.to_thread(
+        df = await run_stage(
             process_function,
             df=data_dict[flight_phase],
             flight_phase=flight_phase,
+            executor=executor,
+            pool_workers=pool_workers,
             **kwargs
         )
 
@@ -60,11 +186,24 @@ async def main(
     data_dict: dict,
     Fleetstore_data_dir: str,
     process_function,
+    executor: str = "thread",
+    pool_workers: int = None,
     **kwargs
 ) -> dict:
     """
     Main async runner for all flight phases, with progress tracking and logging.
 
+    Parameters
+    ----------
+    Args:
+        - data_dict (dict): {flight_phase: pd.DataFrame}
+        - Fleetstore_data_dir (str): Fleetstore data folder
+        - process_function: stage function, called as process_function(df=df, flight_phase=flight_phase, **kwargs)
+        - executor (str): "thread" (default), "process" or "inline", see run_stage.
+          The process pool is kept between calls, shutdown_process_pool() stops it
+        - pool_workers (int, optional): number of processes of the pool
+        - kwargs: other arguments of process_function
+
     Returns
     -------
          dict: {flight_phase: processed_df}
@@ -82,6 +221,8 @@ async def main(
             data_dict,
             Fleetstore_data_dir,
             process_function,
+            executor=executor,
+            pool_workers=pool_workers,
             **kwargs
         )
         for flight_phase in data_dict.keys()
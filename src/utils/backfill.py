@@ -0,0 +1,279 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+from functools import partial
+import pandas as pd
+from src.utils.log_file import log_message
+from src.utils.data_ing import (
+    clean_query_data,
+    dispose_shared_engine,
+    execute_query_from_file_path,
+    get_shared_engine,
+    merge_query_data,
+    read_query_in_chunks,
+)
+from src.utils.df_merger_new_v2 import cast_query_dtypes
+from src.utils.query_builder import render_query, window_query
+from src.utils.storage import data_path, read_frame, write_frame
+
+# Query template suffix of each flight phase (same as data_ingestion)
+PHASE_QUERIES = {
+    'CRZ.sql': 'cruise',
+    'CLM.sql': 'climb',
+    'TKO.sql': 'take-off'}
+
+
+def backfill_phases(query_folder: str, flight_phases: list = None) -> dict:
+    """
+    Query templates of the flight phases to backfill.
+
+    Parameters
+    ----------
+    Args:
+        - query_folder (str): folder of the Fleetstore queries
+        - flight_phases (list, optional): flight phases to backfill, all if None
+
+    Returns
+    -------
+        - dict: {flight_phase: query file path}
+    """
+    phases = {}
+    for SQL_query in sorted(os.listdir(query_folder)):
+        flight_phase = PHASE_QUERIES.get(SQL_query[-7:])
+        if flight_phase is not None and (not flight_phases or flight_phase in flight_phases):
+            phases[flight_phase] = os.path.join(query_folder, SQL_query)
+    return phases
+
+
+def plan_windows(start, end, window_days: float = 7) -> list:
+    """
+    Splits [start, end) into consecutive time windows.
+
+    Parameters
+    ----------
+    Args:
+        - start: backfill start (inclusive), anything pd.Timestamp accepts
+        - end: backfill end (exclusive)
+        - window_days (float): length of the windows in days, the last one can be shorter
+
+    Returns
+    -------
+        - list: (window_start, window_end) pd.Timestamp tuples, in chronological order
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if end <= start:
+        raise ValueError(f"Backfill end {end} must be after its start {start}")
+    step = pd.Timedelta(days=window_days)
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def window_key(window: tuple) -> str:
+    """
+    Manifest key of a window, e.g. "2025-01-01T00:00:00_2025-01-08T00:00:00".
+    """
+    return "_".join(pd.Timestamp(ts).isoformat() for ts in window)
+
+
+class BackfillManifest:
+    """
+    JSON record of a backfill: the windows fetched for each flight phase (rows, file,
+    latest reportdatetime) and the windows processed by the loops. The file is rewritten
+    atomically after every update, so a crashed backfill resumes from the last recorded
+    window.
+
+    Parameters
+    ----------
+    Args:
+        - path (str): manifest file path
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {"fetched": {}, "processed": []}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def is_fetched(self, flight_phase: str, window: tuple) -> bool:
+        return window_key(window) in self.data["fetched"].get(flight_phase, {})
+
+    def fetched(self, flight_phase: str, window: tuple) -> dict:
+        return self.data["fetched"].get(flight_phase, {}).get(window_key(window))
+
+    def mark_fetched(self, flight_phase: str, window: tuple, rows: int, file: str, latest: str):
+        with self._lock:
+            self.data["fetched"].setdefault(flight_phase, {})[window_key(window)] = {
+                "rows": rows, "file": file, "latest": latest,
+                "completed": dt.now().strftime("%Y-%m-%d %H:%M:%S")}
+            self._save()
+
+    def is_processed(self, window: tuple) -> bool:
+        return window_key(window) in self.data["processed"]
+
+    def mark_processed(self, window: tuple):
+        # Idempotent: a window processed again (resumed backfill) is recorded once
+        with self._lock:
+            key = window_key(window)
+            self.data["processed"] = [processed for processed in self.data["processed"] if processed != key]
+            self.data["processed"].append(key)
+            self._save()
+
+
+def fetch_window(
+    sql_file_path: str,
+    flight_phase: str,
+    window: tuple,
+    engine,
+    output_dir: str,
+    chunksize: int = None,
+    pushdown: bool = False,
+) -> tuple:
+    """
+    Fetches the data of one flight phase and time window, cleaned and typed as in query_run,
+    and writes it to a Parquet file.
+
+    Parameters
+    ----------
+    Args:
+        - sql_file_path (str): query template of the flight phase
+        - flight_phase (str): flight phase
+        - window (tuple): (start, end) of the window
+        - engine (Engine): pooled database engine
+        - output_dir (str): folder of the window files
+        - chunksize (int, optional): stream the query chunksize rows at a time
+        - pushdown (bool): push the limits and Celsius conversion down to the server
+
+    Returns
+    -------
+        - tuple: (rows, file path, latest reportdatetime of the raw data or None)
+    """
+    render = partial(window_query, start=window[0], end=window[1])
+    if pushdown:
+        render = lambda query, window_render=render: render_query(window_render(query), flight_phase)
+    if chunksize:
+        data, _, latest_ts, _ = read_query_in_chunks(
+            sql_file_path, engine, flight_phase, chunksize, render=render, pushdown=pushdown)
+    else:
+        data, _ = execute_query_from_file_path(sql_file_path, engine, render=render)
+        latest_ts = None if data.empty else data['reportdatetime'].max()
+        data = cast_query_dtypes(clean_query_data(data, flight_phase, pushdown=pushdown))
+
+    file_name = f"{flight_phase}_{window[0]:%Y%m%d%H%M%S}_{window[1]:%Y%m%d%H%M%S}"
+    path = write_frame(data, data_path(output_dir, file_name))
+    latest = None if latest_ts is None or pd.isna(latest_ts) else str(pd.Timestamp(latest_ts))
+    return len(data), path, latest
+
+
+def run_backfill(
+    root_dir: str,
+    start,
+    end,
+    window_days: float = 7,
+    flight_phases: list = None,
+    max_workers: int = 4,
+    chunksize: int = None,
+    pushdown: bool = False,
+) -> BackfillManifest:
+    """
+    Fetches [start, end) window by window for each flight phase, max_workers windows at
+    once on a pooled engine. Every fetched window is recorded in the manifest
+    (Fleetstore_Data/backfill/manifest.json): running the backfill again only fetches the
+    windows missing from it. A window failing is logged and left for the next run.
+
+    Parameters
+    ----------
+    Args:
+        - root_dir (str): base directory containing 'Queries' and 'Fleetstore_Data'
+        - start: backfill start (inclusive)
+        - end: backfill end (exclusive)
+        - window_days (float): length of the windows in days
+        - flight_phases (list, optional): flight phases to backfill, all if None
+        - max_workers (int): maximum number of window queries running at once
+        - chunksize (int, optional): stream the queries chunksize rows at a time
+        - pushdown (bool): push the limits and Celsius conversion down to the server
+
+    Returns
+    -------
+        - BackfillManifest: manifest of the backfill
+    """
+    query_folder = os.path.join(root_dir, 'Queries')
+    output_dir = os.path.join(root_dir, 'Fleetstore_Data', 'backfill')
+    manifest = BackfillManifest(os.path.join(output_dir, 'manifest.json'))
+    windows = plan_windows(start, end, window_days)
+
+    tasks = [(sql_file_path, flight_phase, window)
+             for flight_phase, sql_file_path in backfill_phases(query_folder, flight_phases).items()
+             for window in windows if not manifest.is_fetched(flight_phase, window)]
+    log_message(f"Backfill {window_key((windows[0][0], windows[-1][1]))}: {len(tasks)} windows to fetch")
+    if not tasks:
+        return manifest
+
+    os.makedirs(output_dir, exist_ok=True)
+    engine = get_shared_engine(pool_size=max_workers)
+
+    def fetch(task: tuple):
+        sql_file_path, flight_phase, window = task
+        start_time = dt.now()
+        try:
+            rows, path, latest = fetch_window(
+                sql_file_path, flight_phase, window, engine, output_dir, chunksize, pushdown)
+        except Exception as e:
+            log_message(f"ERROR fetching {flight_phase} window {window_key(window)}: {e}")
+            return
+        manifest.mark_fetched(flight_phase, window, rows, os.path.relpath(path, output_dir), latest)
+        log_message(f"{flight_phase} window {window_key(window)} fetched in "
+                    f"{(dt.now() - start_time).total_seconds():.2f} seconds: {rows} rows")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fetch, tasks))
+    finally:
+        dispose_shared_engine()
+    return manifest
+
+
+def window_data_dict(root_dir: str, manifest: BackfillManifest, window: tuple) -> dict:
+    """
+    Loads the fetched data of a window for each flight phase and merges it with the
+    historical data as query_run does, the rows of the window being flagged as new.
+
+    Parameters
+    ----------
+    Args:
+        - root_dir (str): base directory containing 'Fleetstore_Data'
+        - manifest (BackfillManifest): backfill manifest
+        - window (tuple): (start, end) of the window
+
+    Returns
+    -------
+        - dict: {flight_phase: pd.DataFrame}, phases without data in the window are left out
+    """
+    output_dir = os.path.join(root_dir, 'Fleetstore_Data', 'backfill')
+    # The window start is inclusive: rows at the start are new too
+    timestamp_dt = pd.Timestamp(window[0]) - pd.Timedelta(1, unit="ns")
+    data_dict = {}
+    for flight_phase in manifest.data["fetched"]:
+        entry = manifest.fetched(flight_phase, window)
+        if entry is None or entry["rows"] == 0:
+            continue
+        data = read_frame(os.path.join(output_dir, entry["file"]))
+        data_dict[flight_phase] = merge_query_data(
+            data, flight_phase, timestamp_dt, data.columns.to_list(), cast_dtypes=False)
+    return data_dict
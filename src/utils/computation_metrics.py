@@ -1,34 +1,260 @@
 import time
 import os
-import psutil
-import functools
 import sys
-import dis
+import threading
+import functools
+from collections import Counter
+from contextlib import contextmanager
+import psutil
 
 # Define the path of the log file (in the root folder where the script runs)
 LOG_FILE = os.path.join(os.getcwd(), "function_log.txt")
 
-# Set of arithmetic operations we want to count (based on Python bytecode names)
-ARITHMETIC_OPS = {
-    "BINARY_ADD", "BINARY_SUBTRACT", "BINARY_MULTIPLY", "BINARY_TRUE_DIVIDE",
-    "BINARY_FLOOR_DIVIDE", "BINARY_MODULO", "BINARY_POWER",
-    "INPLACE_ADD", "INPLACE_SUBTRACT", "INPLACE_MULTIPLY", "INPLACE_TRUE_DIVIDE",
-    "INPLACE_FLOOR_DIVIDE", "INPLACE_MODULO", "INPLACE_POWER",
-    "UNARY_NEGATIVE", "UNARY_POSITIVE"
-}
+# Statistical profiling of the monitored calls, off unless MONITOR_PROFILE=1
+PROFILE_ENV = "MONITOR_PROFILE"
+PROFILE_INTERVAL_ENV = "MONITOR_PROFILE_INTERVAL_MS"
+PROFILE_TOP_ENV = "MONITOR_PROFILE_TOP"
+
+_process_cache = {}
+_LOG_LOCK = threading.Lock()
+_local = threading.local()
+_threadpool_controller = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _process() -> psutil.Process:
+    """
+    psutil handle of the current process, cached per PID: a worker forked from a
+    process that already used monitor must not measure its parent.
+    """
+    pid = os.getpid()
+    process = _process_cache.get(pid)
+    if process is None:
+        _process_cache.clear()
+        process = _process_cache[pid] = psutil.Process(pid)
+    return process
+
+
+def _peak_rss() -> int:
+    """High-water mark of the process RSS, in bytes."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    return getattr(_process().memory_info(), "peak_wset", 0)
+
+
+def _count_rows(obj):
+    """Rows of a DataFrame / Series / array, summed over the tuples, lists and dicts of them."""
+    if hasattr(obj, "shape") and len(getattr(obj, "shape", ())) > 0:
+        return obj.shape[0]
+    values = obj.values() if isinstance(obj, dict) else obj if isinstance(obj, (tuple, list)) else ()
+    counts = [count for count in (_count_rows(value) for value in values) if count is not None]
+    return sum(counts) if counts else None
+
+
+def thread_pools() -> list:
+    """
+    Native thread pools loaded in the process (BLAS, OpenMP) and their number of threads.
+    The libraries are looked up once, at the first call (see threadpoolctl).
+
+    Returns
+    -------
+        - list: [{"library", "api", "threads"}], empty without threadpoolctl
+    """
+    global _threadpool_controller
+    if _threadpool_controller is None:
+        try:
+            from threadpoolctl import ThreadpoolController
+        except ImportError:
+            return []
+        _threadpool_controller = ThreadpoolController()
+    return [{"library": info["internal_api"], "api": info["user_api"], "threads": info["num_threads"]}
+            for info in _threadpool_controller.info()]
+
+
+class StackSampler:
+    """
+    Statistical profiler: a background thread records the stack of the monitored
+    thread every interval seconds. The cost is paid by the sampling thread only,
+    the monitored code runs untouched.
+
+    Parameters
+    ----------
+    Args:
+        - thread_id (int): identifier of the thread to sample
+        - interval (float): sampling period in seconds
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.n_samples = 0
+        self.own = Counter()
+        self.total = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.n_samples += 1
+            self.own[self._key(frame)] += 1
+            seen = set()
+            while frame is not None:
+                key = self._key(frame)
+                # A recursive function is counted once per sample
+                if key not in seen:
+                    seen.add(key)
+                    self.total[key] += 1
+                frame = frame.f_back
+
+    @staticmethod
+    def _key(frame) -> tuple:
+        code = frame.f_code
+        return code.co_name, os.path.basename(code.co_filename), code.co_firstlineno
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top: int = 15) -> str:
+        """Functions with the most samples on top of the stack (own) and anywhere in it (total)."""
+        if not self.n_samples:
+            return "Profile: no sample\n"
+        lines = [f"Profile: {self.n_samples} samples every {self.interval * 1000:g} ms (own % / total %)"]
+        for key, own in self.own.most_common(top):
+            name, file, line = key
+            lines.append(f"  {100 * own / self.n_samples:5.1f}% {100 * self.total[key] / self.n_samples:5.1f}%"
+                         f"  {name} ({file}:{line})")
+        return "\n".join(lines) + "\n"
+
+
+def _profile_settings():
+    """(interval in seconds, top) if profiling is enabled by MONITOR_PROFILE, None otherwise."""
+    if os.environ.get(PROFILE_ENV, "").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    interval = float(os.environ.get(PROFILE_INTERVAL_ENV, 5)) / 1000
+    return interval, int(os.environ.get(PROFILE_TOP_ENV, 15))
+
+
+class CallMetrics(dict):
+    """
+    Metrics of a monitored block (a dict), filled when the block exits. rows_out can be
+    set inside the block, e.g. metrics.rows_out = len(df).
+    """
+    rows_out = None
+
+
+@contextmanager
+def monitor(name: str, rows_in: int = None, log_file: str = None):
+    """
+    Measures a block of code at a negligible cost (a few system calls at entry and
+    exit) and logs its metrics to function_log.txt:
+      - wall-clock duration, CPU user and system time of the process, and the
+        average number of CPUs used,
+      - peak RSS delta: rise of the process RSS high-water mark over the RSS at
+        entry. Exact when the block sets a new high-water mark, otherwise the RSS
+        growth of the block (a lower bound),
+      - rows in and out, if given,
+      - number of threads of the NumPy / BLAS / OpenMP thread pools.
+
+    With the environment variable MONITOR_PROFILE=1 the block is also profiled by
+    sampling (see StackSampler, MONITOR_PROFILE_INTERVAL_MS and MONITOR_PROFILE_TOP).
+    Nested monitored blocks are profiled as part of the outermost one.
+
+    Parameters
+    ----------
+    Args:
+        - name (str): name logged for the block
+        - rows_in (int, optional): number of input rows
+        - log_file (str, optional): log file path, LOG_FILE if None
+
+    Returns
+    -------
+        - CallMetrics: yielded dict of the metrics, filled at exit
+
+    Example:
+        >>> with monitor("Loop 4 cruise", rows_in=len(df)) as metrics:
+        ...     df = Loop_4_movavg(df, "cruise")
+        ...     metrics.rows_out = len(df)
+    """
+    metrics = CallMetrics()
+    profile = _profile_settings()
+    sampler = None
+    if profile is not None and not getattr(_local, "profiling", False):
+        _local.profiling = True
+        sampler = StackSampler(threading.get_ident(), profile[0]).start()
+
+    process = _process()
+    start_rss = process.memory_info().rss
+    start_peak = _peak_rss()
+    start_cpu_times = process.cpu_times()
+    start_time = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        duration = time.perf_counter() - start_time
+        end_cpu_times = process.cpu_times()
+        end_peak = _peak_rss()
+        end_rss = process.memory_info().rss
+        if sampler is not None:
+            sampler.stop()
+            _local.profiling = False
+
+        cpu_user = end_cpu_times.user - start_cpu_times.user
+        cpu_system = end_cpu_times.system - start_cpu_times.system
+        peak = end_peak if end_peak > start_peak else end_rss
+        metrics.update({
+            "function": name,
+            "duration_s": duration,
+            "cpu_user_s": cpu_user,
+            "cpu_system_s": cpu_system,
+            "avg_cpus_used": (cpu_user + cpu_system) / duration if duration > 0 else 0.0,
+            "peak_rss_delta_mb": max(peak - start_rss, 0) / 2**20,
+            "rows_in": rows_in,
+            "rows_out": metrics.rows_out,
+            "thread_pools": thread_pools(),
+        })
+        _write_log(metrics, sampler, profile[1] if profile else 0, log_file or LOG_FILE)
+
+
+def _write_log(metrics: dict, sampler: StackSampler, top: int, log_file: str):
+    pools = ", ".join(f"{pool['library']} ({pool['api']}) {pool['threads']}"
+                      for pool in metrics["thread_pools"]) or "none loaded"
+    text = (
+        f"Function: {metrics['function']}\n"
+        f"Duration: {metrics['duration_s']:.6f} seconds\n"
+        f"CPU User Time: {metrics['cpu_user_s']:.6f} s\n"
+        f"CPU System Time: {metrics['cpu_system_s']:.6f} s\n"
+        f"Average CPUs used: {metrics['avg_cpus_used']:.2f} / {os.cpu_count()}\n"
+        f"Peak RSS delta: {metrics['peak_rss_delta_mb']:.1f} MB\n"
+        f"Rows in / out: {metrics['rows_in']} / {metrics['rows_out']}\n"
+        f"Thread pools: {pools}\n"
+    )
+    if sampler is not None:
+        text += sampler.report(top)
+    with _LOG_LOCK, open(log_file, "a") as f:
+        f.write(text + f"{'-'*40}\n")
+
 
 def monitor_function(func):
     """
-    Decorator to monitor execution metrics of a function.
+    Decorator to monitor execution metrics of a function, see monitor.
 
-    This decorator logs the following information for each function call:
-      - Execution duration (wall-clock time).
-      - CPU user time and system time consumed by the process.
-      - Number of arithmetic operations performed (counted via bytecode tracing).
-      - Average CPU utilization percentage during the function's execution.
-      - Estimated number of logical CPUs effectively used.
-    
-    The metrics are logged into a file named `function_log.txt` in the root folder.
+    The rows in are counted on the DataFrame (or dict / tuple of DataFrames) arguments,
+    the rows out on the returned value. The wrapped code is not traced, so the decorator
+    can be left on in production runs.
 
     Args:
         func (callable): The function to wrap and monitor.
@@ -38,82 +264,16 @@ def monitor_function(func):
 
     Example:
         >>> @monitor_function
-        ... def my_calc(n):
-        ... x = 1
-        ... for i in range(1, n):
-        ... x *= i
-        ... return x
-        ...
-        >>> my_calc(100000)
+        ... def Loop_4_movavg(df, flight_phase):
+        ...     ...
+        >>> Loop_4_movavg(df, "cruise")
         # Logs will be written to function_log.txt
     """
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Create a psutil.Process object for monitoring CPU stats of the current process
-        process = psutil.Process(os.getpid())
-
-        # Dictionary to store the count of arithmetic operations
-        calc_count = {"ops": 0}
-
-        # Define a tracer function to inspect each bytecode instruction executed
-        def tracer(frame, event, arg):
-            """
-            Tracer function to hook into Python execution.
-            Captures arithmetic operations based on opcode names.
-            """
-            if event == "opcode": # Only inspect opcode events
-                instr = dis.opname[frame.f_code.co_code[frame.f_lasti]] # Get the current opcode name
-                if instr in ARITHMETIC_OPS: # Check if it's an arithmetic operation
-                    calc_count["ops"] += 1 # Increment counter
-            return tracer # Must return itself to keep tracing enabled
-
-        # Get the number of logical CPUs available on the machine
-        cpu_count = psutil.cpu_count(logical=True)
-
-        # Start metrics collection
-        start_time = time.perf_counter() # High-resolution wall clock timer
-        start_cpu_times = process.cpu_times() # Snapshot of user/system CPU time
-        start_cpu_percent = process.cpu_percent(interval=None) # Reset CPU % measurement
-
-        # Enable tracing of Python bytecode execution
-        sys.settrace(tracer)
-
-        try:
-            # Run the original function
+        with monitor(func.__name__, rows_in=_count_rows([*args, *kwargs.values()])) as metrics:
             result = func(*args, **kwargs)
-        finally:
-            # Disable tracing after function execution
-            sys.settrace(None)
-
-        # End metrics collection
-        end_time = time.perf_counter() # End wall clock timer
-        end_cpu_times = process.cpu_times() # New snapshot of CPU times
-        end_cpu_percent = process.cpu_percent(interval=None) # Average CPU % since last call
-
-        # Compute execution duration
-        duration = end_time - start_time
-
-        # Compute CPU usage breakdown
-        cpu_user = end_cpu_times.user - start_cpu_times.user
-        cpu_system = end_cpu_times.system - start_cpu_times.system
-
-        # Estimate effective CPUs used:
-        # Example: if CPU% = 200% on an 8-core machine, avg_cpus_used ≈ 2
-        avg_cpus_used = (end_cpu_percent / 100.0) * cpu_count
-
-        # Write collected metrics into the log file
-        with open(LOG_FILE, "a") as f:
-            f.write(
-                f"Function: {func.__name__}\n"
-                f"Duration: {duration:.6f} seconds\n"
-                f"CPU User Time: {cpu_user:.6f} s\n"
-                f"CPU System Time: {cpu_system:.6f} s\n"
-                f"Arithmetic operations: {calc_count['ops']}\n"
-                f"Average CPU%: {end_cpu_percent:.2f}%\n"
-                f"Estimated CPUs used: {avg_cpus_used:.2f} / {cpu_count}\n"
-                f"{'-'*40}\n"
-            )
-
+            metrics.rows_out = _count_rows(result)
         # Return the function's original result
         return result
 
@@ -1,20 +1,32 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from urllib.parse import quote_plus
 from datetime import datetime as dt
+from functools import partial
 from typing import Union
 from dotenv import load_dotenv
 from src.utils.log_file import LOG_FILE, log_message, debug_info, f_lineno as line
 from src.utils.import_data_filters import filter_parameters
-from src.utils.df_merger_new_v2 import df_merger_new
+from src.utils.parameter_table import KELVIN_COLUMNS, KELVIN_TO_CELSIUS
+from src.utils.query_builder import render_query
+from src.utils.df_merger_new_v2 import df_merger_new, cast_query_dtypes
+from src.utils.tail_state_store import TailStateStore
+from src.utils.watermark_ledger import WatermarkLedger
 from src.utils.days_difference_v1 import days_difference
 
 # Load credentials to access Fleetstore
 load_dotenv(override=True)
 
+# Engine shared by the queries of a run (see get_shared_engine)
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+
 def is_datetime(string: str, format: str = "%Y-%m-%d %H:%M:%S") -> bool:
     """
     Checks if a given string can be parsed into a datetime object using the specified format.
@@ -100,10 +112,17 @@ def load_and_replace_sql(query_var: str) -> Union[str, str]:
     except Exception as e:
         raise RuntimeError(f"An error occurred while processing the file: {e}")
 
-def connect_to_db_sqlalchemy(connection_info: bool = False) -> Engine:
+def connect_to_db_sqlalchemy(connection_info: bool = False, pool_size: int = 5) -> Engine:
     '''
     Function to connect to fleetstore by fetching credentails stored in .env file
 
+    Parameters
+    ----------
+    Args:
+        - connection_info (bool): log the connection strings
+        - pool_size (int): number of connections kept open by the engine pool, i.e. of
+          queries which can run at once without authenticating again
+
     Returns
     -------
         - conn (Engine): connection to SQL database
@@ -128,7 +147,8 @@ def connect_to_db_sqlalchemy(connection_info: bool = False) -> Engine:
 
     
     connection_str = f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc_str)}"
-    conn = create_engine(connection_str)
+    # pool_pre_ping replaces the pooled connections dropped by the server
+    conn = create_engine(connection_str, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
     log_message('SQLALCHEMY connection opened')
     if connection_info ==True:
         log_message(f"odbc_str:\n{odbc_str}")
@@ -138,8 +158,39 @@ def connect_to_db_sqlalchemy(connection_info: bool = False) -> Engine:
 
     return conn
 
+def get_shared_engine(pool_size: int = 3) -> Engine:
+    '''
+    Returns the engine shared by the queries of a run, created on first use, so that the
+    Active Directory authentication is done once per pooled connection instead of once per query.
+
+    Parameters
+    ----------
+    Args:
+        - pool_size (int): pool size of the engine, used when the engine is created
+
+    Returns
+    -------
+        - Engine: shared engine, closed by dispose_shared_engine()
+    '''
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = connect_to_db_sqlalchemy(pool_size=pool_size)
+        return _shared_engine
+
+def dispose_shared_engine():
+    '''
+    Closes the connections of the shared engine, if any.
+    '''
+    global _shared_engine
+    with _shared_engine_lock:
+        engine, _shared_engine = _shared_engine, None
+    if engine is not None:
+        engine.dispose()
+        log_message('SQLALCHEMY connection closed')
+
 def execute_query_from_file_path(
-        sql_file_path: str, conn: Engine) -> Union[pd.DataFrame, str, None]:
+        sql_file_path: str, conn: Engine, render=None) -> Union[pd.DataFrame, str, None]:
     """
     Executes a SQL query from a specified file against a given database connection.
     This function reads a SQL query from a file, optionally processes the query using
@@ -152,6 +203,8 @@ def execute_query_from_file_path(
     Args:
         - sql_file (str): The path to the SQL file containing the query to execute.
         - conn (Engine): The database connection object.
+        - render (callable, optional): function applied to the query text before execution,
+          e.g. render_query with the flight phase bound (see query_builder).
 
     Returns
     -------
@@ -164,20 +217,204 @@ def execute_query_from_file_path(
         # Read the SQL query from the file
         with open(sql_file_path, "r") as file:
             query = file.read()
+            if render is not None:
+                query = render(query)
             query, timestamp_str_initial = load_and_replace_sql(query)
 
         # Fetch data from Fleet store and store it in a dataframe
 
+        start_time = dt.now()
         data = pd.read_sql_query(query, conn)
-        log_message(f"{os.path.basename(sql_file_path)} executed successfully!")
+        elapsed = (dt.now() - start_time).total_seconds()
+        n_bytes = data.memory_usage(deep=True).sum()
+        log_message(
+            f"{os.path.basename(sql_file_path)} executed successfully in {elapsed:.2f} seconds: "
+            f"{data.shape[0]} rows, {n_bytes / 1e6:.1f} MB")
 
         return data, timestamp_str_initial
     except Exception as e:
         log_message(f"Error executing {os.path.basename(sql_file_path)}: {e}")
         return None
 
+class ColumnarBuffer:
+    """
+    Append-only buffer of typed frames, stored as Arrow tables: strings and nullable
+    numbers take their columnar size only (no Python objects), and the chunks are only
+    concatenated once, when the frame is built.
+    """
+
+    def __init__(self):
+        self._tables = []
+        self._empty = None
+        self.n_rows = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self._tables)
+
+    def append(self, df: pd.DataFrame):
+        """
+        Appends a frame, all the frames must have the same columns and dtypes.
+        """
+        if self._empty is None:
+            self._empty = df.iloc[:0]
+        if not df.empty:
+            self._tables.append(pa.Table.from_pandas(df, preserve_index=False))
+            self.n_rows += len(df)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """
+        Builds the frame (with the pandas dtypes of the appended frames) and empties the buffer.
+        """
+        if not self._tables:
+            return pd.DataFrame() if self._empty is None else self._empty.copy()
+        table = pa.concat_tables(self._tables)
+        self._tables = []
+        return table.to_pandas()
+
+def clean_query_data(data: pd.DataFrame, flight_phase: str, pushdown: bool = False) -> pd.DataFrame:
+    """
+    Cleans a query output (or a chunk of it): removes the rows with NaNs, applies the
+    flight phase specific low/high limits and converts the temperatures from Kelvin to Celsius.
+
+    Parameters
+    ----------
+    Args:
+        - data (pd.DataFrame): query output
+        - flight_phase (str): flight phase
+        - pushdown (bool): the query was rendered by render_query, the limits and the
+          Celsius conversion are already applied by the server
+
+    Returns
+    -------
+        - pd.DataFrame: cleaned data
+    """
+    # Filter data query, remove NaNs
+    data = data.dropna()
+    if pushdown:
+        return data
+    data = filter_parameters(data, flight_phase)
+
+    # Convert temperatures from Kelvin to Celsius
+    for col in KELVIN_COLUMNS:
+        if col in data.columns:
+            data[col] = data[col] - KELVIN_TO_CELSIUS
+    return data
+
+def read_query_in_chunks(sql_file_path: str, conn: Engine, flight_phase: str,
+                         chunksize: int = 100_000, render=None, on_chunk=None,
+                         pushdown: bool = False) -> tuple:
+    """
+    Streaming version of execute_query_from_file_path followed by clean_query_data and
+    cast_query_dtypes: the query output is fetched chunksize rows at a time, and each chunk
+    is cleaned and typed before being appended to a ColumnarBuffer. The peak memory is set
+    by the chunk size and the size of the cleaned data, not by the size of the raw output.
+
+    Parameters
+    ----------
+    Args:
+        - sql_file_path (str): path of the SQL file containing the query to execute
+        - conn (Engine): database connection
+        - flight_phase (str): flight phase
+        - chunksize (int): number of rows fetched at a time
+        - render (callable, optional): function applied to the query text before execution,
+          e.g. query_builder.render_query
+        - on_chunk (callable, optional): called with each raw chunk before cleaning
+          (e.g. WatermarkLedger.observe)
+        - pushdown (bool): the limits and Celsius conversion are rendered in the query (see
+          query_builder.render_query), so they are not applied again to the chunks
+
+    Returns
+    -------
+        - data (pd.DataFrame): cleaned and typed data
+        - timestamp_str_initial (str): timestamp of the start of the query data extraction
+        - latest_ts: latest reportdatetime of the raw query output, None if the output is empty
+        - query_cols (list): columns of the query output
+    """
+    with open(sql_file_path, "r") as file:
+        query = file.read()
+    if render is not None:
+        query = render(query)
+    query, timestamp_str_initial = load_and_replace_sql(query)
+
+    start_time = dt.now()
+    buffer = ColumnarBuffer()
+    chunk_latest_ts = []
+    query_cols = []
+    n_rows_query = 0
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        query_cols = chunk.columns.to_list()
+        if chunk.empty:
+            continue
+        n_rows_query += len(chunk)
+        if on_chunk is not None:
+            on_chunk(chunk)
+        chunk_latest_ts.append(chunk['reportdatetime'].max())
+        buffer.append(cast_query_dtypes(clean_query_data(chunk, flight_phase, pushdown=pushdown)))
+
+    elapsed = (dt.now() - start_time).total_seconds()
+    log_message(
+        f"{os.path.basename(sql_file_path)} streamed successfully in {elapsed:.2f} seconds: "
+        f"{n_rows_query} rows fetched, {buffer.n_rows} rows kept, {buffer.nbytes / 1e6:.1f} MB buffered")
+    latest_ts = pd.Series(chunk_latest_ts).max() if chunk_latest_ts else None
+    data = buffer.to_pandas()
+    if data.empty and query_cols and data.columns.empty:
+        data = pd.DataFrame(columns=query_cols)
+    return data, timestamp_str_initial, latest_ts, query_cols
+
+def merge_query_data(data: pd.DataFrame, flight_phase: str, timestamp_dt: pd.Timestamp,
+                     query_cols: list, tail_state: TailStateStore = None,
+                     cast_dtypes: bool = True, ledger: WatermarkLedger = None) -> pd.DataFrame:
+    """
+    Merges cleaned query data with the historical data of the flight phase, flags the new
+    rows (reportdatetime > timestamp_dt, or above the watermarks of the ledger) and computes
+    'days_difference'.
+
+    Parameters
+    ----------
+    Args:
+        - data (pd.DataFrame): cleaned query output
+        - flight_phase (str): flight phase
+        - timestamp_dt (pd.Timestamp): start of the query data extraction
+        - query_cols (list): columns of the query output, used to drop duplicated rows
+        - tail_state (TailStateStore, optional): per-ESN bounded history used instead of the historical data
+        - cast_dtypes (bool): set the column types of data (False if already typed)
+        - ledger (WatermarkLedger, optional): watermarks the query was run from. With a
+          watermark the query rows were never fetched before, so they are not deduplicated
+          against the history
+
+    Returns
+    -------
+        - pd.DataFrame: merged data, newest first
+    """
+    data = df_merger_new(data, flight_phase, tail_state=tail_state, cast_dtypes=cast_dtypes)
+
+    # Apply date-based logic
+    new_rows = None if ledger is None else ledger.new_rows(data, flight_phase)
+    if new_rows is None:
+        new_rows = data["reportdatetime"] > timestamp_dt
+    data["NEW_FLAG"] = np.where(new_rows, 1, 0)
+
+    data = days_difference(data)
+    data = data.sort_values(by='reportdatetime',
+                            ascending=False).reset_index(drop=True)
+    if ledger is not None and ledger.watermark(flight_phase) is not None:
+        return data
+    # Drop duplicates from query columns
+    return data.drop_duplicates(subset=query_cols, keep= 'first', ignore_index=True)
+
+def _render_from_watermarks(query: str, ledger: WatermarkLedger, flight_phase: str, render=None) -> str:
+    query = ledger.render(query, flight_phase)
+    return query if render is None else render(query)
+
 def query_run(file_name: str, flight_phase: str, timestamp_container: list,
-              query_folder: str = 'Queries') -> tuple[pd.DataFrame, str, list]:
+              query_folder: str = 'Queries',
+              tail_state: TailStateStore = None,
+              engine: Engine = None,
+              chunksize: int = None,
+              pushdown: bool = False,
+              pushdown_deltas: bool = False,
+              ledger: WatermarkLedger = None) -> tuple[pd.DataFrame, str, list]:
     """
     RUN SINGLE SQL QUERY, file_name, IN query_folder for a specific flight phases. Data from query's output
      in then processed as follows:
@@ -197,6 +434,16 @@ def query_run(file_name: str, flight_phase: str, timestamp_container: list,
         - flight_phase: str, string for flight phase.
         - timestamp_container: list, list of timestamp needed for the next run of the whole script.
         - query_folder: str, folder containing all SQL queries files.
+        - tail_state: TailStateStore = None, per-ESN bounded history used instead of the historical CSV.
+        - engine: Engine = None, pooled engine to run the query with (left open), a new engine
+          is created and disposed if None.
+        - chunksize: int = None, if given the query output is streamed chunksize rows at a time,
+          each chunk being cleaned and typed on arrival (see read_query_in_chunks).
+        - pushdown: bool = False, render the query with the flight phase limits as WHERE predicates
+          and the temperatures converted to Celsius by the server (see query_builder.render_query).
+        - pushdown_deltas: bool = False, with pushdown, the query also returns the Loop 0 deltas.
+        - ledger: WatermarkLedger = None, only the rows above the watermarks of the flight phase
+          are fetched, the watermarks of the query output are staged in the ledger.
 
     Return:
     -------
@@ -207,68 +454,83 @@ def query_run(file_name: str, flight_phase: str, timestamp_container: list,
      """
     try:
         file_path = os.path.join(query_folder, file_name)
-        conn = connect_to_db_sqlalchemy()
-        data, timestamp_str_initial = execute_query_from_file_path(file_path, conn)
-        conn.dispose()
-        log_message('SQLALCHEMY connection closed')
+        conn = connect_to_db_sqlalchemy() if engine is None else engine
+        render = None
+        if pushdown:
+            render = partial(render_query, flight_phase=flight_phase, deltas=pushdown_deltas)
+        on_chunk = None
+        if ledger is not None:
+            render = partial(_render_from_watermarks, ledger=ledger, flight_phase=flight_phase, render=render)
+            on_chunk = partial(ledger.observe, flight_phase)
+        if chunksize:
+            # Chunks are cleaned and typed as they are fetched
+            data, timestamp_str_initial, latest_ts, query_cols = read_query_in_chunks(
+                file_path, conn, flight_phase, chunksize, render=render, on_chunk=on_chunk,
+                pushdown=pushdown)
+        else:
+            data, timestamp_str_initial = execute_query_from_file_path(file_path, conn, render=render)
+            latest_ts = None if data.empty else data['reportdatetime'].max()
+            query_cols = data.columns.to_list()
+            if on_chunk is not None:
+                on_chunk(data)
+        if engine is None:
+            conn.dispose()
+            log_message('SQLALCHEMY connection closed')
 
 
-        if not data.empty:
+        if latest_ts is not None:
             log_message(f"Query succesfully executed for {flight_phase}, data found")
 
             # extract latest timestamp from the query just run
-            latest_ts = data['reportdatetime'].max()
             timestamp_container.append(latest_ts)
             log_message(f"Latest timestamp for {flight_phase}'s Query: {latest_ts}")
 
-            # Filter data query, remove NaNs 
-            query_cols = data.columns.to_list()
-            data = data.dropna() 
-            data = filter_parameters(data, flight_phase)
+            # Filter data query (NaNs and limits) and convert temperatures from Kelvin to Celsius
+            if not chunksize:
+                data = clean_query_data(data, flight_phase, pushdown=pushdown)
             log_message(f"{flight_phase.capitalize()}'s Query succesfully filtered")
-
-            # Convert temperatures from Kelvin to Celsius
-            cols_in_Kelvin = ["TS25S__NOM_K", "TS30S__NOM_K", "TGTS__NOM_K"]
-            for col in cols_in_Kelvin:
-                if col in data.columns:
-                    data[col] = data[col] - 273.15
             log_message(f"{flight_phase.capitalize()}'s Query Kelvin data converted to Celsius")
 
 
             # Merge Query output (data) with historical data, if any if found
-            data = df_merger_new(data, flight_phase)
-            
-            # Apply date-based logic
+            # (streamed chunks are already typed)
             timestamp_dt = pd.to_datetime(timestamp_str_initial, format='%Y-%m-%d %H:%M:%S')
-            
-            data["NEW_FLAG"] = np.where(
-                data["reportdatetime"] > timestamp_dt, 1, 0
-            )
-             
-            data = days_difference(data)
-            data = data.sort_values(by='reportdatetime',
-                                    ascending=False).reset_index(drop=True)
-            # Drop duplicates from query columns
-            data = data.drop_duplicates(subset=query_cols, keep= 'first', ignore_index=True)
+            data = merge_query_data(data, flight_phase, timestamp_dt, query_cols,
+                                    tail_state=tail_state, cast_dtypes=not chunksize, ledger=ledger)
 
         return data, timestamp_str_initial, timestamp_container
     except Exception as e:
         log_message(
             f"        ERROR in {debug_info()} for flight phase:{flight_phase} - {e}")
 
-def data_ingestion(root_dir: str = os.getcwd()) -> dict:
+def data_ingestion(root_dir: str = os.getcwd(), use_tail_state: bool = False,
+                   max_parallel_queries: int = 3, chunksize: int = None,
+                   pushdown: bool = False, pushdown_deltas: bool = False,
+                   ledger: WatermarkLedger = None, per_operator_watermarks: bool = False) -> dict:
     """
     Extracts flight phase data from SQL query files and saves them as CSV files.
     This function searches for SQL files corresponding to different flight phases
-    (CRZ, CLM, TKO) in the 'Queries' subdirectory of the given path. For each
-    matching file, it executes the SQL query using a database connection, and if
-    the result is not empty, saves the data as a CSV file in the 'Fleetstore_Data'
+    (CRZ, CLM, TKO) in the 'Queries' subdirectory of the given path. The queries run
+    concurrently (up to max_parallel_queries at once) on a single pooled engine, and
+    if the result is not empty, saves the data as a CSV file in the 'Fleetstore_Data'
     subdirectory. The database connection is closed after processing all files.
 
     Parameters
     ----------
     Args:
         - root_dir (str): The base directory path containing 'Queries' and 'Fleetstore_Data' subdirectories.
+        - use_tail_state (bool): If True, new data is merged with the per-ESN tail state of each
+          flight phase (see TailStateStore) instead of the whole historical CSV.
+        - max_parallel_queries (int): maximum number of queries running at once (1 runs them
+          one after the other), also the pool size of the engine.
+        - chunksize (int, optional): if given, the query outputs are streamed and cleaned
+          chunksize rows at a time (see read_query_in_chunks), to bound the peak memory.
+        - pushdown (bool): the limits filter and Celsius conversion run in the queries (see query_builder)
+        - pushdown_deltas (bool): with pushdown, the queries also return the Loop 0 deltas
+        - ledger (WatermarkLedger, optional): per-phase watermarks the queries run from. The
+          caller commits it once the run outputs are saved. If None, the ledger
+          working_data/watermarks.json is used and committed once all the queries succeeded
+        - per_operator_watermarks (bool): without ledger given, keep a watermark per operator
 
     Raises
     ------
@@ -286,7 +548,6 @@ def data_ingestion(root_dir: str = os.getcwd()) -> dict:
     log_message("Start Data extraction")
 
     query_folder = os.path.join(root_dir, 'Queries')
-    SQL_queries = os.listdir(query_folder)
     keys = ['cruise', 'climb', 'take-off']
     data_dict = {key: None for key in keys}
     timestamps = []
@@ -294,13 +555,64 @@ def data_ingestion(root_dir: str = os.getcwd()) -> dict:
         'CRZ.sql': 'Cruise',
         'CLM.sql': 'Climb',
         'TKO.sql': 'Take-off'}
-    for SQL_query in SQL_queries:
+    # Other files of the query folder are skipped (as in backfill_phases)
+    SQL_queries = []
+    for SQL_query in os.listdir(query_folder):
+        if flight_phases.get(SQL_query[-7:]) is None:
+            log_message(f" {SQL_query} is not a flight phase query, skipped")
+            continue
+        SQL_queries.append(SQL_query)
+    max_parallel_queries = max(1, min(max_parallel_queries, len(SQL_queries)))
+    commit_ledger = ledger is None
+    if ledger is None:
+        ledger = WatermarkLedger(os.path.join(root_dir, "working_data", "watermarks.json"),
+                                 per_operator=per_operator_watermarks)
+    engine = get_shared_engine(pool_size=max_parallel_queries)
+
+    def run_phase_query(SQL_query: str) -> tuple:
         flight_phase = flight_phases[SQL_query[-7:]]
-        data, timestamp_str_initial, timestamps = query_run(
-            SQL_query, flight_phase, timestamps)
+        tail_state = None
+        if use_tail_state:
+            tail_state = TailStateStore(os.path.join(root_dir, 'Fleetstore_Data'), flight_phase.lower())
+        start_time = dt.now()
+        # Each query has its own timestamp list, merged below
+        result = query_run(
+            SQL_query, flight_phase, [], query_folder=query_folder,
+            tail_state=tail_state, engine=engine, chunksize=chunksize,
+            pushdown=pushdown, pushdown_deltas=pushdown_deltas, ledger=ledger)
+        if result is None:
+            # query_run logged the error: the other phases go on, the marks of this one
+            # are not committed so that its rows are fetched again by the next run
+            ledger.discard(flight_phase)
+            log_message(f"{flight_phase} ingestion FAILED, no data for this flight phase")
+            return flight_phase, None, None, []
+        data, timestamp_str_initial, phase_timestamps = result
+        log_message(
+            f"{flight_phase} ingestion completed in {(dt.now() - start_time).total_seconds():.2f} seconds")
+        return flight_phase, data, timestamp_str_initial, phase_timestamps
+
+    start_time = dt.now()
+    try:
+        with ThreadPoolExecutor(max_workers=max_parallel_queries) as executor:
+            results = list(executor.map(run_phase_query, SQL_queries))
+    finally:
+        dispose_shared_engine()
+    for flight_phase, data, timestamp_str_initial, phase_timestamps in results:
         data_dict[flight_phase.lower()] = data
-        
-    # Write tmstp to working_data\timestamp.txt (overwrite if exists)
+        timestamps.extend(phase_timestamps)
+    log_message(
+        f"{len(SQL_queries)} queries completed in {(dt.now() - start_time).total_seconds():.2f} seconds "
+        f"({max_parallel_queries} at once)")
+
+    if commit_ledger:
+        ledger.commit()
+
+    # Write tmstp to working_data\timestamp.txt (overwrite if exists), start of the
+    # flight phases without watermark yet. Without new data (all the phases above
+    # their watermarks) the previous timestamp is kept
+    if not timestamps:
+        log_message(" No new data found, timestamp.txt not updated")
+        return data_dict
     tmstp = min(timestamps)
     output_txt = os.path.join(root_dir, "working_data")
     output_txt = os.path.join(output_txt, "timestamp.txt")
@@ -2,6 +2,40 @@ import os
 import pandas as pd
 from src.utils.log_file import LOG_FILE, log_message, debug_info, f_lineno as line
 from src.utils.read_and_clean_v1 import read_and_clean_csv
+from src.utils.tail_state_store import TailStateStore
+from src.utils.storage import find_data_files, storage_format, read_frame
+from src.utils.snapshot_writer import save_snapshot
+
+
+def cast_query_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sets the column types of a query output: int64 identifiers, datetimes, strings and
+    Float64 parameters (rounded to 5 decimal places).
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): query output (or a chunk of it)
+
+    Returns
+    -------
+        - pd.DataFrame: typed copy of df
+    """
+    df_out = df.copy()
+    # ATTENTION - changed "object" to "string" it might be problematic
+    cols_list_int64 = ['ESN', 'equipmentid', 'ENGPOS', 'DSCID']
+    cols_list_datetime = ['reportdatetime', 'datestored']
+    cols_list_object = ['operator', 'ACID']
+    cols_list_float = [col for col in df_out.columns if col not in cols_list_int64+cols_list_datetime+cols_list_object ]
+
+    df_out[cols_list_int64] = df_out[cols_list_int64].astype('int64')
+    df_out[cols_list_datetime] = df_out[cols_list_datetime].astype('datetime64[ns]')
+    df_out[cols_list_object] = df_out[cols_list_object].astype('string')
+    df_out[cols_list_float] = df_out[cols_list_float].astype('Float64')
+
+    # Round the appropriate float columns to 5 decimal places
+    df_out[cols_list_float] = df_out[cols_list_float].round(5)
+    return df_out
 
 
 def df_merger_new(
@@ -9,10 +43,12 @@ def df_merger_new(
     flight_phase: str = None,
     n_pts: int = 650,
     DebugOption: int = 0,
-    data_str: str = 'data_output_'
+    data_str: str = 'data_output_',
+    tail_state: TailStateStore = None,
+    cast_dtypes: bool = True
 ) -> pd.DataFrame:
     """
-    Merge historical data stored in CSV format (filename is indicated by CSV_str),
+    Merge historical data stored in Parquet or CSV format (filename is indicated by CSV_str),
     with result from current data query.
 
     Parameters
@@ -25,45 +61,41 @@ def df_merger_new(
          - DebugOption: int = 1, option to create and save a copy of the data in CSV format
          - data_str: str = 'data_output_', substring used to identify the historical
            data from previous run
+         - tail_state: TailStateStore = None, per-ESN bounded history from previous runs.
+           If given, only the stored tails of the ESNs in df are merged, instead of the
+           whole historical CSV
+         - cast_dtypes: bool = True, set the column types of df (see cast_query_dtypes),
+           False if df is already typed (e.g. built chunk by chunk by query_run)
 
     Return
     ------
          - df: pd.DataFrame, DataFrame containing merged and trimmed data
     """
-    # Create a copy of the input df to prevent warnings
-    df_out = df.copy()
-
     # Set the proper columns type for each one in df_out (query output)
-    # ATTENTION - changed "object" to "string" it might be problematic
+    df_out = cast_query_dtypes(df) if cast_dtypes else df
     query_columns = df_out.columns
-    
-    cols_list_int64 = ['ESN', 'equipmentid', 'ENGPOS', 'DSCID']
-    cols_list_datetime = ['reportdatetime', 'datestored']
-    cols_list_object = ['operator', 'ACID']
-    cols_list_float = [col for col in query_columns if col not in cols_list_int64+cols_list_datetime+cols_list_object ]
-    
-    df_out[cols_list_int64] = df_out[cols_list_int64].astype('int64')
-    df_out[cols_list_datetime] = df_out[cols_list_datetime].astype('datetime64[ns]')
-    df_out[cols_list_object] = df_out[cols_list_object].astype('string')
-    df_out[cols_list_float] = df_out[cols_list_float].astype('Float64')
-    
-    # Round the appropriate float columns to 5 decimal places
-    df_out[cols_list_float] = df_out[cols_list_float].round(5)
+
     # Search for flight phase specific csv data from previous run
     current_dir = os.getcwd()
     FleetStore_dir = os.path.join(current_dir, "Fleetstore_Data")
-    FleetStore_files_list = os.listdir(FleetStore_dir)
-    CSV_str = [
-        file for file in FleetStore_files_list
-        if data_str.lower() in file.lower()
-        and flight_phase.lower() in file.lower()
-    ]
+    CSV_str = find_data_files(FleetStore_dir, data_str, flight_phase)
+    # If a tail state is found, merge df_out with the stored tails of its ESNs only
+    # (without state yet, the historical CSV is used to bootstrap it)
+    use_tail_state = tail_state is not None and tail_state.exists()
+    if use_tail_state:
+        log_message(f"{debug_info()}  previous {flight_phase} tail state found")
+        df_previous = tail_state.load(esns=df_out['ESN'].unique())
+        concatenated_df = pd.concat([df_previous, df_out], ignore_index=True)
+
     # If flight phase specific csv data from previous run is found loads nad merge data with df_out
-    if CSV_str:
+    elif CSV_str:
         log_message(f"{debug_info()}  previous {flight_phase} data file found")
 
         file_path = os.path.join(FleetStore_dir, CSV_str[0])
-        df_previous = read_and_clean_csv(file_path)
+        if storage_format(file_path) == "parquet":
+            df_previous = read_frame(file_path)
+        else:
+            df_previous = read_and_clean_csv(file_path)
         concatenated_df = pd.concat([df_previous, df_out], ignore_index=True)
         
         
@@ -83,14 +115,11 @@ def df_merger_new(
 
         
         # SUBROUTINE to concatenate top n_pts by ESN
-        # Keep only the top n_pts rows per ESN
-        df_merged = (
-            concatenated_df
-            .sort_values(by="reportdatetime", ascending=False)
-            .groupby("ESN", group_keys=False)
-            .head(n_pts)
-            .reset_index(drop=True)
-        )
+        # Keep only the top n_pts rows per ESN (also with a tail state: the Loop 8 buffer
+        # rows kept on top of the tail could exceed it)
+        df_merged = concatenated_df.sort_values(by="reportdatetime", ascending=False)
+        df_merged = df_merged.groupby("ESN", group_keys=False).head(n_pts)
+        df_merged = df_merged.reset_index(drop=True)
 
         # Concatenate once at the end
         df_merged = df_merged.sort_values(  by='reportdatetime',
@@ -99,8 +128,7 @@ def df_merger_new(
         if DebugOption == 1:
             path_temp = os.path.join(
                 FleetStore_dir, f"Merged_data_{flight_phase}.csv")
-            log_message(f"{debug_info()}  Merged data saved to: {path_temp}")
-            df_merged.to_csv(path_temp, index=False)
+            save_snapshot(df_merged, path_temp, stage="Merged_data")
 
         return df_merged
     except Exception as e:
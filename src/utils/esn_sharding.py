@@ -0,0 +1,115 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.utils.frame_transport import (
+    frame_from_shared_memory,
+    frame_to_shared_memory,
+    release_shared_memory,
+)
+
+
+def balanced_esn_shards(esn: pd.Series, n_shards: int) -> list:
+    """
+    Partitions the ESNs of a frame into shards of balanced row counts.
+
+    ESNs are assigned from the largest to the smallest, each one to the shard with the
+    fewest rows so far (longest processing time first).
+
+    Parameters
+    ----------
+    Args:
+        - esn (pd.Series): ESN column of the frame
+        - n_shards (int): maximum number of shards
+
+    Returns
+    -------
+        - list: one np.ndarray of ESNs per non-empty shard
+    """
+    counts = esn.value_counts(sort=True)
+    n_shards = max(1, min(n_shards, len(counts)))
+    loads = [(0, shard) for shard in range(n_shards)]
+    shards = [[] for _ in range(n_shards)]
+    for value, count in counts.items():
+        load, shard = heapq.heappop(loads)
+        shards[shard].append(value)
+        heapq.heappush(loads, (load + count, shard))
+    return [np.array(shard) for shard in shards if shard]
+
+
+def _run_shard_in_worker(kernel, handle: tuple, kwargs: dict) -> tuple:
+    """
+    Runs the kernel on a shard in a pool worker, frames exchanged through shared memory
+    (the input block is freed by the parent process, the output block by the parent too).
+    """
+    df = frame_from_shared_memory(handle, unlink=False)
+    return frame_to_shared_memory(kernel(df, **kwargs))
+
+
+def map_esn_shards(
+    df: pd.DataFrame,
+    kernel,
+    n_jobs: int = 1,
+    esns: list = None,
+    **kwargs
+) -> pd.DataFrame:
+    """
+    Runs a per-ESN kernel on the ESNs of a frame, split in shards processed in parallel.
+
+    The kernel is called as kernel(df_shard, **kwargs), with df_shard holding all the rows
+    (in the order of df) of some of the ESNs, and must return a frame with an "ESN" column
+    where each ESN is only computed from its own rows. The outputs are reassembled in the
+    order of the ESNs (esns, or order of first appearance in df), so the result does not
+    depend on n_jobs.
+
+    With n_jobs > 1 the shards (balanced by row count) run in a process pool: the kernel and
+    kwargs are pickled (module-level objects only), the frames go through shared memory.
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): input data, with an "ESN" column
+        - kernel: per-ESN function
+        - n_jobs (int): number of worker processes, -1 for all the cores, 1 runs the kernel
+          once in the calling process
+        - esns (list, optional): ESNs to process, all the ESNs of df if None
+        - kwargs: other arguments of the kernel
+
+    Returns
+    -------
+        - pd.DataFrame: kernel outputs of the ESNs, in ESN order
+    """
+    if n_jobs is None or n_jobs == 0:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+
+    if esns is None:
+        esns = df["ESN"].unique()
+    df = df[df["ESN"].isin(esns)]
+    if n_jobs == 1 or df["ESN"].nunique() <= 1:
+        return kernel(df, **kwargs)
+
+    shards = balanced_esn_shards(df["ESN"], n_jobs)
+    handles = [frame_to_shared_memory(df[df["ESN"].isin(shard)]) for shard in shards]
+    try:
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(_run_shard_in_worker, kernel, handle, kwargs) for handle in handles]
+            # Wait for all the shards, so that every output block can be freed on error
+            output_handles = [future.exception() or future.result() for future in futures]
+    finally:
+        for handle in handles:
+            release_shared_memory(handle)
+
+    errors = [handle for handle in output_handles if isinstance(handle, BaseException)]
+    outputs = [frame_from_shared_memory(handle) for handle in output_handles
+               if not isinstance(handle, BaseException)]
+    if errors:
+        raise errors[0]
+
+    df_out = pd.concat(outputs, ignore_index=True)
+    # Reassemble in ESN order, keeping the kernel order within each ESN
+    esn_rank = pd.Series(np.arange(len(esns)), index=pd.Index(esns))
+    order = np.argsort(esn_rank.reindex(df_out["ESN"]).to_numpy(), kind="stable")
+    return df_out.iloc[order].reset_index(drop=True)
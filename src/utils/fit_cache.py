@@ -0,0 +1,190 @@
+import hashlib
+import sqlite3
+import numpy as np
+from src.utils.signature_solver import MAX_ERROR_REL, MAX_MAGNITUDE_RATIO
+
+# Solver output stored per observation vector (see solve_signature_fits)
+_FIT_COLUMNS = ['obs_mag', 'combo', 'coeff1', 'coeff2', 'coeff3',
+                'mag1', 'mag2', 'mag3', 'error_rel', 'error_mag']
+
+# Max number of keys per SQL query
+_SQL_BATCH = 500
+
+
+def fit_fingerprint(signature_combos: list, decimals: int = 5, search: str = "exact") -> str:
+    """
+    Fingerprint of everything a cached fit depends on: the signature combinations
+    (matrices, norms, identifiers and order), the acceptance thresholds, the
+    quantization of the observation vectors and the search mode.
+
+    Parameters
+    ----------
+    Args:
+        - signature_combos (list): list of (F, norms, ids) tuples
+        - decimals (int): decimal digits the observation vectors are quantized to
+        - search (str): "exact" for the exhaustive (or exact pruned) search, a different
+          label for each approximate search setting
+
+    Returns
+    -------
+        - str: hexadecimal digest
+    """
+    h = hashlib.sha1()
+    h.update(repr((MAX_ERROR_REL, MAX_MAGNITUDE_RATIO, decimals, search)).encode())
+    for F, norms, ids in signature_combos:
+        h.update(np.ascontiguousarray(F, dtype=float).tobytes())
+        h.update(np.ascontiguousarray(norms, dtype=float).tobytes())
+        h.update(repr([str(i) for i in ids]).encode())
+    return h.hexdigest()
+
+
+class FitCache:
+    """
+    On-disk (SQLite) memo cache of Loop 6 best-fit results.
+
+    Entries are keyed by a hash of the quantized observation vector and of the
+    fingerprint of the signature combinations, so a change of Xrates or thresholds
+    never returns stale fits. The cache is bounded to max_entries, the least
+    recently used entries are evicted first.
+
+    Parameters
+    ----------
+    Args:
+        - path (str): SQLite database file
+        - fingerprint (str): output of fit_fingerprint for the current signatures
+        - max_entries (int): maximum number of cached fits
+        - decimals (int): decimal digits the observation vectors are quantized to
+    """
+
+    def __init__(self, path: str, fingerprint: str, max_entries: int = 500_000, decimals: int = 5):
+        self.path = path
+        self.fingerprint = fingerprint.encode()
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.conn = sqlite3.connect(path, timeout=60)
+        columns = ", ".join(f"{col} REAL" for col in _FIT_COLUMNS)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS fits (key TEXT PRIMARY KEY, {columns}, used INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fits_used ON fits (used)")
+        self.conn.commit()
+        # Recency counter of the LRU eviction
+        self._used = self.conn.execute("SELECT COALESCE(MAX(used), 0) FROM fits").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _tick(self) -> int:
+        self._used += 1
+        return self._used
+
+    def keys(self, obs: np.ndarray) -> list:
+        """
+        Cache keys of the observation vectors, None for rows containing NaN.
+        """
+        quantized = np.round(np.asarray(obs, dtype=float), self.decimals) + 0.0  # -0.0 -> 0.0
+        keys = []
+        for row in quantized:
+            if np.isnan(row).any():
+                keys.append(None)
+            else:
+                keys.append(hashlib.sha1(self.fingerprint + row.tobytes()).hexdigest())
+        return keys
+
+    def lookup(self, obs: np.ndarray) -> tuple:
+        """
+        Looks up the fits of the observation vectors.
+
+        Returns
+        -------
+            - keys (list): cache key of every row
+            - hit (np.ndarray): boolean mask of the rows found in the cache
+            - fits (dict): solver output arrays (see solve_signature_fits), filled for hit rows
+        """
+        keys = self.keys(obs)
+        n_rows = len(keys)
+        fits = {
+            'obs_mag': np.full(n_rows, np.nan),
+            'combo': np.full(n_rows, -1, dtype=np.int64),
+            'coeffs': np.full((n_rows, 3), np.nan),
+            'magnitudes': np.full((n_rows, 3), np.nan),
+            'error_rel': np.full(n_rows, np.nan),
+            'error_mag': np.full(n_rows, np.nan),
+        }
+        hit = np.zeros(n_rows, dtype=bool)
+
+        rows_by_key = {}
+        for r, key in enumerate(keys):
+            if key is not None:
+                rows_by_key.setdefault(key, []).append(r)
+        unique_keys = list(rows_by_key)
+
+        found = []
+        for start in range(0, len(unique_keys), _SQL_BATCH):
+            batch = unique_keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            found += self.conn.execute(
+                f"SELECT key, {', '.join(_FIT_COLUMNS)} FROM fits WHERE key IN ({placeholders})",
+                batch).fetchall()
+
+        for key, *values in found:
+            # SQLite stores NaN as NULL
+            obs_mag, combo, c1, c2, c3, m1, m2, m3, err_rel, err_mag = (
+                np.nan if v is None else v for v in values)
+            rows = rows_by_key[key]
+            hit[rows] = True
+            fits['obs_mag'][rows] = obs_mag
+            fits['combo'][rows] = int(combo)
+            fits['coeffs'][rows] = [c1, c2, c3]
+            fits['magnitudes'][rows] = [m1, m2, m3]
+            fits['error_rel'][rows] = err_rel
+            fits['error_mag'][rows] = err_mag
+
+        # Refresh the recency of the entries used
+        if found:
+            used = self._tick()
+            self.conn.executemany(
+                "UPDATE fits SET used = ? WHERE key = ?", [(used, row[0]) for row in found])
+            self.conn.commit()
+        return keys, hit, fits
+
+    def store(self, keys: list, fits: dict, rows: np.ndarray):
+        """
+        Stores the fits of the selected rows and evicts the least recently used entries
+        above max_entries.
+
+        Parameters
+        ----------
+        Args:
+            - keys (list): cache keys returned by lookup
+            - fits (dict): solver output arrays
+            - rows (np.ndarray): boolean mask of the rows to store
+        """
+        used = self._tick()
+        records = []
+        for r in np.flatnonzero(rows):
+            if keys[r] is None:
+                continue
+            records.append((
+                keys[r], float(fits['obs_mag'][r]), int(fits['combo'][r]),
+                *map(float, fits['coeffs'][r]), *map(float, fits['magnitudes'][r]),
+                float(fits['error_rel'][r]), float(fits['error_mag'][r]), used))
+        if not records:
+            return
+        placeholders = ",".join("?" * (len(_FIT_COLUMNS) + 2))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO fits (key, {', '.join(_FIT_COLUMNS)}, used) VALUES ({placeholders})",
+            records)
+
+        # Size-bounded LRU eviction
+        n_entries = self.conn.execute("SELECT COUNT(*) FROM fits").fetchone()[0]
+        if n_entries > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM fits WHERE key IN (SELECT key FROM fits ORDER BY used ASC LIMIT ?)",
+                (n_entries - self.max_entries,))
+        self.conn.commit()
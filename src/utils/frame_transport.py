@@ -0,0 +1,107 @@
+import pickle
+from multiprocessing import shared_memory
+import pandas as pd
+import pyarrow as pa
+from src.utils.log_file import log_message
+
+
+def frame_to_shared_memory(df: pd.DataFrame) -> tuple:
+    """
+    Writes a DataFrame to a new shared memory block, to hand it to another process
+    without pickling it through a pipe.
+
+    The frame is encoded as an Arrow IPC stream written directly into the block (the
+    pandas dtypes and index are kept in the Arrow schema metadata). Frames Arrow cannot
+    encode (e.g. object columns mixing numbers and strings) are pickled into the block.
+
+    The block stays allocated until frame_from_shared_memory (or release_shared_memory)
+    is called with the returned handle.
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): frame to share
+
+    Returns
+    -------
+        - tuple: handle (block name, number of bytes, "arrow" or "pickle")
+    """
+    try:
+        table = pa.Table.from_pandas(df)
+        encoding = "arrow"
+        sink = pa.MockOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        size = sink.size()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        log_message(f"Arrow cannot encode the frame ({e}), pickled into shared memory")
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        encoding = "pickle"
+        size = len(payload)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        if encoding == "arrow":
+            buffer = pa.py_buffer(shm.buf)
+            stream = pa.FixedSizeBufferWriter(buffer)
+            with pa.ipc.new_stream(stream, table.schema) as writer:
+                writer.write_table(table)
+            stream.close()
+            # Drop the views on the block, it cannot be closed while they exist
+            del writer, stream, buffer
+        else:
+            shm.buf[:size] = payload
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return shm.name, size, encoding
+
+
+def frame_from_shared_memory(handle: tuple, unlink: bool = True) -> pd.DataFrame:
+    """
+    Reads a DataFrame written by frame_to_shared_memory.
+
+    Parameters
+    ----------
+    Args:
+        - handle (tuple): handle returned by frame_to_shared_memory
+        - unlink (bool): free the shared memory block once read (set to False when the
+          process which created the block is in charge of freeing it)
+
+    Returns
+    -------
+        - pd.DataFrame: frame, in memory owned by the calling process
+    """
+    name, size, encoding = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if encoding == "arrow":
+            buffer = pa.py_buffer(shm.buf)[:size]
+            with pa.ipc.open_stream(buffer) as reader:
+                table = reader.read_all()
+            # to_pandas copies the columns out of the block but the index can be a view
+            # on it: copy it too, so that the block can be freed
+            df = table.to_pandas()
+            df.index = df.index.copy(deep=True)
+            del table, reader, buffer
+        else:
+            df = pickle.loads(shm.buf[:size])
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    return df
+
+
+def release_shared_memory(handle: tuple):
+    """
+    Frees the shared memory block of a handle without reading it.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=handle[0])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
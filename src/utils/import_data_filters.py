@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from src.utils.parameter_table import limits_table
 
 
 def drop_nans(df: pd.DataFrame) -> pd.DataFrame:
@@ -60,28 +61,8 @@ def filter_parameters(df: pd.DataFrame, flight_phase: str) -> pd.DataFrame:
     pd.DataFrame
         Filtered DataFrame
     """
-    # Define parameters and limits
-    Param = [
-        'P25__PSI', 'T25__DEGC', 'P30__PSI', 'T30__DEGC', 'TGTU_A__DEGC',
-        'NL__PC', 'NI__PC', 'NH__PC', 'FF__LBHR', 'ALT__FT', 'MN1'
-    ]
-
-    rows_names = [
-        'Take-off low limits', 'Take-off high limits',
-        'Climb low limits', 'Climb high limits',
-        'Cruise low limits', 'Cruise high limits'
-    ]
-
-    lims = [
-        [50, 200, 400, 500, 650, 60, 75, 75, 10000, -1000, 0.175],
-        [200, 400, 800, 800, 1000, 120, 120, 120, 25000, 9000, 0.320],
-        [50, 200, 250, 450, 650, 60, 75, 75, 8000, 15000, 0.500],
-        [100, 350, 500, 700, 900, 120, 120, 120, 16000, 25000, 0.770],
-        [25, 170, 130, 330, 380, 60, 75, 75, 3000, 25000, 0.700],
-        [60, 280, 270, 590, 900, 120, 120, 120, 8500, 43000, 0.880]
-    ]
-
-    limits_DSCs = pd.DataFrame(lims, columns=Param, index=rows_names)
+    # Limits table, derived from the parameter -> nominal mapping table
+    limits_DSCs = limits_table()
 
     # Normalize flight_phase for matching
     flight_phase = flight_phase.lower()
@@ -94,7 +75,8 @@ def filter_parameters(df: pd.DataFrame, flight_phase: str) -> pd.DataFrame:
 
     limits_flight_phase = limits_DSCs.loc[matching_rows]
 
-    # Apply filtering
+    # Build a single mask over all the parameters, then filter once
+    mask = np.ones(len(df), dtype=bool)
     for parameter in limits_flight_phase.columns:
         try:
             lower_limit, upper_limit = limits_flight_phase[parameter].tolist()
@@ -103,7 +85,9 @@ def filter_parameters(df: pd.DataFrame, flight_phase: str) -> pd.DataFrame:
                 f"Expected two limits for parameter '{parameter}', got {limits_flight_phase[parameter].tolist()}")
 
         if parameter in df.columns:
-            df = df[(df[parameter] >= lower_limit) &
-                    (df[parameter] <= upper_limit)]
+            values = df[parameter].to_numpy(dtype=float, na_value=np.nan)
+            mask &= (values >= lower_limit) & (values <= upper_limit)
+
+    df = df[mask]
 
     return df
@@ -2,6 +2,7 @@ from pprint import pprint as pp
 import os
 import pandas as pd
 from src.utils.read_and_clean_v1 import read_and_clean_csv
+from src.utils.storage import find_data_files, read_frame
 from src.utils.log_file import LOG_FILE, log_message
 
 
@@ -9,7 +10,8 @@ def load_temp_data(
         LOOP_str: str,
         Fleetstore_dir: str = 'Fleetstore_Data') -> dict:
     """
-    Function used to load CSV data manually based on the processing stage contained in LOOP_str.
+    Function used to load data manually based on the processing stage contained in LOOP_str.
+    Parquet files are preferred over CSV files holding the same data.
 
     Parameters
     ----------
@@ -24,14 +26,13 @@ def load_temp_data(
     rootdir = os.getcwd()
     Fleetstore_path = os.path.join(rootdir, Fleetstore_dir)
 
-    file_list = [file for file in os.listdir(Fleetstore_path) if LOOP_str.lower(
-    ) in file.lower()]  # gets the files containing LOOP_str
+    file_list = find_data_files(Fleetstore_path, LOOP_str)  # gets the files containing LOOP_str
 
     data_dict = {}
     for file in file_list:
         file_path = os.path.join(Fleetstore_path, file)
 
-        df_temp = read_and_clean_csv(file_path)  # reads and clean csv file
+        df_temp = read_frame(file_path)  # reads parquet, or reads and clean csv file
 
         flight_phases = ["take-off", "climb", "cruise"]
         flight_phase = [
@@ -104,6 +104,120 @@ def merge_flight_phases(
     
     return merged_df
 
+def _previous_event_asof(
+    df_left: pd.DataFrame,
+    df_phase: pd.DataFrame,
+    phase: str,
+    max_delta: pd.Timedelta,
+) -> pd.DataFrame:
+    """Attach to each cruise row the last event of a phase strictly before it.
+
+    Backward as-of join on the installation key code '_key'. Events older than
+    max_delta are discarded; when several events share the matched timestamp the
+    first one is kept.
+
+    Args:
+        df_left (pd.DataFrame): Cruise rows with '_key', sorted by 'reportdatetime_cruise', without NaT.
+        df_phase (pd.DataFrame): Phase records with '_key', 'reportdatetime' and 'row_sum'.
+        phase (str): Phase suffix of the output columns, e.g. "takeoff".
+        max_delta (pd.Timedelta): Exclusive time tolerance.
+
+    Returns:
+        pd.DataFrame: df_left with 'reportdatetime_{phase}' and 'row_sum_{phase}' columns.
+    """
+    time_col, sum_col = f"reportdatetime_{phase}", f"row_sum_{phase}"
+    right = (
+        df_phase[["_key", "reportdatetime", "row_sum"]]
+        .dropna(subset=["_key", "reportdatetime"])
+        .sort_values("reportdatetime", kind="stable")
+        .drop_duplicates(subset=["_key", "reportdatetime"], keep="first")
+        .rename(columns={"reportdatetime": time_col, "row_sum": sum_col})
+    )
+    merged = pd.merge_asof(
+        df_left,
+        right,
+        left_on="reportdatetime_cruise",
+        right_on=time_col,
+        by="_key",
+        direction="backward",
+        allow_exact_matches=False,
+    )
+    too_old = ~((merged["reportdatetime_cruise"] - merged[time_col]) < max_delta)
+    merged.loc[too_old, [time_col, sum_col]] = np.nan
+    return merged
+
+def merge_flight_phases_asof(
+    df_takeoff: pd.DataFrame,
+    df_climb: pd.DataFrame,
+    df_cruise: pd.DataFrame,
+) -> pd.DataFrame:
+    """Merge takeoff, climb, and cruise flight phases with backward as-of joins.
+
+    Same row layout as `merge_flight_phases()`: one row per cruise record, ordered by
+    (ESN, operator, ACID, ENGPOS) then cruise time, with the last takeoff within
+    55 minutes and the last climb within 30 minutes before the cruise record.
+    Each phase is sorted once and joined in a single vectorized pass, so the cost is
+    O(n log n) instead of a group scan per cruise row.
+
+    Unmatched events are NaT / NaN instead of None.
+
+    Args:
+        df_takeoff (pd.DataFrame): Takeoff phase records with columns:
+            ['ESN','operator','ACID','ENGPOS','reportdatetime','row_sum'].
+        df_climb (pd.DataFrame): Climb phase records, same columns.
+        df_cruise (pd.DataFrame): Cruise phase records, same columns.
+
+    Returns:
+        pd.DataFrame: Merged DataFrame with columns:
+            ['ESN','operator','ACID','ENGPOS',
+             'reportdatetime_takeoff','reportdatetime_climb','reportdatetime_cruise',
+             'row_sum_takeoff','row_sum_climb','row_sum_cruise']
+    """
+    keys = ["ESN", "operator", "ACID", "ENGPOS"]
+    columns = keys + [
+        "reportdatetime_takeoff", "reportdatetime_climb", "reportdatetime_cruise",
+        "row_sum_takeoff", "row_sum_climb", "row_sum_cruise",
+    ]
+
+    # One integer code per installation key, shared by the three phases
+    # (rows with a missing key get NaN and are never matched)
+    phases = [df_cruise, df_takeoff, df_climb]
+    key_codes = pd.concat([df[keys] for df in phases], ignore_index=True).groupby(
+        keys, sort=False, dropna=True).ngroup().to_numpy()
+    bounds = np.cumsum([0] + [len(df) for df in phases])
+    df_cruise, df_takeoff, df_climb = (
+        df[keys + ["reportdatetime", "row_sum"]].assign(
+            _key=key_codes[lo:hi], reportdatetime=pd.to_datetime(df["reportdatetime"]))
+        for df, lo, hi in zip(phases, bounds[:-1], bounds[1:]))
+
+    # Output order: installation key, then cruise time (rows without key are skipped)
+    cruise = (
+        df_cruise
+        .dropna(subset=["_key"])
+        .sort_values(keys + ["reportdatetime"], kind="stable")
+        .rename(columns={"reportdatetime": "reportdatetime_cruise", "row_sum": "row_sum_cruise"})
+        .reset_index(drop=True)
+    )
+    if cruise.empty:
+        return pd.DataFrame(columns=columns)
+
+    # merge_asof needs the left frame sorted on time and without NaT
+    left = cruise.loc[cruise["reportdatetime_cruise"].notna(), ["_key", "reportdatetime_cruise"]]
+    left = left.sort_values("reportdatetime_cruise", kind="stable")
+    left = left.assign(_row=left.index)
+    left = _previous_event_asof(left, df_takeoff, "takeoff", pd.Timedelta(minutes=55))
+    left = _previous_event_asof(left, df_climb, "climb", pd.Timedelta(minutes=30))
+
+    merged = cruise.join(
+        left.set_index("_row")[["reportdatetime_takeoff", "row_sum_takeoff",
+                                "reportdatetime_climb", "row_sum_climb"]])
+    return merged[columns]
+
+def _format_fire_time(times: pd.Series) -> pd.Series:
+    """Format DN fire timestamps as '%Y-%m-%d %H:%M:%S' strings, None when missing."""
+    formatted = times.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+    return formatted.where(times.notna(), None)
+
 def merged_data_evaluation(
     merged_df: pd.DataFrame,
     threshold: int
@@ -117,8 +231,8 @@ def merged_data_evaluation(
       - a DN_FIRE flag ("YES"/"NO")
       - a DN_FIRE_TIME string formatted as '%Y-%m-%d %H:%M:%S'
 
-    It then groups the annotated DataFrame by the flight key columns (ESN, operator, ACID, ENGPOS)
-    and for each group builds a summary row capturing:
+    It then aggregates the DN_FIRE flags by the flight key columns (ESN, operator, ACID, ENGPOS)
+    in a single named-aggregation pass, with one summary row per group capturing:
       - whether any DN_FIRE occurred in that group
       - how many DN_FIRE occurrences there were
       - the timestamp of the first DN_FIRE
@@ -159,17 +273,17 @@ def merged_data_evaluation(
     Notes
     -----
     - DN_FIRE_TIME is formatted as a string for downstream reporting.
+    - Flags are kept as bool / int8 during the aggregation, "YES"/"NO" strings are
+      only produced for the returned frames.
     - Any exceptions during processing are logged via `log_message()`.
     """
-    summary_rows = []
-
     try:
         # Step 1: Identify rows where all three phases exceed the threshold
         mask = (
             (merged_df["row_sum_takeoff"] >= threshold) &
             (merged_df["row_sum_climb"] >= threshold) &
             (merged_df["row_sum_cruise"] >= threshold)
-        )
+        ).to_numpy(dtype=bool)
 
         # Step 2: Compute total row_sum only for valid DN_FIRE rows
         merged_df["merge_sum"] = np.where(
@@ -180,80 +294,39 @@ def merged_data_evaluation(
             np.nan
         )
 
-        # Step 3: Flag each row as DN_FIRE = "YES" or "NO"
-        merged_df["DN_FIRE"] = np.where(mask, "YES", "NO")
+        # Step 3: Capture the takeoff timestamp when DN_FIRE is True
+        fire_time = pd.to_datetime(
+            merged_df["reportdatetime_takeoff"], errors="coerce"
+        ).where(mask)
 
-        # Step 4: Capture the takeoff timestamp when DN_FIRE is True
-        merged_df["DN_FIRE_TIME"] = np.where(
-            mask,
-            merged_df["reportdatetime_takeoff"],
-            pd.NaT
-        )
-
-        # Ensure DN_FIRE_TIME is a datetime and then format as string
-        merged_df["DN_FIRE_TIME"] = pd.to_datetime(
-            merged_df["DN_FIRE_TIME"], errors="coerce"
-        ).dt.strftime("%Y-%m-%d %H:%M:%S")
-
-        # Step 5: Build summary per flight key
+        # Step 4: Build summary per flight key in a single aggregation pass
         key_cols = ["ESN", "operator", "ACID", "ENGPOS"]
-        grouped = merged_df.groupby(key_cols, group_keys=False)
-
-        for _, group in tqdm(
-            grouped,
-            desc="DN output reordering",
-            unit="installation level"
-        ):
-            # Sort events by takeoff timestamp
-            group = group.sort_values("reportdatetime_takeoff")
-
-            # Extract the unique flight identifiers (one per group)
-            esn     = group["ESN"].iat[0]
-            operator= group["operator"].iat[0]
-            acid    = group["ACID"].iat[0]
-            engpos  = group["ENGPOS"].iat[0]
-
-            # Filter only DN_FIRE == "YES" rows within this group
-            dn_events = group.loc[group["DN_FIRE"] == "YES", :]
-            count_dn  = len(dn_events)
-            fired_flag = "YES" if count_dn > 0 else "NO"
-
-            # Determine first and last DN_FIRE takeoff timestamps
-            first_fire_ts = (
-                dn_events["reportdatetime_takeoff"].min()
-                if fired_flag == "YES"
-                else pd.NaT
-            )
-            last_fire_ts = (
-                dn_events["reportdatetime_takeoff"].max()
-                if fired_flag == "YES"
-                else pd.NaT
-            )
-
-            # Format timestamps or set None if missing
-            first_fire_str = (
-                first_fire_ts.strftime("%Y-%m-%d %H:%M:%S")
-                if pd.notna(first_fire_ts)
-                else None
+        summary_df = (
+            merged_df[key_cols]
+            .assign(_fire=mask.astype(np.int8), _fire_time=fire_time)
+            .groupby(key_cols)
+            .agg(
+                DN_FIRES=("_fire", "sum"),
+                first_fire=("_fire_time", "min"),
+                last_fire=("_fire_time", "max"),
             )
-            last_fire_str = (
-                last_fire_ts.strftime("%Y-%m-%d %H:%M:%S")
-                if pd.notna(last_fire_ts)
-                else None
-            )
-
-            summary_rows.append({
-                "operator": operator,
-                "ESN": esn,
-                "ACID": acid,
-                "ENGPOS": engpos,
-                "DN_FIRED": fired_flag,
-                "DN_FIRES": count_dn,
-                "First DN fire": first_fire_str,
-                "Last DN fire": last_fire_str
-            })
+            .reset_index()
+        )
 
-        summary_df = pd.DataFrame(summary_rows)
+        # Step 5: Format flags and timestamps as strings for export
+        merged_df["DN_FIRE"] = np.where(mask, "YES", "NO")
+        merged_df["DN_FIRE_TIME"] = fire_time.dt.strftime("%Y-%m-%d %H:%M:%S")
+
+        summary_df = pd.DataFrame({
+            "operator": summary_df["operator"],
+            "ESN": summary_df["ESN"],
+            "ACID": summary_df["ACID"],
+            "ENGPOS": summary_df["ENGPOS"],
+            "DN_FIRED": np.where(summary_df["DN_FIRES"] > 0, "YES", "NO"),
+            "DN_FIRES": summary_df["DN_FIRES"].astype(np.int64),
+            "First DN fire": _format_fire_time(summary_df["first_fire"]),
+            "Last DN fire": _format_fire_time(summary_df["last_fire"]),
+        })
 
     except Exception as exc:
         # Log any exception with function context and re-raise if needed
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# Flight phases, in the same order used for the limit columns below
+FLIGHT_PHASES = ['Take-off', 'Climb', 'Cruise']
+
+# Parameter -> nominal mapping table.
+# One row per measured parameter:
+#   - Param       : short parameter name (as in Initialise_Algorithm_Settings 'Param')
+#   - sensor      : column holding the measured value in the SQL query output
+#   - nominal     : column holding the nominal (baseline) value, None if not applicable
+#   - delta       : column holding the percentage delta computed by Loop 0
+#   - <phase> low/high limits applied by filter_parameters (NaN = no limit)
+_PARAMETER_ROWS = [
+    # Param   sensor          nominal           delta            TO low  TO high  CL low  CL high  CR low  CR high
+    ['PS26', 'P25__PSI',     'PS26S__NOM_PSI', 'PS26__DEL_PC',  50,     200,     50,     100,     25,     60],
+    ['T25',  'T25__DEGC',    'TS25S__NOM_K',   'T25__DEL_PC',   200,    400,     200,    350,     170,    280],
+    ['P30',  'P30__PSI',     'PS30S__NOM_PSI', 'P30__DEL_PC',   400,    800,     250,    500,     130,    270],
+    ['T30',  'T30__DEGC',    'TS30S__NOM_K',   'T30__DEL_PC',   500,    800,     450,    700,     330,    590],
+    ['TGTU', 'TGTU_A__DEGC', 'TGTS__NOM_K',    'TGTU__DEL_PC',  650,    1000,    650,    900,     380,    900],
+    ['NL',   'NL__PC',       'NL__NOM_PC',     'NL__DEL_PC',    60,     120,     60,     120,     60,     120],
+    ['NI',   'NI__PC',       'NI__NOM_PC',     'NI__DEL_PC',    75,     120,     75,     120,     75,     120],
+    ['NH',   'NH__PC',       'NH__NOM_PC',     'NH__DEL_PC',    75,     120,     75,     120,     75,     120],
+    ['FF',   'FF__LBHR',     'FF__NOM_LBHR',   'FF__DEL_PC',    10000,  25000,   8000,   16000,   3000,   8500],
+    ['P160', 'PS160__PSI',   'P135S__NOM_PSI', 'P160__DEL_PC',  np.nan, np.nan,  np.nan, np.nan,  np.nan, np.nan],
+    ['ALT',  'ALT__FT',      None,             None,            -1000,  9000,    15000,  25000,   25000,  43000],
+    ['MN',   'MN1',          None,             None,            0.175,  0.320,   0.500,  0.770,   0.700,  0.880],
+]
+
+# Nominal temperatures delivered in Kelvin by the queries, converted to Celsius at ingestion
+KELVIN_COLUMNS = ['TS25S__NOM_K', 'TS30S__NOM_K', 'TGTS__NOM_K']
+KELVIN_TO_CELSIUS = 273.15
+
+_LIMIT_COLUMNS = [
+    f"{phase} {bound} limits" for phase in FLIGHT_PHASES for bound in ('low', 'high')]
+
+PARAMETER_TABLE = pd.DataFrame(
+    _PARAMETER_ROWS,
+    columns=['Param', 'sensor', 'nominal', 'delta'] + _LIMIT_COLUMNS
+).set_index('sensor')
+
+
+def delta_table() -> pd.DataFrame:
+    """
+    Returns the rows of PARAMETER_TABLE that have a nominal value, i.e. the
+    parameters Loop 0 turns into percentage deltas.
+
+    Returns
+    -------
+        - pd.DataFrame: table indexed by sensor column with 'Param', 'nominal' and 'delta' columns
+    """
+    return PARAMETER_TABLE.loc[PARAMETER_TABLE['nominal'].notna(), ['Param', 'nominal', 'delta']]
+
+
+def limits_table() -> pd.DataFrame:
+    """
+    Builds the flight phase limits table used by filter_parameters.
+
+    Returns
+    -------
+        - limits_DSCs (pd.DataFrame): one row per '<phase> low/high limits', one column per
+          sensor parameter that has limits defined
+    """
+    limited = PARAMETER_TABLE[_LIMIT_COLUMNS].dropna(how='all')
+    return limited.T
+
+
+def compute_deltas(
+        df: pd.DataFrame,
+        mask: np.ndarray = None,
+        n: int = 5,
+        float32: bool = False) -> np.ndarray:
+    """
+    Computes the percentage deltas of every sensor parameter from its nominal value in a
+    single NumPy pass: round((x - nom) * 100 / nom, n).
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): DataFrame containing the sensor and nominal columns of delta_table()
+        - mask (np.ndarray): optional boolean row mask, only the selected rows are computed
+        - n (int): decimal digit to round
+        - float32 (bool): if True the computation is carried out in float32
+
+    Returns
+    -------
+        - deltas (np.ndarray): 2-D array (rows x parameters), columns ordered as delta_table()
+
+    Raises
+    ------
+        - KeyError: if any sensor or nominal column is missing from df
+    """
+    table = delta_table()
+    dtype = np.float32 if float32 else np.float64
+
+    rows = slice(None) if mask is None else mask
+    sensors = df.loc[rows, table.index.tolist()].to_numpy(dtype=dtype, na_value=np.nan)
+    nominals = df.loc[rows, table['nominal'].tolist()].to_numpy(dtype=dtype, na_value=np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deltas = np.round((sensors - nominals) * 100 / nominals, n)
+    return deltas
@@ -0,0 +1,151 @@
+import asyncio
+import traceback
+from datetime import datetime as dt
+from src.utils.log_file import log_message
+from src.utils.async_main import run_stage
+
+
+async def run_phase_pipeline(
+    flight_phase: str,
+    df,
+    stages: list,
+    semaphore: asyncio.Semaphore,
+    timings: dict,
+    executor: str = "thread",
+    pool_workers: int = None,
+    errors: set = None,
+) -> tuple:
+    """
+    Runs the stages of a single flight phase one after the other, each in the executor
+    given (see async_main.run_stage).
+
+    A stage failing is logged and skipped: the next stage receives the input of the
+    failed one (same behaviour as async_main).
+
+    Parameters
+    ----------
+    Args:
+        - flight_phase (str): flight phase
+        - df (pd.DataFrame): input data of the first stage
+        - stages (list): list of (name, function, kwargs) tuples, each function is called as
+          function(df=df, flight_phase=flight_phase, **kwargs) and returns the new df
+        - semaphore (asyncio.Semaphore): limits the number of stages running at once
+        - timings (dict): filled with {(flight_phase, name): seconds}
+        - executor (str): "thread", "process" or "inline"
+        - pool_workers (int, optional): number of processes of the shared pool
+        - errors (set, optional): filled with the (flight_phase, name) of the failed stages
+
+    Returns
+    -------
+        - tuple: (flight_phase, processed_df)
+    """
+    for name, process_function, *options in stages:
+        kwargs = options[0] if options else {}
+        async with semaphore:
+            start_time = dt.now()
+            log_message(f"Start {flight_phase} {name}")
+            try:
+                df = await run_stage(
+                    process_function, df=df, flight_phase=flight_phase,
+                    executor=executor, pool_workers=pool_workers, **kwargs)
+            except Exception as e:
+                log_message(f"ERROR in {flight_phase} {name}: {str(e)}")
+                log_message(traceback.format_exc())
+                if errors is not None:
+                    errors.add((flight_phase, name))
+            elapsed = (dt.now() - start_time).total_seconds()
+        timings[(flight_phase, name)] = elapsed
+        log_message(f"Completed {flight_phase} {name} in {elapsed:.2f} seconds")
+    return flight_phase, df
+
+
+async def run_pipeline(
+    data_dict: dict,
+    stages: list,
+    join: tuple = None,
+    max_concurrency: int = None,
+    executor: str = "thread",
+    pool_workers: int = None,
+    errors: set = None,
+) -> tuple:
+    """
+    Runs the per-phase pipelines concurrently, then the join stage on all the phases.
+
+    Each flight phase moves to its next stage as soon as its previous stage is done,
+    without waiting for the other phases: the only barrier is the join stage.
+
+    Parameters
+    ----------
+    Args:
+        - data_dict (dict): {flight_phase: pd.DataFrame}
+        - stages (list): per-phase stages, list of (name, function, kwargs) tuples
+        - join (tuple, optional): (name, function, kwargs), called as
+          function(data_dict=data_dict, **kwargs) once all the phases are processed
+        - max_concurrency (int, optional): maximum number of stages running at once,
+          one per flight phase if None
+        - executor (str): executor of the per-phase stages, "thread", "process" or "inline"
+          (the join stage runs in a thread)
+        - pool_workers (int, optional): number of processes of the shared pool
+        - errors (set, optional): filled with the (flight_phase, name) of the failed stages,
+          flight_phase = "all" for the join stage
+
+    Returns
+    -------
+        - data_dict (dict): processed data
+        - join_result: output of the join stage, None without join stage or if it fails
+        - timings (dict): {(flight_phase, name): seconds}, flight_phase = "all" for the join stage
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or max(len(data_dict), 1))
+    timings = {}
+    results = await asyncio.gather(*[
+        run_phase_pipeline(flight_phase, df, stages, semaphore, timings, executor, pool_workers, errors)
+        for flight_phase, df in data_dict.items()
+    ])
+    data_dict = {flight_phase: df for flight_phase, df in results}
+
+    join_result = None
+    if join is not None:
+        name, process_function, *options = join
+        kwargs = options[0] if options else {}
+        start_time = dt.now()
+        log_message(f"Start {name}")
+        try:
+            join_result = await asyncio.to_thread(process_function, data_dict=data_dict, **kwargs)
+        except Exception as e:
+            log_message(f"ERROR in {name}: {str(e)}")
+            log_message(traceback.format_exc())
+            if errors is not None:
+                errors.add(("all", name))
+        timings[("all", name)] = (dt.now() - start_time).total_seconds()
+        log_message(f"Completed {name} in {timings[('all', name)]:.2f} seconds")
+    return data_dict, join_result, timings
+
+
+def run_dag(
+    data_dict: dict,
+    stages: list,
+    join: tuple = None,
+    max_concurrency: int = None,
+    executor: str = "thread",
+    pool_workers: int = None,
+    errors: set = None,
+) -> tuple:
+    """
+    Runs the pipeline (see run_pipeline) in a single event loop and logs the time
+    spent in each stage and flight phase. The failed stages are logged and skipped,
+    they are added to errors if given.
+
+    Returns
+    -------
+        - data_dict (dict): processed data
+        - join_result: output of the join stage
+        - timings (dict): {(flight_phase, name): seconds}
+    """
+    start_time = dt.now()
+    data_dict, join_result, timings = asyncio.run(
+        run_pipeline(data_dict, stages, join=join, max_concurrency=max_concurrency,
+                     executor=executor, pool_workers=pool_workers, errors=errors))
+    log_message(f"Pipeline completed in {(dt.now() - start_time).total_seconds():.2f} seconds")
+    for (flight_phase, name), elapsed in timings.items():
+        log_message(f"    {name:<30} {flight_phase:<10} {elapsed:8.2f} s")
+    return data_dict, join_result, timings
@@ -0,0 +1,205 @@
+import re
+import numpy as np
+import pandas as pd
+from src.utils.parameter_table import (
+    FLIGHT_PHASES,
+    KELVIN_COLUMNS,
+    KELVIN_TO_CELSIUS,
+    PARAMETER_TABLE,
+    delta_table,
+)
+
+# Item of the SELECT list of the Fleetstore queries: DA.[StartDatetime] as reportdatetime, DA.[P25__PSI], ...
+_SELECT_ITEM = re.compile(
+    r"^\s*,?\s*(?P<expr>\w+\.\[(?P<column>[^\]]+)\])(?:\s+as\s+(?P<alias>\w+))?\s*$",
+    re.IGNORECASE)
+_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+_FROM = re.compile(r"^\s*FROM\b", re.IGNORECASE | re.MULTILINE)
+_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+
+def select_columns(query: str) -> dict:
+    """
+    Output columns of a Fleetstore query and the SQL expression of each one.
+
+    Parameters
+    ----------
+    Args:
+        - query (str): query text
+
+    Returns
+    -------
+        - dict: {output column: SQL expression}, e.g. {"ESN": "DA.[EngineSerialNumber]",
+          "P25__PSI": "DA.[P25__PSI]"} (constant columns, e.g. DSCID, are not included)
+    """
+    select_list = query[_SELECT.search(query).end():_FROM.search(query).start()]
+    columns = {}
+    for line in select_list.splitlines():
+        match = _SELECT_ITEM.match(line)
+        if match:
+            columns[match.group("alias") or match.group("column")] = match.group("expr")
+    return columns
+
+
+def _celsius(expression: str) -> str:
+    return f"({expression} - {KELVIN_TO_CELSIUS})"
+
+
+def limit_predicates(columns: dict, flight_phase: str) -> list:
+    """
+    WHERE predicates applying the flight phase limits of the parameter table (same
+    limits as filter_parameters, a NULL value does not pass them either).
+
+    Parameters
+    ----------
+    Args:
+        - columns (dict): output columns of the query, see select_columns
+        - flight_phase (str): flight phase, e.g. "Cruise"
+
+    Returns
+    -------
+        - list: predicates, one per limit
+    """
+    phase = [name for name in FLIGHT_PHASES if name.lower().startswith(flight_phase.lower())]
+    if len(phase) != 1:
+        raise ValueError(f"No valid limits found for flight phase: {flight_phase}")
+    predicates = []
+    for sensor, limits in PARAMETER_TABLE[[f"{phase[0]} low limits", f"{phase[0]} high limits"]].iterrows():
+        if sensor not in columns:
+            continue
+        low, high = limits.tolist()
+        if not np.isnan(low):
+            predicates.append(f"{columns[sensor]} >= {float(low)!r}")
+        if not np.isnan(high):
+            predicates.append(f"{columns[sensor]} <= {float(high)!r}")
+    return predicates
+
+
+def delta_expressions(columns: dict, n: int = 5) -> list:
+    """
+    Computed columns of the percentage deltas of Loop 0, round((x - nom) * 100 / nom, n),
+    with the nominal temperatures in Celsius (as after ingestion).
+
+    Parameters
+    ----------
+    Args:
+        - columns (dict): output columns of the query, see select_columns
+        - n (int): decimal digit to round
+
+    Returns
+    -------
+        - list: "expression AS [delta column]" items
+    """
+    expressions = []
+    for sensor, row in delta_table().iterrows():
+        if sensor not in columns or row['nominal'] not in columns:
+            continue
+        nominal = columns[row['nominal']]
+        if row['nominal'] in KELVIN_COLUMNS:
+            nominal = _celsius(nominal)
+        expressions.append(
+            f"ROUND(({columns[sensor]} - {nominal}) * 100 / NULLIF({nominal}, 0), {n}) AS [{row['delta']}]")
+    return expressions
+
+
+def add_predicates(query: str, predicates: list) -> str:
+    """
+    Adds predicates to the WHERE clause of a query. The original condition is kept in
+    brackets, the closing bracket on its own line as the condition can end with a commented
+    out line.
+
+    Parameters
+    ----------
+    Args:
+        - query (str): query text, with a WHERE clause
+        - predicates (list): predicates to add
+
+    Returns
+    -------
+        - str: query text
+    """
+    if not predicates:
+        return query
+    newline = "\r\n" if "\r\n" in query else "\n"
+    from_start = _FROM.search(query).start()
+    where = _WHERE.search(query, from_start)
+    order_by = _ORDER_BY.search(query, where.end())
+    end = order_by.start() if order_by else len(query)
+    return (query[:where.start()] + "WHERE " + f"{newline}  AND ".join(predicates)
+            + f"{newline}  AND (" + query[where.end():end].strip() + f"{newline}  ){newline}  " + query[end:])
+
+
+def window_query(query: str, start: pd.Timestamp, end: pd.Timestamp) -> str:
+    """
+    Restricts a Fleetstore query template to a time window: the %startTimestamp% watermark
+    is replaced by the window start and reportdatetime < window end is added.
+
+    Parameters
+    ----------
+    Args:
+        - query (str): query template text
+        - start (pd.Timestamp): window start (inclusive, as the templates use >= %startTimestamp%)
+        - end (pd.Timestamp): window end (exclusive)
+
+    Returns
+    -------
+        - str: query text
+    """
+    start, end = (pd.Timestamp(ts).strftime("'%Y-%m-%d %H:%M:%S'") for ts in (start, end))
+    reportdatetime = select_columns(query)["reportdatetime"]
+    return add_predicates(query.replace("%startTimestamp%", start), [f"{reportdatetime} < {end}"])
+
+
+def render_query(
+    query: str,
+    flight_phase: str,
+    limits: bool = True,
+    celsius: bool = True,
+    deltas: bool = False,
+) -> str:
+    """
+    Renders a Fleetstore query template (Queries/Sql_fleetstore_*.sql) so that the server
+    does the first cleaning steps of query_run:
+        - limits: rows out of the flight phase limits (or with a NULL limited parameter) are not returned
+        - celsius: the nominal temperatures are returned in Celsius
+        - deltas: the Loop 0 percentage deltas (__DEL_PC columns) are returned as computed columns
+
+    Parameters
+    ----------
+    Args:
+        - query (str): query template text
+        - flight_phase (str): flight phase, e.g. "Cruise"
+        - limits (bool): push the flight phase limits down as WHERE predicates
+        - celsius (bool): convert the Kelvin columns in the SELECT list
+        - deltas (bool): add the delta columns to the SELECT list
+
+    Returns
+    -------
+        - str: rendered query
+    """
+    columns = select_columns(query)
+    newline = "\r\n" if "\r\n" in query else "\n"
+    from_start = _FROM.search(query).start()
+    select_list = query[:from_start]
+    rest = query[from_start:]
+
+    if celsius:
+        lines = []
+        for line in select_list.splitlines(keepends=True):
+            match = _SELECT_ITEM.match(line)
+            name = match and (match.group("alias") or match.group("column"))
+            if name in KELVIN_COLUMNS:
+                line_end = line[len(line.rstrip("\r\n")):]
+                line = line[:match.start("expr")] + f"{_celsius(match.group('expr'))} AS [{name}]" + line_end
+            lines.append(line)
+        select_list = "".join(lines)
+
+    if deltas:
+        select_list = select_list.rstrip() + "".join(
+            f"{newline}        ,{expression}" for expression in delta_expressions(columns)) + newline + newline
+
+    query = select_list + rest
+    if limits:
+        query = add_predicates(query, limit_predicates(columns, flight_phase))
+    return query
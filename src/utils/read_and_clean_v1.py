@@ -87,10 +87,11 @@ def read_and_clean_csv(csv_path: str, columns_type_check: bool = False) -> pd.Da
 
     # Define known dtypes
     dtype_spec = int64_dict |  Int64_dict |  string_dict | float_dict
-    df = pd.read_csv(csv_path, dtype=dtype_spec, parse_dates=cols_list_datetime)
-    # Keep the following line to force convertion to datetime, is good practice to sanitize data from CSV import 
+    df = pd.read_csv(csv_path, dtype=dtype_spec)
+    # Datetimes are parsed once, to sanitize data from CSV import. ISO 8601 accepts both the
+    # second-precision values and the fractional seconds of older exports (e.g. 'datestored')
     #df[cols_list_datetime] = df[cols_list_datetime].apply(pd.to_datetime, errors="ignore", format="%Y-%m-%d %H:%M:%S") 
-    df[cols_list_datetime] = df[cols_list_datetime].apply(pd.to_datetime, format="%Y-%m-%d %H:%M:%S") 
+    df[cols_list_datetime] = df[cols_list_datetime].apply(pd.to_datetime, format="ISO8601") 
 
 
     
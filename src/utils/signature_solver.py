@@ -0,0 +1,314 @@
+import numpy as np
+
+# Acceptance thresholds of a signature fit (see Loop_6_fit_signatures)
+MAX_ERROR_REL = 0.3
+MAX_MAGNITUDE_RATIO = 5
+
+
+def stack_signature_combos(signature_combos: list) -> list:
+    """
+    Groups the signature combinations by number of signatures and precomputes, once per
+    combination, the pseudo-inverse used to project every observation vector.
+
+    Parameters
+    ----------
+    Args:
+        - signature_combos (list): list of (F, norms, ids) tuples, F being the
+          (n_params x n_signatures) matrix of the combination
+
+    Returns
+    -------
+        - stacks (list): one (positions, F, P, norms) tuple per combination size, where
+          positions are the indices of the combinations in signature_combos, F is
+          (n_combos x n_params x k), P = pinv(F) is (n_combos x k x n_params) and norms
+          is (n_combos x k)
+    """
+    sizes = {}
+    for pos, (F, norms, ids) in enumerate(signature_combos):
+        sizes.setdefault(F.shape[1], []).append(pos)
+
+    stacks = []
+    for k, positions in sizes.items():
+        F = np.stack([signature_combos[pos][0] for pos in positions]).astype(float)
+        norms = np.stack([signature_combos[pos][1] for pos in positions]).astype(float)
+        stacks.append((np.asarray(positions), F, np.linalg.pinv(F), norms))
+    return stacks
+
+
+def exact_fit(F: np.ndarray, norms: np.ndarray, obs_vec: np.ndarray, obs_mag: float) -> tuple:
+    """
+    Least-squares fit of a single observation vector to a single signature combination.
+
+    Parameters
+    ----------
+    Args:
+        - F (np.ndarray): (n_params x k) signature matrix of the combination
+        - norms (np.ndarray): vector norms of the k signatures
+        - obs_vec (np.ndarray): observation vector
+        - obs_mag (float): magnitude of the observation vector
+
+    Returns
+    -------
+        - tuple: (coeffs, err, magnitudes, fit_vec) with err the relative fit error
+    """
+    coeffs, *_ = np.linalg.lstsq(F, obs_vec, rcond=None)  # Solve linear least squares
+    fit_vec = F @ coeffs  # Compute fitted vector
+    err = np.linalg.norm(obs_vec - fit_vec) / obs_mag  # Relative error
+    magnitudes = np.abs(coeffs * norms)  # Magnitudes for each coefficient
+    return coeffs, err, magnitudes, fit_vec
+
+
+def signature_bounds(signature_combos: list, stacks: list) -> list:
+    """
+    Data of the residual bounds used by the pruned search. For a combination S with
+    orthonormal basis Q_S of its signatures, the squared residual of the fit of o is
+
+        ||o||^2 - ||Q_S^T o||^2
+
+    and the Q_S^T of all the combinations are stacked in a single matrix, so the
+    projections of a block of rows on every combination are one matrix multiply. The
+    rounding error is bounded through the condition number of the Gram matrix F_S^T F_S.
+
+    Parameters
+    ----------
+    Args:
+        - signature_combos (list): list of (F, norms, ids) tuples
+        - stacks (list): output of stack_signature_combos(signature_combos)
+
+    Returns
+    -------
+        - bounds (list): one (Qt, cond) tuple per stack, Qt being the (n_combos * k x
+          n_params) stacked basis transposes and cond the (n_combos,) condition numbers
+    """
+    bounds = []
+    for positions, F, P, norms in stacks:
+        Q, _ = np.linalg.qr(F)
+        Qt = np.swapaxes(Q, 1, 2).reshape(-1, F.shape[1])
+        eigvals = np.linalg.eigvalsh(np.swapaxes(F, 1, 2) @ F)
+        with np.errstate(divide='ignore'):
+            cond = np.where(eigvals[:, 0] > 0, eigvals[:, -1] / eigvals[:, 0], np.inf)
+        bounds.append((Qt, cond))
+    return bounds
+
+
+def _error_bounds(bounds, stacks, obs, obs_mag, n_combos) -> tuple:
+    """
+    Squared relative error estimate of every combination and its rounding margin.
+
+    Returns
+    -------
+        - tuple: (estimate_sq, margin), (n_rows x n_combos) and (n_combos,); the squared
+          relative error of a combination is at least estimate_sq - margin
+    """
+    obs_sq = obs_mag[:, None] ** 2
+    estimate_sq = np.empty((len(obs), n_combos))
+    margin = np.empty(n_combos)
+    for (positions, F, P, norms), (Qt, cond) in zip(stacks, bounds):
+        proj = obs @ Qt.T                                             # (n_rows x n_combos * k)
+        proj_sq = (proj * proj).reshape(len(obs), len(positions), -1).sum(axis=2)
+        estimate_sq[:, positions] = 1 - proj_sq / obs_sq
+        margin[positions] = 256 * np.finfo(float).eps * (1 + cond)
+    return estimate_sq, margin
+
+
+def _batched_errors(stacks: list, obs: np.ndarray, obs_mag: np.ndarray, n_combos: int) -> tuple:
+    """
+    Relative errors and magnitude sums of every combination for a block of observations.
+
+    Returns
+    -------
+        - tuple: (err, mag_sum), both (n_rows x n_combos)
+    """
+    err = np.empty((len(obs), n_combos))
+    mag_sum = np.empty((len(obs), n_combos))
+    obs_t = obs.T
+    for positions, F, P, norms in stacks:
+        coeffs = P @ obs_t                       # (n_combos x k x n_rows)
+        resid = obs_t - F @ coeffs               # (n_combos x n_params x n_rows)
+        err[:, positions] = (np.sqrt(np.einsum('cmr,cmr->rc', resid, resid))
+                             / obs_mag[:, None])
+        mag_sum[:, positions] = np.einsum('ckr,ck->rc', np.abs(coeffs), np.abs(norms))
+    return err, mag_sum
+
+
+def _exact_best(signature_combos, obs_vec, obs_mag, positions):
+    """
+    Best accepted fit among the given combinations (in combination order) with lstsq.
+
+    Returns
+    -------
+        - tuple or None: (pos, coeffs, err, magnitudes, fit_vec) of the best fit
+    """
+    best_fit = None
+    best_err = np.inf
+    for pos in positions:
+        F, norms, ids = signature_combos[pos]
+        coeffs, e, magnitudes, fit_vec = exact_fit(F, norms, obs_vec, obs_mag)
+        # Check if this combination meets thresholds
+        if (e < MAX_ERROR_REL and np.sum(magnitudes) < MAX_MAGNITUDE_RATIO * obs_mag
+                and e < best_err):
+            best_fit = (pos, coeffs, e, magnitudes, fit_vec)
+            best_err = e
+    return best_fit
+
+
+def _store_fit(fits, r, obs_vec, best_fit):
+    """Writes the best fit of row r into the solver output arrays."""
+    if best_fit:
+        pos, coeffs, e, magnitudes, fit_vec = best_fit
+        fits['combo'][r] = pos
+        fits['coeffs'][r, :len(coeffs)] = coeffs[:3]
+        fits['magnitudes'][r, :len(magnitudes)] = magnitudes[:3]
+        fits['error_rel'][r] = e
+        fits['error_mag'][r] = np.linalg.norm(obs_vec - fit_vec)
+
+
+def _prune_block(signature_combos, stacks, bounds, obs, obs_mag, tol, exact, top_k, warm):
+    """
+    Combinations to fit exactly for a block of rows in the pruned search.
+
+    Returns
+    -------
+        - survive (np.ndarray): (n_rows x n_combos) boolean mask of the combinations to fit
+    """
+    n_combos = len(signature_combos)
+    estimate_sq, margin = _error_bounds(bounds, stacks, obs, obs_mag, n_combos)
+    warm = np.asarray(warm, dtype=np.int64)
+    has_warm = warm >= 0
+
+    if exact:
+        # Upper bound of the best error: best accepted fit among the previous row's
+        # combination and the combinations with the lowest estimated error
+        n_seeds = min(3, n_combos)
+        seeds = np.argpartition(estimate_sq, n_seeds - 1, axis=1)[:, :n_seeds]
+        upper = np.full(len(obs), np.inf)
+        for i in range(len(obs)):
+            row_seeds = np.unique(np.append(seeds[i], warm[i]) if has_warm[i] else seeds[i])
+            best_fit = _exact_best(signature_combos, obs[i], obs_mag[i], row_seeds)
+            if best_fit:
+                upper[i] = best_fit[2]
+        # Skip combinations that can't be accepted or can't beat the upper bound
+        lower_sq = estimate_sq - margin
+        limit = np.minimum(upper + tol, MAX_ERROR_REL + tol)
+        survive = lower_sq <= limit[:, None] ** 2
+    else:
+        # Approximate screening: lowest estimated errors only
+        k = min(top_k, n_combos)
+        top = np.argpartition(estimate_sq, k - 1, axis=1)[:, :k]
+        survive = np.zeros((len(obs), n_combos), dtype=bool)
+        np.put_along_axis(survive, top, True, axis=1)
+        survive[np.flatnonzero(has_warm), warm[has_warm]] = True
+    return survive
+
+
+def solve_signature_fits(
+        obs: np.ndarray,
+        signature_combos: list,
+        stacks: list = None,
+        chunk_size: int = 64,
+        tol: float = 1e-6,
+        pruned: bool = False,
+        exact: bool = True,
+        top_k: int = 4,
+        groups: np.ndarray = None,
+        bounds: list = None) -> dict:
+    """
+    Finds, for every observation vector, the best signature combination: the one with the
+    lowest relative error among those with err < 0.3 and sum(magnitudes) < 5 * obs_mag.
+
+    The combinations are evaluated for a block of rows at a time with stacked matrix
+    multiplies of the precomputed pseudo-inverses. The few combinations that can still be
+    the best one given the tolerance 'tol' on the batched values are then re-solved with
+    np.linalg.lstsq in combination order, so the result is the same as fitting every
+    combination of every row with lstsq.
+
+    With pruned=True the combinations are screened with the residual bounds of
+    signature_bounds instead, and only the survivors are solved with lstsq:
+        - exact=True: combinations whose lower bound is above 0.3, or above the error of
+          an accepted fit already known for the row (previous row of the same group or
+          best estimated combinations), are skipped. The result is the same as the
+          exhaustive search.
+        - exact=False: approximate screening, only the top_k combinations with the lowest
+          estimated error (plus the previous row's combination) are solved.
+
+    Parameters
+    ----------
+    Args:
+        - obs (np.ndarray): (n_rows x n_params) observation vectors, rows with NaN are skipped
+        - signature_combos (list): list of (F, norms, ids) tuples
+        - stacks (list): output of stack_signature_combos(signature_combos), computed if None
+        - chunk_size (int): number of rows evaluated together, bounds the memory used
+        - tol (float): bound on the difference between batched and lstsq errors
+        - pruned (bool): use the bounded search instead of the exhaustive one
+        - exact (bool): pruned search mode, exact (True) or top_k screening (False)
+        - top_k (int): combinations solved per row when exact=False
+        - groups (np.ndarray): optional group (e.g. ESN) of every row, rows of a group in
+          time order, used to warm start the pruned search from the previous row
+        - bounds (list): output of signature_bounds(signature_combos, stacks), computed if None
+
+    Returns
+    -------
+        - fits (dict): arrays of length n_rows
+            - 'obs_mag': observation magnitude (NaN for rows with NaN)
+            - 'combo': index of the best combination in signature_combos (-1 if no fit)
+            - 'coeffs', 'magnitudes': (n_rows x 3) arrays, NaN padded
+            - 'error_rel', 'error_mag': relative and absolute fit errors
+    """
+    obs = np.asarray(obs, dtype=float)
+    n_rows = len(obs)
+    n_combos = len(signature_combos)
+    if stacks is None:
+        stacks = stack_signature_combos(signature_combos)
+    if pruned and bounds is None and n_combos > 0:
+        bounds = signature_bounds(signature_combos, stacks)
+
+    fits = {
+        'obs_mag': np.full(n_rows, np.nan),
+        'combo': np.full(n_rows, -1, dtype=np.int64),
+        'coeffs': np.full((n_rows, 3), np.nan),
+        'magnitudes': np.full((n_rows, 3), np.nan),
+        'error_rel': np.full(n_rows, np.nan),
+        'error_mag': np.full(n_rows, np.nan),
+    }
+
+    # Skip rows with NaNs, magnitude computed row by row as in the single-row fit
+    valid = ~np.isnan(obs).any(axis=1)
+    for r in np.flatnonzero(valid):
+        fits['obs_mag'][r] = np.linalg.norm(obs[r])
+    # Skip zero vectors
+    rows = np.flatnonzero(valid & (fits['obs_mag'] != 0.0))
+    if len(rows) == 0 or n_combos == 0:
+        return fits
+
+    # Best combination of the last fitted row of each group (warm start)
+    last_combo = {}
+
+    for start in range(0, len(rows), chunk_size):
+        block = rows[start:start + chunk_size]
+        obs_mag = fits['obs_mag'][block]
+
+        if pruned:
+            # Combinations surviving the bounds, solved exactly
+            warm = ([-1] * len(block) if groups is None
+                    else [last_combo.get(g, -1) for g in groups[block]])
+            candidates = _prune_block(
+                signature_combos, stacks, bounds, obs[block], obs_mag, tol, exact, top_k, warm)
+        else:
+            err, mag_sum = _batched_errors(stacks, obs[block], obs_mag, n_combos)
+
+            # Acceptance tests with a margin on both sides of the thresholds
+            mag_lim = MAX_MAGNITUDE_RATIO * obs_mag[:, None]
+            mag_tol = tol * (1 + mag_sum)
+            maybe_ok = (err < MAX_ERROR_REL + tol) & (mag_sum < mag_lim + mag_tol)
+            surely_ok = (err < MAX_ERROR_REL - tol) & (mag_sum < mag_lim - mag_tol)
+
+            # Combinations that can still beat the best surely accepted one
+            best_sure = np.where(surely_ok, err, np.inf).min(axis=1)
+            candidates = maybe_ok & (err <= best_sure[:, None] + 2 * tol)
+
+        for i, r in enumerate(block):
+            _store_fit(fits, r, obs[r], _exact_best(
+                signature_combos, obs[r], obs_mag[i], np.flatnonzero(candidates[i])))
+            if groups is not None and fits['combo'][r] >= 0:
+                last_combo[groups[r]] = fits['combo'][r]
+    return fits
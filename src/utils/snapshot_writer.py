@@ -0,0 +1,195 @@
+import os
+import queue
+import threading
+import traceback
+import pandas as pd
+from src.utils.log_file import log_message
+
+# Snapshot formats: file extension and default compression
+SNAPSHOT_FORMATS = {
+    "csv": (".csv", None),
+    "parquet": (".parquet", "zstd"),
+}
+# Extension added by pandas compression of CSV files
+CSV_COMPRESSION_EXTENSIONS = {"gzip": ".gz", "bz2": ".bz2", "zip": ".zip", "xz": ".xz", "zstd": ".zst"}
+
+
+def write_snapshot(
+    df: pd.DataFrame,
+    path: str,
+    fmt: str = "csv",
+    compression: str = None,
+    index: bool = False,
+) -> str:
+    """
+    Writes a snapshot of a DataFrame, the extension of path is replaced by the one of
+    the format (and of the compression for CSV files).
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): frame to write
+        - path (str): output file path
+        - fmt (str): "csv" or "parquet"
+        - compression (str, optional): compression codec, default of the format if None
+        - index (bool): write the DataFrame index (CSV only)
+
+    Returns
+    -------
+        - str: path of the written file
+    """
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {fmt}, expected one of {list(SNAPSHOT_FORMATS)}")
+    extension, default_compression = SNAPSHOT_FORMATS[fmt]
+    compression = compression or default_compression
+    if fmt == "csv" and compression:
+        extension += CSV_COMPRESSION_EXTENSIONS.get(compression, "")
+    path = os.path.splitext(path)[0] + extension
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fmt == "parquet":
+        df.to_parquet(path, engine="pyarrow", compression=compression, index=False)
+    else:
+        df.to_csv(path, index=index, compression=compression)
+    log_message(f"        File saved to: {path}")
+    return path
+
+
+class SnapshotWriter:
+    """
+    Background writer of loop snapshots (debug dumps and outputs).
+
+    Frames are handed to a writer thread through a bounded queue, so the pipeline only
+    waits for the disk when the queue is full and at close(). Frames are written as they
+    are submitted: they must not be modified afterwards (the loops return new frames and
+    copy their inputs, so the frames they submit are not modified later on).
+
+    Parameters
+    ----------
+    Args:
+        - fmt (str): snapshot format, "csv" or "parquet"
+        - compression (str, optional): compression codec, default of the format if None
+        - max_queue (int): maximum number of snapshots waiting to be written
+        - stage_every (dict, optional): {stage: n} writes one snapshot every n submitted
+          for a stage (e.g. "LOOP_6"), 0 skips the stage. Stages not listed are all written
+    """
+
+    def __init__(
+        self,
+        fmt: str = "csv",
+        compression: str = None,
+        max_queue: int = 4,
+        stage_every: dict = None,
+    ):
+        if fmt not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {fmt}, expected one of {list(SNAPSHOT_FORMATS)}")
+        self.fmt = fmt
+        self.compression = compression
+        self.stage_every = stage_every or {}
+        self.submitted = {}
+        self.written = []
+        self.errors = []
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                df, path, index = item
+                self.written.append(write_snapshot(df, path, self.fmt, self.compression, index))
+            except Exception as e:
+                self.errors.append(e)
+                log_message(f"ERROR writing snapshot {item[1]}: {e}")
+                log_message(traceback.format_exc())
+            finally:
+                self._queue.task_done()
+
+    def wanted(self, stage: str = None) -> bool:
+        """
+        Counts a snapshot of the stage and tells if it has to be written.
+        """
+        every = self.stage_every.get(stage, 1)
+        with self._lock:
+            count = self.submitted.get(stage, 0)
+            self.submitted[stage] = count + 1
+        return every > 0 and count % every == 0
+
+    def submit(self, df: pd.DataFrame, path: str, stage: str = None, index: bool = False) -> bool:
+        """
+        Queues a snapshot, blocks only while the queue is full.
+
+        Returns
+        -------
+            - bool: False if the snapshot is skipped by the stage sampling
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("SnapshotWriter is closed")
+        if not self.wanted(stage):
+            return False
+        self._queue.put((df, path, index))
+        return True
+
+    def close(self):
+        """
+        Waits for the queued snapshots to be written and stops the writer thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+# Snapshot sink used by the loops, None: snapshots are written synchronously as CSV
+_active_writer = None
+
+
+def start_snapshot_sink(**kwargs) -> SnapshotWriter:
+    """
+    Starts the background snapshot sink used by save_snapshot (see SnapshotWriter for the
+    arguments). A sink already running is closed first.
+    """
+    global _active_writer
+    stop_snapshot_sink()
+    _active_writer = SnapshotWriter(**kwargs)
+    return _active_writer
+
+
+def stop_snapshot_sink():
+    """
+    Blocks until all queued snapshots are written, then stops the sink.
+    """
+    global _active_writer
+    writer, _active_writer = _active_writer, None
+    if writer is not None:
+        writer.close()
+        log_message(f"Snapshot sink closed: {len(writer.written)} written, {len(writer.errors)} errors")
+
+
+def save_snapshot(df: pd.DataFrame, path: str, stage: str = None, index: bool = False):
+    """
+    Saves a loop snapshot: queued to the background sink if one is running, otherwise
+    written synchronously as CSV.
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): frame to save, not modified afterwards by the caller
+        - path (str): output file path
+        - stage (str, optional): stage name used by the sink sampling, e.g. "LOOP_6"
+        - index (bool): write the DataFrame index (CSV only)
+    """
+    writer = _active_writer
+    if writer is None:
+        write_snapshot(df, path, "csv", None, index)
+    else:
+        writer.submit(df, path, stage=stage, index=index)
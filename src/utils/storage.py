@@ -0,0 +1,148 @@
+import os
+import pandas as pd
+from src.utils.log_file import log_message, debug_info
+from src.utils.read_and_clean_v1 import read_and_clean_csv
+
+# Storage formats, in order of preference when looking for existing data
+# (CSV is kept as an export format and for data written by previous versions)
+STORAGE_FORMATS = ("parquet", "csv")
+FILE_EXTENSIONS = {"parquet": ".parquet", "csv": ".csv"}
+PARQUET_COMPRESSION = "zstd"
+
+
+def storage_format(path: str) -> str:
+    """
+    Storage format of a file, from its extension.
+
+    Parameters
+    ----------
+    Args:
+        - path (str): file path
+
+    Returns
+    -------
+        - str: "parquet" or "csv"
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, ext in FILE_EXTENSIONS.items():
+        if extension == ext:
+            return fmt
+    raise ValueError(f"Unknown storage format for file: {path}")
+
+
+def data_path(directory: str, name: str, fmt: str = "parquet") -> str:
+    """
+    Path of a data file, e.g. data_path("Fleetstore_Data", "data_output_cruise")
+    -> "Fleetstore_Data/data_output_cruise.parquet".
+    """
+    if fmt not in FILE_EXTENSIONS:
+        raise ValueError(f"Unknown storage format: {fmt}, expected one of {STORAGE_FORMATS}")
+    return os.path.join(directory, f"{name}{FILE_EXTENSIONS[fmt]}")
+
+
+def find_data_files(directory: str, *substrings: str) -> list:
+    """
+    Data files of a directory whose name contains all the substrings (case insensitive).
+    When the same data exists in several formats, only the preferred one is returned
+    (Parquet over CSV).
+
+    Parameters
+    ----------
+    Args:
+        - directory (str): folder to search
+        - substrings (str): substrings the file name must contain, e.g. "data_output_", "cruise"
+
+    Returns
+    -------
+        - list: file names, sorted
+    """
+    files_by_name = {}
+    for file in os.listdir(directory):
+        name, extension = os.path.splitext(file)
+        if extension.lower() not in FILE_EXTENSIONS.values():
+            continue
+        if all(substring.lower() in file.lower() for substring in substrings):
+            files_by_name.setdefault(name, []).append(file)
+
+    found = []
+    for name, files in files_by_name.items():
+        found.append(min(files, key=lambda file: STORAGE_FORMATS.index(storage_format(file))))
+    return sorted(found)
+
+
+def write_frame(df: pd.DataFrame, path: str) -> str:
+    """
+    Writes a DataFrame, the format is given by the file extension.
+
+    Parquet files are compressed and keep the column dtypes (nullable integers,
+    strings, datetimes). CSV files are written for export only.
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): data to write
+        - path (str): output file path (.parquet or .csv)
+
+    Returns
+    -------
+        - str: output file path
+    """
+    fmt = storage_format(path)
+    if fmt == "parquet":
+        df.to_parquet(path, engine="pyarrow", compression=PARQUET_COMPRESSION, index=False)
+    else:
+        # ISO 8601 datetimes with the precision the values need (seconds, or the fractional
+        # seconds if any), read back by read_and_clean_csv
+        df.to_csv(path, index=False)
+    log_message(f"{debug_info()}  File saved to: {path}")
+    return path
+
+
+def read_frame(
+    path: str,
+    columns: list = None,
+    esns: list = None,
+    start: pd.Timestamp = None,
+    end: pd.Timestamp = None,
+) -> pd.DataFrame:
+    """
+    Reads a DataFrame written by write_frame (or a historical CSV file).
+
+    For Parquet files the column projection and the ESN / reportdatetime predicates
+    are pushed down to the reader, so only the selected columns and row groups are
+    decoded. CSV files are read with read_and_clean_csv and filtered after loading.
+
+    Parameters
+    ----------
+    Args:
+        - path (str): file path (.parquet or .csv)
+        - columns (list, optional): columns to load, all if None
+        - esns (list, optional): ESNs to load, all if None
+        - start (pd.Timestamp, optional): earliest reportdatetime to load (inclusive)
+        - end (pd.Timestamp, optional): latest reportdatetime to load (inclusive)
+
+    Returns
+    -------
+        - pd.DataFrame: loaded data
+    """
+    filters = []
+    if esns is not None:
+        filters.append(("ESN", "in", list(esns)))
+    if start is not None:
+        filters.append(("reportdatetime", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("reportdatetime", "<=", pd.Timestamp(end)))
+
+    if storage_format(path) == "parquet":
+        return pd.read_parquet(path, engine="pyarrow", columns=columns, filters=filters or None)
+
+    df = read_and_clean_csv(path)
+    mask = pd.Series(True, index=df.index)
+    if esns is not None:
+        mask &= df["ESN"].isin(esns)
+    if start is not None:
+        mask &= df["reportdatetime"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["reportdatetime"] <= pd.Timestamp(end)
+    df = df[mask].reset_index(drop=True)
+    return df if columns is None else df[columns]
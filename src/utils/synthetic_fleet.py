@@ -0,0 +1,293 @@
+import numpy as np
+import pandas as pd
+from src.utils.parameter_table import FLIGHT_PHASES, KELVIN_COLUMNS, KELVIN_TO_CELSIUS, PARAMETER_TABLE
+
+# Output columns of the Fleetstore queries (Queries/Sql_fleetstore_*.sql), in query order
+FLEETSTORE_COLUMNS = [
+    'ESN', 'reportdatetime', 'datestored', 'operator', 'equipmentid', 'ACID', 'ENGPOS', 'DSCID',
+    'P25__PSI', 'T25__DEGC', 'P30__PSI', 'T30__DEGC', 'TGTU_A__DEGC', 'NL__PC', 'NI__PC', 'NH__PC',
+    'FF__LBHR', 'PS160__PSI', 'PS26S__NOM_PSI', 'TS25S__NOM_K', 'PS30S__NOM_PSI', 'TS30S__NOM_K',
+    'TGTS__NOM_K', 'NL__NOM_PC', 'NI__NOM_PC', 'NH__NOM_PC', 'FF__NOM_LBHR', 'P135S__NOM_PSI',
+    'ALT__FT', 'MN1', 'P20__PSI', 'T20__DEGC']
+
+# Parameters measured on the engine (DA table of the queries), the others are model nominals
+MEASURED_COLUMNS = [
+    'P25__PSI', 'T25__DEGC', 'P30__PSI', 'T30__DEGC', 'TGTU_A__DEGC', 'NL__PC', 'NI__PC', 'NH__PC',
+    'FF__LBHR', 'PS160__PSI', 'ALT__FT', 'MN1', 'P20__PSI', 'T20__DEGC']
+
+# DSCID of each flight phase
+PHASE_DSCID = {'cruise': 52, 'take-off': 53, 'climb': 54}
+# Report time of each flight phase after the start of the flight
+PHASE_OFFSET = {'take-off': pd.Timedelta(0), 'climb': pd.Timedelta(minutes=15), 'cruise': pd.Timedelta(minutes=90)}
+
+# Xrates column of each sensor parameter (performance exchange rates, see xrates_reader)
+XRATES_SENSORS = {
+    'WFE': 'FF__LBHR', 'TGT': 'TGTU_A__DEGC', 'NL': 'NL__PC', 'NI': 'NI__PC', 'NH': 'NH__PC',
+    'P26': 'P25__PSI', 'T26': 'T25__DEGC', 'P30': 'P30__PSI', 'T30': 'T30__DEGC', 'P135': 'PS160__PSI'}
+
+# Nominal of the sensor without limits, as a fraction of the P25 nominal
+P160_TO_P25 = 0.55
+ESN_BASE = 70000
+SENTINEL = -5555
+
+
+def _phase_name(flight_phase: str) -> str:
+    """'cruise' -> 'Cruise', as in FLIGHT_PHASES and the Xrates keys."""
+    return [name for name in FLIGHT_PHASES if name.lower() == flight_phase.lower()][0]
+
+
+def degradation_signatures(xrates: dict = None) -> dict:
+    """
+    Percentage change of each sensor parameter for a +1% change of IPC and HPC efficiency,
+    per flight phase, taken from the Xrates.
+
+    Parameters
+    ----------
+    Args:
+        - xrates (dict, optional): {flight phase: Xrates pd.DataFrame} as returned by
+          Initialise_Algorithm_Settings_engine_type_specific, read from the Xrates file if None
+
+    Returns
+    -------
+        - dict: {flight phase: pd.DataFrame}, rows "IPC ETA" and "HPC ETA", one column per sensor
+    """
+    if xrates is None:
+        from src.utils.xrates_reader import Xrates_reader
+        xrates = dict(Xrates_reader(d) for d in range(len(PHASE_DSCID)))
+    return {
+        flight_phase: df.loc[['IPC ETA', 'HPC ETA'], list(XRATES_SENSORS)].rename(columns=XRATES_SENSORS).astype(float)
+        for flight_phase, df in xrates.items()}
+
+
+def _envelope(limits: pd.DataFrame, sensor: str, spread: float = 0.3) -> tuple:
+    """Middle and half-width (spread x half the limits range) of a parameter envelope."""
+    low, high = limits.loc[sensor].to_numpy()
+    return (low + high) / 2, spread * (high - low) / 2
+
+
+def _fleet_events(rng, times: np.ndarray, shop_visit_rate: float, swap_rate: float,
+                  damage_rate: float) -> tuple:
+    """
+    Engine installed on each aircraft position at each flight, with the start of its
+    degradation clock and its IPC / HPC efficiency steps.
+
+    Returns (esn, clock, ipc_step, hpc_step, events), the arrays of shape
+    (2 * n_aircraft, n_flights), one row per aircraft position (aircraft, ENGPOS 1 and 2).
+    """
+    n_aircraft, n_flights = times.shape
+    n_slots = 2 * n_aircraft
+    slot_times = np.repeat(times, 2, axis=0)
+    esn = np.broadcast_to(ESN_BASE + np.arange(n_slots)[:, None], (n_slots, n_flights)).copy()
+    clock = np.broadcast_to(slot_times[:, :1], (n_slots, n_flights)).copy()
+    ipc_step = np.zeros((n_slots, n_flights))
+    hpc_step = np.zeros((n_slots, n_flights))
+    next_esn = ESN_BASE + n_slots
+
+    # Events drawn per engine flight, applied in time order on each aircraft position
+    kinds = ["shop visit", "engine swap", "IPC damage", "HPC damage"]
+    rates = [shop_visit_rate, swap_rate, damage_rate, damage_rate]
+    draws = [np.nonzero(rng.random((n_slots, n_flights)) < rate) if rate > 0 else (np.array([], int),) * 2
+             for rate in rates]
+    slots = np.concatenate([draw[0] for draw in draws])
+    flights = np.concatenate([draw[1] for draw in draws])
+    kind = np.concatenate([np.full(len(draw[0]), i) for i, draw in enumerate(draws)])
+    order = np.lexsort((flights, slots))
+
+    events = []
+    leased_until = {}
+    for slot, k, event in zip(slots[order], flights[order], kind[order]):
+        if k == 0 or k < leased_until.get(slot, 0):
+            continue
+        t_k = slot_times[slot, k]
+        installed = esn[slot, k]
+        if event == 0:
+            # Engine removed for 45-120 days, a lease engine flies meanwhile, then the
+            # engine comes back restored
+            j = np.searchsorted(slot_times[slot], t_k + rng.uniform(45, 120) * 86400e9)
+            leased_until[slot] = j
+            esn[slot, k:j] = next_esn
+            clock[slot, k:j] = t_k
+            next_esn += 1
+            if j < n_flights:
+                clock[slot, j:] = slot_times[slot, j]
+            ipc_step[slot, k:] = 0
+            hpc_step[slot, k:] = 0
+        elif event == 1:
+            # Engine replaced by a spare engine for good: the sister engine changes
+            esn[slot, k:] = next_esn
+            clock[slot, k:] = t_k
+            next_esn += 1
+            ipc_step[slot, k:] = 0
+            hpc_step[slot, k:] = 0
+        else:
+            steps = ipc_step if event == 2 else hpc_step
+            steps[slot, k:] += rng.uniform(0.5, 2.0)
+        events.append((slot // 2, slot % 2 + 1, installed, kinds[event], t_k))
+    return esn, clock, ipc_step, hpc_step, events
+
+
+def make_fleet_data(
+    n_aircraft: int = 50,
+    flights_per_aircraft: int = 200,
+    flight_phases: tuple = ('cruise', 'climb', 'take-off'),
+    start: str = '2024-01-01',
+    flights_per_day: float = 2.0,
+    n_operators: int = 3,
+    shop_visit_rate: float = 0.002,
+    swap_rate: float = 0.001,
+    damage_rate: float = 0.0005,
+    degradation_per_year: tuple = (0.2, 1.0),
+    noise_pc: float = 0.3,
+    sentinel_rate: float = 0.001,
+    nan_rate: float = 0.001,
+    seed: int = 0,
+    xrates: dict = None,
+    return_events: bool = False,
+):
+    """
+    Synthetic Fleetstore query outputs, with the columns (and column order) of
+    Queries/Sql_fleetstore_*.sql, sorted by reportdatetime as the queries.
+
+    The fleet is n_aircraft aircraft x 2 engines x flights_per_aircraft flights, each flight
+    giving one report per flight phase and engine (both engines of a flight share the
+    reportdatetime, as Loop 2 expects). Along the way:
+        - shop visits: the engine is removed for 45-120 days (a lease engine flies meanwhile)
+          and comes back with its degradation restored
+        - engine swaps: the engine is replaced by a spare one, the sister engine changes
+        - degradation: IPC and HPC efficiency losses, growing with the days since installation
+          (per-engine rate in %/year) plus sudden damage steps of 0.5-2%. The sensor parameters
+          move along the Xrates "IPC ETA" and "HPC ETA" signatures
+        - flight conditions drawn within the flight phase limits, the nominals following them,
+          temperatures nominals in Kelvin
+        - sentinel -5555 values in the measured parameters, missing values in all the parameters
+
+    The output only depends on the arguments (seed included). Generating 10M rows takes
+    less than a minute.
+
+    Parameters
+    ----------
+    Args:
+        - n_aircraft (int): number of aircraft
+        - flights_per_aircraft (int): number of flights of each aircraft
+        - flight_phases (tuple): flight phases to generate
+        - start (str): time of the first flights
+        - flights_per_day (float): average number of flights per aircraft and day
+        - n_operators (int): number of operators, the aircraft being split between them
+        - shop_visit_rate (float): probability of a shop visit per engine flight
+        - swap_rate (float): probability of an engine swap per engine flight
+        - damage_rate (float): probability of an IPC (and of an HPC) damage step per engine flight
+        - degradation_per_year (tuple): range of the per-engine efficiency loss rates (%/year)
+        - noise_pc (float): standard deviation of the measurement noise (%)
+        - sentinel_rate (float): fraction of the measured parameter values set to -5555
+        - nan_rate (float): fraction of the parameter values missing
+        - seed (int): random generator seed
+        - xrates (dict, optional): Xrates per flight phase, read from the Xrates file if None
+        - return_events (bool): also return the injected events
+
+    Returns
+    -------
+        - dict: {flight_phase: pd.DataFrame}
+        - pd.DataFrame (if return_events): events, with 'ACID', 'ENGPOS', 'ESN' (engine
+          installed before the event), 'event' and 'reportdatetime' (flight of the event)
+    """
+    rng = np.random.default_rng(seed)
+    signatures = degradation_signatures(xrates)
+
+    # Flight times, in nanoseconds, aircraft-major (Fleetstore times are to the second)
+    # At least an hour between two flights of the same aircraft
+    turnaround = min(3600.0, 0.5 * 86400 / flights_per_day)
+    gaps = turnaround + rng.exponential(86400 / flights_per_day - turnaround, (n_aircraft, flights_per_aircraft))
+    gaps[:, 0] = rng.uniform(0, 86400, n_aircraft)
+    times = pd.Timestamp(start).value + np.cumsum(gaps, axis=1).astype(np.int64) * 10**9
+
+    esn, clock, ipc_step, hpc_step, events = _fleet_events(
+        rng, times, shop_visit_rate, swap_rate, damage_rate)
+
+    # One row per engine flight, in time order (the phase offsets keep the order)
+    slot_times = np.repeat(times, 2, axis=0).ravel()
+    order = np.argsort(slot_times, kind='stable')
+    slot_times = slot_times[order]
+    slot = np.repeat(np.arange(2 * n_aircraft), flights_per_aircraft)[order]
+    aircraft = slot // 2
+    esn = esn.ravel()[order]
+    n_rows = len(order)
+
+    # Efficiency losses (%): per-engine rate x years since installation, plus damage steps
+    loss_rates = rng.uniform(*degradation_per_year, esn.max() - ESN_BASE + 1)
+    years = (slot_times - clock.ravel()[order]) / (365.25 * 86400e9)
+    ipc_loss = loss_rates[esn - ESN_BASE] * years + ipc_step.ravel()[order]
+    hpc_loss = 0.8 * loss_rates[esn - ESN_BASE] * years + hpc_step.ravel()[order]
+    del clock, ipc_step, hpc_step
+
+    acid = np.array([f"AC{a:04d}" for a in range(n_aircraft)], dtype=object)[aircraft]
+    operator = np.array([f"OP{o + 1}" for o in range(n_operators)], dtype=object)[aircraft % n_operators]
+    engpos = (slot % 2 + 1).astype(np.int64)
+    equipmentid = esn + 1_000_000
+    # Per-engine offsets of the sensors from the nominals (%)
+    engine_bias = rng.normal(0, 0.5, (esn.max() - ESN_BASE + 1, len(XRATES_SENSORS)))
+
+    data_dict = {}
+    for flight_phase in flight_phases:
+        phase = _phase_name(flight_phase)
+        limits = PARAMETER_TABLE[[f"{phase} low limits", f"{phase} high limits"]]
+        reportdatetime = pd.to_datetime(slot_times + PHASE_OFFSET[flight_phase].value)
+        # The frames of the phases do not share any array
+        df = {
+            'ESN': esn.copy(),
+            'reportdatetime': reportdatetime,
+            'datestored': (reportdatetime + pd.to_timedelta(rng.exponential(2.0, n_rows), unit='h')).floor('s'),
+            'operator': operator.copy(),
+            'equipmentid': equipmentid.copy(),
+            'ACID': acid.copy(),
+            'ENGPOS': engpos.copy(),
+            'DSCID': np.full(n_rows, PHASE_DSCID[flight_phase], dtype=np.int64),
+        }
+
+        # Flight condition in the middle of the phase envelope, the nominals follow it
+        alt_mid, alt_half = _envelope(limits, 'ALT__FT')
+        mn_mid, mn_half = _envelope(limits, 'MN1')
+        condition = rng.uniform(-1, 1, n_rows)
+        alt = alt_mid + alt_half * condition
+        mn = mn_mid + mn_half * np.clip(condition + rng.normal(0, 0.3, n_rows), -1, 1)
+        # Inlet total conditions (ISA, troposphere / stratosphere)
+        isa_t = np.maximum(15.0 - 1.98e-3 * alt, -56.5) + KELVIN_TO_CELSIUS
+        isa_p = 14.696 * np.maximum(1 - 6.8756e-6 * alt, 0.2) ** 5.2559
+        ram = 1 + 0.2 * mn ** 2
+
+        signature = signatures[phase]
+        p25_mid, _ = _envelope(limits, 'P25__PSI')
+        for i, (sensor, nominal) in enumerate(PARAMETER_TABLE.loc[list(XRATES_SENSORS.values()), 'nominal'].items()):
+            if sensor == 'PS160__PSI':
+                base = P160_TO_P25 * p25_mid
+            else:
+                base, _ = _envelope(limits, sensor)
+            nominal_values = base * (1 + 0.04 * rng.uniform(-1, 1) * condition)
+            # Efficiency losses move the parameter along the Xrates signatures
+            delta_pc = (-ipc_loss * signature.at['IPC ETA', sensor] - hpc_loss * signature.at['HPC ETA', sensor]
+                        + engine_bias[esn - ESN_BASE, i]
+                        + rng.normal(0, noise_pc, n_rows))
+            df[sensor] = np.round(nominal_values * (1 + delta_pc / 100), 5)
+            df[nominal] = np.round(nominal_values + KELVIN_TO_CELSIUS if nominal in KELVIN_COLUMNS else nominal_values, 5)
+
+        df['ALT__FT'] = np.round(alt, 1)
+        df['MN1'] = np.round(mn, 4)
+        df['P20__PSI'] = np.round(isa_p * ram ** 3.5, 4)
+        df['T20__DEGC'] = np.round(isa_t * ram - KELVIN_TO_CELSIUS, 3)
+
+        # Sentinel values in the measured parameters, missing values in all the parameters
+        parameters = FLEETSTORE_COLUMNS[FLEETSTORE_COLUMNS.index('P25__PSI'):]
+        for rate, value, values in [(sentinel_rate, SENTINEL, MEASURED_COLUMNS), (nan_rate, np.nan, parameters)]:
+            n_cells = rng.binomial(n_rows * len(values), rate)
+            rows = rng.integers(0, n_rows, n_cells)
+            cols = rng.integers(0, len(values), n_cells)
+            for j in np.unique(cols):
+                df[values[j]][rows[cols == j]] = value
+        # Columns kept as separate arrays, no consolidation copy
+        data_dict[flight_phase] = pd.DataFrame({col: df[col] for col in FLEETSTORE_COLUMNS}, copy=False)
+
+    if not return_events:
+        return data_dict
+    df_events = pd.DataFrame(events, columns=['aircraft', 'ENGPOS', 'ESN', 'event', 'time'])
+    df_events.insert(0, 'ACID', [f"AC{a:04d}" for a in df_events.pop('aircraft')])
+    df_events['reportdatetime'] = pd.to_datetime(df_events.pop('time').astype(np.int64))
+    return data_dict, df_events.sort_values('reportdatetime', ignore_index=True)
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+import pandas as pd
+from src.utils.log_file import log_message, debug_info
+from src.utils.storage import data_path, find_data_files, read_frame, write_frame
+
+
+def tail_retention_mask(
+    df: pd.DataFrame,
+    lag_list: list = [50, 100, 200, 400],
+    WindowSemiWidth: int = 10,
+) -> np.ndarray:
+    """
+    Rows of each ESN history needed to process new data incrementally.
+
+    A row is kept if it belongs to:
+        - the last max(lag_list) + win_size rows of its ESN: the MAV inputs of Loop 4
+          (win_size = 2 * WindowSemiWidth + 1), the lagged MAV values of Loop 5 and the
+          last row, holding the latest sister ESN and timestamp for Loops 2-3
+        - the last Lag rows of its ESN flagged "IPC ETA" / "HPC ETA" in the
+          VAR{1,2,3}_IDENTIFIER{Lag} columns: the rolling-window buffers of Loop 8
+
+    Parameters
+    ----------
+    Args:
+        - df (pd.DataFrame): history with 'ESN' and 'reportdatetime'
+        - lag_list (list): lag windows of Loops 5-8
+        - WindowSemiWidth (int): semi-width of the Loop 4 moving window
+
+    Returns
+    -------
+        - np.ndarray: boolean mask aligned with the rows of df
+    """
+    n_rows = len(df)
+    keep = np.zeros(n_rows, dtype=bool)
+    if n_rows == 0:
+        return keep
+
+    # Position of each row counted from the newest row of its ESN
+    order = np.argsort(df['reportdatetime'].to_numpy(), kind='stable')[::-1]
+    esn = df['ESN'].to_numpy()[order]
+    from_newest = pd.Series(esn).groupby(esn, sort=False).cumcount().to_numpy()
+
+    n_tail = max(lag_list) + 2 * WindowSemiWidth + 1
+    keep[order] = from_newest < n_tail
+
+    # Loop 8 rolling-window buffers
+    for Lag in lag_list:
+        xrate_identifier_columns = [f"VAR{i}_IDENTIFIER{Lag}" for i in (1, 2, 3)]
+        if not set(xrate_identifier_columns).issubset(df.columns):
+            continue
+        identifiers = df[xrate_identifier_columns].iloc[order]
+        for comp in ["IPC", "HPC"]:
+            comp_rows = identifiers.eq(f"{comp} ETA").any(axis=1).to_numpy()
+            comp_rank = pd.Series(comp_rows).groupby(esn, sort=False).cumsum().to_numpy()
+            keep[order[comp_rows & (comp_rank <= Lag)]] = True
+    return keep
+
+
+class TailStateStore:
+    """
+    Per-ESN bounded history of a flight phase, kept between runs.
+
+    Replaces the full data_output_{phase}.csv history as input of the next run: only
+    the rows selected by tail_retention_mask are stored, so merging and processing new
+    data costs time proportional to the new rows and the bounded tail of their ESNs,
+    not to the fleet history.
+
+    Limitation: the stored tails are full-width rows (all the query and loop columns),
+    not a compact per-ESN state, and the loops reprocess the tail rows along with the
+    new ones. The saving comes from the bounded number of rows, not from the width.
+    The tails hold the loop inputs only: the full output of the run is merged back into
+    data_output_{phase} by merge_history.
+
+    Parameters
+    ----------
+    Args:
+        - directory (str): folder of the state files (usually Fleetstore_Data)
+        - flight_phase (str): flight phase of the state
+        - lag_list (list): lag windows of Loops 5-8
+        - WindowSemiWidth (int): semi-width of the Loop 4 moving window
+        - state_str (str): prefix of the state file name
+        - fmt (str): storage format of the state file, "parquet" or "csv"
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flight_phase: str,
+        lag_list: list = [50, 100, 200, 400],
+        WindowSemiWidth: int = 10,
+        state_str: str = 'tail_state_',
+        fmt: str = 'parquet',
+    ):
+        self.directory = directory
+        self.flight_phase = flight_phase
+        self.lag_list = lag_list
+        self.WindowSemiWidth = WindowSemiWidth
+        self.path = data_path(directory, f"{state_str}{flight_phase.lower()}", fmt)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self, esns=None) -> pd.DataFrame:
+        """
+        Loads the stored tails, optionally only those of the ESNs listed.
+
+        Parameters
+        ----------
+        Args:
+            - esns (array-like, optional): ESNs to load, all if None
+
+        Returns
+        -------
+            - pd.DataFrame: stored rows, empty DataFrame if there is no state yet
+        """
+        if not self.exists():
+            return pd.DataFrame()
+        return read_frame(self.path, esns=esns)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Stores the tails of the ESNs in the processed data, the tails of the other
+        ESNs are left unchanged.
+
+        Parameters
+        ----------
+        Args:
+            - df (pd.DataFrame): processed data of this run (Loops 0-8 output)
+
+        Returns
+        -------
+            - pd.DataFrame: stored state
+        """
+        df_tail = df[tail_retention_mask(df, self.lag_list, self.WindowSemiWidth)]
+        df_state = self.load()
+        if not df_state.empty:
+            df_state = df_state[~df_state['ESN'].isin(df['ESN'].unique())]
+            df_tail = pd.concat([df_state, df_tail], ignore_index=True)
+        df_tail = df_tail.sort_values(by='reportdatetime', ascending=False).reset_index(drop=True)
+
+        os.makedirs(self.directory, exist_ok=True)
+        write_frame(df_tail, self.path)
+        log_message(f"{debug_info()}  {self.flight_phase} tail state: {len(df_tail)} rows")
+        return df_tail
+
+    def merge_history(self, df: pd.DataFrame, data_str: str = 'data_output_', n_pts: int = 650) -> pd.DataFrame:
+        """
+        Full output of a tail-state run: the processed data (tails and new rows of the
+        ESNs with new data) merged into the stored data_output_{phase} history, so that
+        the other ESNs and the rows older than the tails are not lost when it is rewritten.
+
+        Parameters
+        ----------
+        Args:
+            - df (pd.DataFrame): processed data of this run (Loops 0-8 output)
+            - data_str (str): prefix of the history file name
+            - n_pts (int): maximum number of rows kept per ESN, newest first (as df_merger_new)
+
+        Returns
+        -------
+            - pd.DataFrame: merged history, newest first
+        """
+        history_files = find_data_files(self.directory, data_str, self.flight_phase) \
+            if os.path.isdir(self.directory) else []
+        if not history_files:
+            return df
+        df_history = read_frame(os.path.join(self.directory, history_files[0]))
+        # The reprocessed rows replace their stored version
+        df_merged = pd.concat([df_history, df], ignore_index=True)
+        df_merged = df_merged.drop_duplicates(
+            subset=['ESN', 'ACID', 'ENGPOS', 'reportdatetime'], keep='last')
+        df_merged = df_merged.sort_values(by='reportdatetime', ascending=False)
+        df_merged = df_merged.groupby('ESN', group_keys=False).head(n_pts).reset_index(drop=True)
+        log_message(f"{debug_info()}  {self.flight_phase} output: {len(df)} processed rows merged "
+                    f"into {len(df_history)} stored rows")
+        return df_merged
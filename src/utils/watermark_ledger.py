@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import pandas as pd
+from src.utils.log_file import log_message, debug_info
+from src.utils.query_builder import add_predicates, select_columns
+
+# Key of the flight phase high-water mark (the other keys are operator codes)
+PHASE_KEY = "*"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _sql_string(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def format_watermark(ts: pd.Timestamp) -> str:
+    """
+    Text of a mark, to the millisecond (precision of the SQL Server datetime type).
+    """
+    text = ts.strftime(TIMESTAMP_FORMAT)
+    return text + f".{ts.microsecond // 1000:03d}" if ts.microsecond else text
+
+
+class WatermarkLedger:
+    """
+    High-water marks of the ingestion: the latest reportdatetime fetched for each flight
+    phase, and optionally for each operator of the phase, kept between runs in a JSON file
+    (working_data/watermarks.json).
+
+    Each query only returns the rows above the marks of its flight phase (see render), so
+    the phases no longer re-fetch the overlap down to the slowest phase (timestamp.txt).
+    The marks of a run are staged while the queries run (observe) and written atomically
+    by commit, once the run has succeeded: a failed run fetches the same rows again.
+
+    A flight phase without mark keeps the timestamp.txt start (see load_and_replace_sql).
+
+    Parameters
+    ----------
+    Args:
+        - path (str): ledger file path
+        - per_operator (bool): keep and apply a mark per operator, so that an operator
+          reporting late is not skipped past by the others
+    """
+
+    def __init__(self, path: str, per_operator: bool = False):
+        self.path = path
+        self.per_operator = per_operator
+        self._lock = threading.Lock()
+        self.marks = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.marks = json.load(f)
+        self.staged = {}
+
+    def watermark(self, flight_phase: str, operator: str = None):
+        """
+        Committed mark of a flight phase (or of an operator of the phase, falling back on
+        the phase mark), None if there is none yet.
+        """
+        phase_marks = self.marks.get(flight_phase.lower(), {})
+        mark = phase_marks.get(operator) if self.per_operator and operator is not None else None
+        mark = mark or phase_marks.get(PHASE_KEY)
+        return None if mark is None else pd.Timestamp(mark)
+
+    def _operator_marks(self, flight_phase: str) -> dict:
+        if not self.per_operator:
+            return {}
+        return {operator: pd.Timestamp(mark)
+                for operator, mark in self.marks.get(flight_phase.lower(), {}).items()
+                if operator != PHASE_KEY}
+
+    def render(self, query: str, flight_phase: str) -> str:
+        """
+        Restricts a Fleetstore query template to the rows above the marks of the flight
+        phase: %startTimestamp% is replaced by the earliest mark and the strict predicates
+        reportdatetime > mark are added. The query is returned unchanged without mark.
+
+        Parameters
+        ----------
+        Args:
+            - query (str): query template text
+            - flight_phase (str): flight phase
+
+        Returns
+        -------
+            - str: query text
+        """
+        phase_mark = self.watermark(flight_phase)
+        if phase_mark is None:
+            return query
+        columns = select_columns(query)
+        reportdatetime = columns["reportdatetime"]
+        operator_marks = self._operator_marks(flight_phase) if "operator" in columns else {}
+
+        start = min([phase_mark, *operator_marks.values()])
+        query = query.replace("%startTimestamp%", _sql_string(format_watermark(start)))
+        if not operator_marks:
+            return add_predicates(query, [f"{reportdatetime} > {_sql_string(format_watermark(phase_mark))}"])
+
+        operator = columns["operator"]
+        conditions = [
+            f"({operator} = {_sql_string(code)} AND {reportdatetime} > {_sql_string(format_watermark(mark))})"
+            for code, mark in operator_marks.items()]
+        known = ", ".join(_sql_string(code) for code in operator_marks)
+        conditions.append(
+            f"(({operator} NOT IN ({known}) OR {operator} IS NULL) AND "
+            f"{reportdatetime} > {_sql_string(format_watermark(phase_mark))})")
+        return add_predicates(query, ["(" + " OR ".join(conditions) + ")"])
+
+    def new_rows(self, data: pd.DataFrame, flight_phase: str):
+        """
+        Rows above the committed marks of the flight phase, i.e. fetched by this run.
+
+        Parameters
+        ----------
+        Args:
+            - data (pd.DataFrame): merged data, with 'reportdatetime' (and 'operator')
+            - flight_phase (str): flight phase
+
+        Returns
+        -------
+            - np.ndarray: boolean mask aligned with the rows of data, None without mark
+        """
+        phase_mark = self.watermark(flight_phase)
+        if phase_mark is None:
+            return None
+        marks = pd.Series(phase_mark, index=data.index)
+        operator_marks = self._operator_marks(flight_phase)
+        if operator_marks and "operator" in data.columns:
+            marks = data["operator"].map(operator_marks).astype("datetime64[ns]").fillna(phase_mark)
+        return (data["reportdatetime"] > marks).to_numpy()
+
+    def observe(self, flight_phase: str, data: pd.DataFrame):
+        """
+        Stages the marks of the raw query output (or of a chunk of it), before any row
+        is filtered out: the rows dropped by the cleaning are not fetched again either.
+        """
+        if data.empty:
+            return
+        reportdatetime = pd.to_datetime(data["reportdatetime"])
+        latest = {PHASE_KEY: reportdatetime.max()}
+        if self.per_operator and "operator" in data.columns:
+            latest.update(reportdatetime.groupby(data["operator"]).max().to_dict())
+        with self._lock:
+            phase_marks = self.staged.setdefault(flight_phase.lower(), {})
+            for key, mark in latest.items():
+                if pd.notna(mark) and (key not in phase_marks or mark > phase_marks[key]):
+                    phase_marks[key] = mark
+
+    def discard(self, flight_phase: str):
+        """
+        Drops the staged marks of a flight phase whose ingestion failed: its rows are
+        fetched again by the next run.
+        """
+        with self._lock:
+            self.staged.pop(flight_phase.lower(), None)
+
+    def commit(self) -> dict:
+        """
+        Merges the staged marks into the ledger (a mark never moves back) and rewrites
+        the file atomically.
+
+        Returns
+        -------
+            - dict: {flight_phase: {operator or "*": mark}} committed marks
+        """
+        with self._lock:
+            for flight_phase, staged in self.staged.items():
+                phase_marks = self.marks.setdefault(flight_phase, {})
+                for key, mark in staged.items():
+                    if key not in phase_marks or mark > pd.Timestamp(phase_marks[key]):
+                        phase_marks[key] = format_watermark(mark)
+            self.staged = {}
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.marks, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        log_message(f"{debug_info()}  Watermarks updated: "
+                    + ", ".join(f"{phase} {marks.get(PHASE_KEY)}" for phase, marks in self.marks.items()))
+        return self.marks
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_stages import (
+    ResourceSampler,
+    compare_to_baseline,
+    load_baseline,
+    measure,
+    save_baseline,
+    scaling_exponents,
+)
+
+
+def suite(wall_s, peak_rss_mb=500.0, aircraft=20):
+    return {"runs": [{"aircraft": aircraft, "rows": 1000,
+                      "stages": {"LOOP 4": {"wall_s": wall_s, "cpu_s": wall_s, "peak_rss_mb": peak_rss_mb}}}]}
+
+
+class TestMeasure:
+
+    def test_metrics_and_fresh_inputs(self):
+        df = pd.DataFrame({"x": np.arange(5)})
+
+        def mutate(df):
+            df["x"] += 1
+            return df["x"].sum()
+
+        result, metrics = measure(mutate, df, repeat=3)
+        # Every call starts from the same input
+        assert result == 15 and df["x"].sum() == 10
+        assert set(metrics) == {"wall_s", "cpu_s", "peak_rss_mb"}
+        assert metrics["peak_rss_mb"] > 0
+
+    def test_peak_rss_covers_allocations(self):
+        with ResourceSampler(interval=0.001) as baseline:
+            pass
+        with ResourceSampler(interval=0.001) as sampler:
+            block = np.ones(64 * 2**20 // 8)
+            block.sum()
+            del block
+        assert sampler.metrics["peak_rss_mb"] >= baseline.metrics["peak_rss_mb"] + 50
+
+
+class TestRegressionGate:
+
+    def test_within_tolerance(self):
+        assert compare_to_baseline(suite(1.2), suite(1.0)) == []
+
+    def test_slower_stage_flagged(self):
+        regressions = compare_to_baseline(suite(1.5), suite(1.0))
+        assert [(r["stage"], r["metric"], r["change"]) for r in regressions] == [
+            ("LOOP 4", "wall_s", 0.5), ("LOOP 4", "cpu_s", 0.5)]
+        # Configurable tolerance
+        assert compare_to_baseline(suite(1.5), suite(1.0), tolerance={"wall_s": 0.6, "cpu_s": 0.6}) == []
+
+    def test_noise_floor_and_unknown_sizes(self):
+        # +100% on a 10 ms stage is noise
+        assert compare_to_baseline(suite(0.02), suite(0.01)) == []
+        assert compare_to_baseline(suite(1.0, peak_rss_mb=700.0), suite(1.0))[0]["metric"] == "peak_rss_mb"
+        assert compare_to_baseline(suite(5.0, aircraft=80), suite(1.0)) == []
+
+    def test_baseline_roundtrip(self, tmp_path):
+        path = str(tmp_path / "baselines" / "bench_stages.json")
+        assert load_baseline(path) is None
+        save_baseline(suite(1.0), path)
+        assert load_baseline(path) == suite(1.0)
+
+
+class TestScaling:
+
+    def test_exponents(self):
+        runs = [{"rows": rows, "stages": {"linear": {"wall_s": rows * 1e-4},
+                                          "quadratic": {"wall_s": rows ** 2 * 1e-8}}}
+                for rows in [1000, 4000, 16000]]
+        runs[0]["stages"]["late"] = {"wall_s": 1.0}
+        assert scaling_exponents(runs) == {"linear": 1.0, "quadratic": 2.0}
@@ -0,0 +1,105 @@
+import os
+import pandas as pd
+import pytest
+
+import src.Live_Data_Mode_debug_v1 as live_data_mode
+from src.Live_Data_Mode_debug_v1 import Live_Data_Mode
+from src.utils.watermark_ledger import WatermarkLedger
+
+
+def phase_data(flight_phase, new_flag=1):
+    dscid = {"take-off": 53, "climb": 54, "cruise": 52}[flight_phase]
+    return pd.DataFrame({
+        "ESN": [1001, 1002],
+        "operator": ["OpA", "OpB"],
+        "ACID": ["AC1", "AC2"],
+        "ENGPOS": [1, 2],
+        "DSCID": [dscid, dscid],
+        "reportdatetime": pd.to_datetime(["2025-01-01 12:00:00", "2025-01-01 12:10:00"]),
+        "NEW_FLAG": [new_flag, new_flag],
+        "FRACTION_GT_1": [0.1, 0.5],
+    })
+
+
+@pytest.fixture
+def live_run(tmp_path, monkeypatch):
+    """Run folder with the loops 0-8 replaced by pass-through stages recording their calls."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "working_data").mkdir()
+    monkeypatch.setattr(live_data_mode, "Initialise_Algorithm_Settings_engine_type_specific",
+                        lambda: ({"lim": 0.07, "num": 3}, {}))
+    monkeypatch.setattr(live_data_mode, "Xrates_dic_vector_norm", lambda Xrates: Xrates)
+    calls = []
+
+    def stage(loop):
+        def run(df, flight_phase, **kwargs):
+            calls.append((loop, flight_phase, kwargs))
+            return df
+        return run
+
+    for loop in ["Loop0", "Loop2", "Loop3", "Loop4", "Loop5", "Loop6", "Loop7", "Loop8"]:
+        monkeypatch.setattr(live_data_mode, loop, stage(loop))
+    return calls
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    """Query outputs of the next run (two new rows per phase), staged in the ledger of the run."""
+    query_outputs = {phase: phase_data(phase) for phase in ["take-off", "climb", "cruise"]}
+
+    def data_ingestion(root_dir, ledger=None, **kwargs):
+        data_dict = {phase: data.copy() for phase, data in query_outputs.items()}
+        for phase, data in data_dict.items():
+            ledger.observe(phase, data)
+        return data_dict
+
+    monkeypatch.setattr(live_data_mode, "data_ingestion", data_ingestion)
+    return query_outputs
+
+
+class TestLiveDataMode:
+
+    def test_fit_cache_enabled(self, live_run):
+        Live_Data_Mode(data_dict={phase: phase_data(phase) for phase in ["take-off", "climb", "cruise"]})
+        loop_6 = [kwargs for loop, _, kwargs in live_run if loop == "Loop6"]
+        assert len(loop_6) == 3
+        assert all(kwargs["fit_cache_path"] == os.path.join(os.getcwd(), "working_data", "fit_cache.db")
+                   for kwargs in loop_6)
+
+    def test_failed_loop_keeps_the_watermark(self, live_run, ingestion, monkeypatch, tmp_path):
+        watermarks = str(tmp_path / "working_data" / "watermarks.json")
+        ledger = WatermarkLedger(watermarks)
+        ledger.observe("cruise", pd.DataFrame({"reportdatetime": ["2024-12-31 00:00:00"]}))
+        ledger.commit()
+
+        def failing_loop_6(df, flight_phase, **kwargs):
+            if flight_phase == "cruise":
+                raise ValueError("bad fit")
+            return df
+
+        monkeypatch.setattr(live_data_mode, "Loop6", failing_loop_6)
+        stage_errors = Live_Data_Mode()
+        assert stage_errors == {("cruise", "LOOP 6 - Signatures fit")}
+
+        ledger = WatermarkLedger(watermarks)
+        assert ledger.watermark("cruise") == pd.Timestamp("2024-12-31 00:00:00")
+        assert ledger.watermark("climb") == pd.Timestamp("2025-01-01 12:10:00")
+        # The half-processed cruise rows are not saved, they are fetched again
+        outputs = sorted(os.listdir(tmp_path / "Fleetstore_Data"))
+        assert "data_output_climb.parquet" in outputs and "data_output_cruise.parquet" not in outputs
+
+    def test_phase_without_new_data_joined_from_its_output(self, live_run, ingestion, tmp_path):
+        Live_Data_Mode()
+        merged_output = tmp_path / "Fleetstore_Data" / "Loop_9_combine_DSC_merged_output.csv"
+        merged_output.unlink()
+        stored_cruise = pd.read_parquet(tmp_path / "Fleetstore_Data" / "data_output_cruise.parquet")
+        live_run.clear()
+
+        # Every cruise row is below its watermark
+        ingestion["cruise"] = ingestion["cruise"].iloc[:0]
+        assert Live_Data_Mode() == set()
+        assert {phase for _, phase, _ in live_run} == {"take-off", "climb"}
+        # Loop 9 still joined the three phases, the cruise output is left as it was
+        assert merged_output.exists()
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(tmp_path / "Fleetstore_Data" / "data_output_cruise.parquet"), stored_cruise)
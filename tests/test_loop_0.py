@@ -258,3 +258,117 @@ class TestProcessOnlyNew:
         assert pd.isna(df_out.loc[0, "PS26__DEL_PC"])
         # New row should be processed correctly
         assert df_out.loc[1, "PS26__DEL_PC"] == 10.0
+
+    def test_old_rows_keep_existing_deltas(self):
+        """
+        Deltas already stored on old rows (e.g. from the previous run) are not recomputed.
+        """
+        df = pd.DataFrame({
+            "ESN": [1, 1],
+            "reportdatetime": ["2025-01-01", "2025-01-02"],
+            "NEW_FLAG": [0, 1],
+            "P25__PSI": [999.0, 110.0],
+            "PS26S__NOM_PSI": [999.0, 100.0],
+            "T25__DEGC": [999.0, 210.0],
+            "TS25S__NOM_K": [999.0, 200.0],
+            "P30__PSI": [999.0, 305.0],
+            "PS30S__NOM_PSI": [999.0, 300.0],
+            "T30__DEGC": [999.0, 405.0],
+            "TS30S__NOM_K": [999.0, 400.0],
+            "TGTU_A__DEGC": [999.0, 600.0],
+            "TGTS__NOM_K": [999.0, 500.0],
+            "NL__PC": [999.0, 101.0],
+            "NL__NOM_PC": [999.0, 100.0],
+            "NI__PC": [999.0, 202.0],
+            "NI__NOM_PC": [999.0, 200.0],
+            "NH__PC": [999.0, 303.0],
+            "NH__NOM_PC": [999.0, 300.0],
+            "FF__LBHR": [999.0, 505.0],
+            "FF__NOM_LBHR": [999.0, 500.0],
+            "PS160__PSI": [999.0, 410.0],
+            "P135S__NOM_PSI": [999.0, 400.0],
+            "PS26__DEL_PC": [-1.0, np.nan],
+        })
+
+        df_out = Loop_0_delta_calc(df, flight_phase="cruise", DebugOption=0)
+
+        assert df_out.loc[0, "PS26__DEL_PC"] == -1.0
+        assert df_out.loc[1, "PS26__DEL_PC"] == 10.0
+        assert df_out.loc[1, "P160__DEL_PC"] == 2.5
+
+    def test_reuse_query_deltas(self):
+        """
+        Deltas returned by the query are kept, new rows without them are computed.
+        """
+        df = pd.DataFrame({
+            "ESN": [1, 1],
+            "reportdatetime": ["2025-01-01", "2025-01-02"],
+            "NEW_FLAG": [1, 1],
+            "P25__PSI": [110.0, 110.0],
+            "PS26S__NOM_PSI": [100.0, 100.0],
+            "T25__DEGC": [210.0, 210.0],
+            "TS25S__NOM_K": [200.0, 200.0],
+            "P30__PSI": [305.0, 305.0],
+            "PS30S__NOM_PSI": [300.0, 300.0],
+            "T30__DEGC": [405.0, 405.0],
+            "TS30S__NOM_K": [400.0, 400.0],
+            "TGTU_A__DEGC": [600.0, 600.0],
+            "TGTS__NOM_K": [500.0, 500.0],
+            "NL__PC": [101.0, 101.0],
+            "NL__NOM_PC": [100.0, 100.0],
+            "NI__PC": [202.0, 202.0],
+            "NI__NOM_PC": [200.0, 200.0],
+            "NH__PC": [303.0, 303.0],
+            "NH__NOM_PC": [300.0, 300.0],
+            "FF__LBHR": [505.0, 505.0],
+            "FF__NOM_LBHR": [500.0, 500.0],
+            "PS160__PSI": [410.0, 410.0],
+            "P135S__NOM_PSI": [400.0, 400.0],
+        })
+        # First row as returned by a pushed down query, second one without the deltas
+        for col in ["PS26__DEL_PC", "T25__DEL_PC", "P30__DEL_PC", "T30__DEL_PC", "TGTU__DEL_PC",
+                    "NL__DEL_PC", "NI__DEL_PC", "NH__DEL_PC", "FF__DEL_PC", "P160__DEL_PC"]:
+            df[col] = [-1.0, np.nan]
+
+        df_out = Loop_0_delta_calc(df, flight_phase="cruise", DebugOption=0, reuse_query_deltas=True)
+        assert df_out.loc[0, "PS26__DEL_PC"] == -1.0
+        assert df_out.loc[1, "PS26__DEL_PC"] == 10.0
+
+        df_out = Loop_0_delta_calc(df, flight_phase="cruise", DebugOption=0)
+        assert (df_out["PS26__DEL_PC"] == 10.0).all()
+
+    def test_float32_path(self):
+        """
+        The float32 path returns the same deltas within float32 precision.
+        """
+        df = pd.DataFrame({
+            "ESN": [1],
+            "reportdatetime": ["2025-01-01"],
+            "NEW_FLAG": [1],
+            "P25__PSI": [110.0],
+            "PS26S__NOM_PSI": [100.0],
+            "T25__DEGC": [210.0],
+            "TS25S__NOM_K": [200.0],
+            "P30__PSI": [305.0],
+            "PS30S__NOM_PSI": [300.0],
+            "T30__DEGC": [405.0],
+            "TS30S__NOM_K": [400.0],
+            "TGTU_A__DEGC": [600.0],
+            "TGTS__NOM_K": [500.0],
+            "NL__PC": [101.0],
+            "NL__NOM_PC": [100.0],
+            "NI__PC": [202.0],
+            "NI__NOM_PC": [200.0],
+            "NH__PC": [303.0],
+            "NH__NOM_PC": [300.0],
+            "FF__LBHR": [505.0],
+            "FF__NOM_LBHR": [500.0],
+            "PS160__PSI": [410.0],
+            "P135S__NOM_PSI": [400.0],
+        })
+
+        df_out = Loop_0_delta_calc(
+            df, flight_phase="cruise", DebugOption=0, float32=True)
+
+        assert df_out["PS26__DEL_PC"].dtype == np.float32
+        assert df_out["P30__DEL_PC"].iloc[0] == pytest.approx(1.66667, rel=1e-5)
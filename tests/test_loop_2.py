@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 import pytest
-from src.Loop_2_E2E_v1 import Loop_2_E2E
+from src.Loop_2_E2E_v1 import Loop_2_E2E, e2e_pairing
 
 
 class TestHappyPath:
@@ -130,6 +130,47 @@ class TestEdgeCases:
                             "PS26__DEL_PC_E2E"].iloc[0] == pytest.approx(20.0 - 22.0)
 
 
+class TestPairingEngine:
+    """
+    Tests for the columnar pairing engine against a per-group reference.
+    """
+
+    def test_matches_per_group_reference(self):
+        rng = np.random.default_rng(0)
+        n = 400
+        df = pd.DataFrame({
+            "ACID": rng.choice(["AC1", "AC2", "AC3"], n),
+            "reportdatetime": pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(rng.integers(0, 60, n), unit="h"),
+            "ESN": rng.integers(1, 6, n),
+            "PS26__DEL_PC": np.round(rng.normal(0, 2, n), 5),
+            "T25__DEL_PC": np.round(rng.normal(0, 2, n), 5),
+        })
+        input_columns = ["PS26__DEL_PC", "T25__DEL_PC", "P30__DEL_PC"]
+
+        df_out = e2e_pairing(df, input_columns)
+
+        # Reference: the group-by-group pairing rule
+        rows = []
+        for _, group in df.groupby(["ACID", "reportdatetime"]):
+            if group["ESN"].nunique() != 2:
+                continue
+            group = group.sort_values("ESN", kind="stable").reset_index(drop=True)
+            for i, row in group.iterrows():
+                sister = group.iloc[1] if i == 0 else group.iloc[0]
+                rows.append([row["ESN"], sister["ESN"],
+                             round(row["PS26__DEL_PC"] - sister["PS26__DEL_PC"], 5),
+                             round(row["T25__DEL_PC"] - sister["T25__DEL_PC"], 5)])
+        expected = np.array(rows, dtype=float)
+
+        assert len(df_out) == len(expected)
+        assert (df_out["ESN"].to_numpy() == expected[:, 0]).all()
+        assert (df_out["SISTER_ESN"].to_numpy() == expected[:, 1]).all()
+        assert np.array_equal(df_out["PS26__DEL_PC_E2E"].to_numpy(), expected[:, 2])
+        assert np.array_equal(df_out["T25__DEL_PC_E2E"].to_numpy(), expected[:, 3])
+        assert df_out["P30__DEL_PC_E2E"].isna().all()
+
+
 class TestDebugOption:
     """
     Tests related to the DebugOption flag that controls CSV saving.
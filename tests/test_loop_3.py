@@ -143,6 +143,33 @@ class TestEdgeCases:
         assert df_out.empty
 
 
+class TestLegacyEquivalence:
+    """
+    The grouped-shift implementation must match the previous per-ESN loop.
+    """
+
+    def test_matches_legacy_loop(self):
+        import numpy as np
+        from src.backups.Loop_3_flag_sv_and_eng_change_backup import (
+            Loop_3_flag_sv_and_eng_change as Loop_3_legacy)
+
+        rng = np.random.default_rng(1)
+        n = 300
+        df = pd.DataFrame({
+            "ESN": rng.integers(1, 15, n),
+            "NEW_FLAG": rng.choice([0, 1], n, p=[0.3, 0.7]),
+            "reportdatetime": pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(rng.permutation(n), unit="h"),
+            "SISTER_ESN": rng.choice([100.0, 200.0, np.nan], n, p=[0.6, 0.3, 0.1]),
+            "days_since_prev": rng.choice([0.0, 5.0, 45.0, np.nan], n),
+        })
+
+        df_out = Loop_3_flag_sv_and_eng_change(df, flight_phase="cruise", DebugOption=0)
+        df_ref = Loop_3_legacy(df, flight_phase="cruise", DebugOption=0)
+
+        pd.testing.assert_frame_equal(df_out, df_ref)
+
+
 class TestDebugOption:
     """
     Tests related to the DebugOption flag that controls CSV saving.
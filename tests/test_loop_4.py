@@ -227,6 +227,26 @@ class TestEdgeCases:
             DebugOption=0)
         assert df_out.empty
 
+    def test_esn_shards_in_parallel(self):
+        """
+        Splitting the ESNs across worker processes gives the same output.
+        """
+        n = 30
+        df = pd.concat([
+            pd.DataFrame({
+                "ESN": esn,
+                "reportdatetime": pd.date_range(start='2025-01-01', periods=n, freq='D') + pd.Timedelta(hours=esn),
+                "NEW_FLAG": [0] * (n - n_new) + [1] * n_new,
+                "FlagSV": [0] * n,
+                "FlagSisChg": [0] * n,
+                "PS26__DEL_PC_E2E": [float(esn * i % 7) for i in range(n)],
+                "T25__DEL_PC_E2E": [float(i) for i in range(n)],
+            }) for esn, n_new in [(1, 5), (2, 10), (3, 0), (4, 30)]], ignore_index=True)
+
+        df_serial = Loop_4_movavg(df.copy(), flight_phase="cruise", WindowSemiWidth=2, DebugOption=0)
+        df_parallel = Loop_4_movavg(df.copy(), flight_phase="cruise", WindowSemiWidth=2, DebugOption=0, n_jobs=2)
+        pd.testing.assert_frame_equal(df_parallel, df_serial)
+
 
 class TestDebugOption:
     """
@@ -150,3 +150,31 @@ class TestLoop5EdgeCases:
 
         # Row 1 should remain NaN because of NaN in source
         assert np.isnan(out.loc[1, "PS26__DEL_PC_E2E_MAV_NO_STEPS_LAG_1"])
+
+
+# --------------------------------------------------------------------
+# Equivalence with the previous row-by-row implementation
+# --------------------------------------------------------------------
+class TestLoop5LegacyEquivalence:
+    def test_matches_legacy_loop(self):
+        from src.backups.Loop_5_performance_trend_backup import (
+            Loop5_performance_trend as Loop5_legacy)
+
+        rng = np.random.default_rng(2)
+        n = 240
+        mav_cols = [f"{p}__DEL_PC_E2E_MAV_NO_STEPS" for p in
+                    ['PS26', 'T25', 'P30', 'T30', 'TGTU', 'NL', 'NI', 'NH', 'FF', 'P160']]
+        df = pd.DataFrame({
+            "ESN": rng.integers(1, 6, n),
+            "reportdatetime": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.permutation(n), unit="h"),
+            "NEW_FLAG": rng.choice([0, 1], n),
+        })
+        df.loc[df["ESN"] == 5, "NEW_FLAG"] = 0  # ESN without new data is left untouched
+        for col in mav_cols:
+            df[col] = np.where(rng.random(n) < 0.1, np.nan, np.round(rng.normal(0, 1, n), 2))
+
+        out = Loop5_performance_trend(df, flight_phase="cruise", Lag=[3, 10, 100], DebugOption=0)
+        ref = Loop5_legacy(df, flight_phase="cruise", Lag=[3, 10, 100], DebugOption=0)
+
+        pd.testing.assert_frame_equal(out, ref)
+
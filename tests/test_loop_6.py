@@ -188,3 +188,73 @@ class TestLoop6FitSignatures:
             DebugOption=0
         )
         assert np.isnan(df_out["VAR1_SHIFT50"].iloc[0])
+
+    def test_sequential_batched_fit(self, sample_df):
+        """
+        Sequential mode fits every new row with the batched solver, without relying on
+        worker globals.
+        """
+        obs_cols = [col for col in sample_df.columns if col.endswith("LAG_")]
+        df = sample_df.rename(columns={col: col + "50" for col in obs_cols})
+        df[[col + "50" for col in obs_cols]] = 0.0
+        df.loc[0, obs_cols[0] + "50"] = 2.0
+        df.loc[1, obs_cols[1] + "50"] = -1.0
+
+        signatures = np.eye(9)[:3]
+        xrates = {"Cruise": pd.DataFrame(
+            np.column_stack([signatures, np.ones(3)]),
+            index=["X1", "X2", "X3"])}
+
+        _init_worker(None, None, None, None)
+        df_out = Loop_6_fit_signatures(
+            df=df,
+            flight_phase="cruise",
+            Xrates=xrates,
+            lag_list=[50],
+            use_parallel=False,
+            DebugOption=0
+        ).set_index("reportdatetime").loc[df["reportdatetime"]]
+
+        assert df_out["VAR1_IDENTIFIER50"].tolist() == ["X1", "X2"]
+        assert df_out["VAR1_SHIFT50"].tolist() == pytest.approx([2.0, -1.0])
+        assert df_out["OBS_MAGNITUDE50"].tolist() == pytest.approx([2.0, 1.0])
+        assert df_out["ERROR_REL50"].tolist() == pytest.approx([0.0, 0.0])
+
+    def test_parallel_blocks_match_sequential(self, sample_df):
+        """
+        The shared-memory block pool gives the same result as the sequential solver.
+        """
+        rng = np.random.default_rng(0)
+        obs_cols = [col for col in sample_df.columns if col.endswith("LAG_")]
+        n = 30
+        df = pd.DataFrame({
+            "NEW_FLAG": [1] * n,
+            "reportdatetime": pd.date_range(start="2025-01-01", periods=n, freq="h"),
+        })
+        for lag in (50, 100):
+            for col in obs_cols:
+                df[col + str(lag)] = np.round(rng.normal(0, 1, n), 3)
+        df.loc[3, obs_cols[0] + "50"] = np.nan
+
+        signatures = rng.normal(0, 1, (5, 9))
+        xrates = {"Cruise": pd.DataFrame(
+            np.column_stack([signatures, np.linalg.norm(signatures, axis=1)]),
+            index=[f"X{i}" for i in range(1, 6)])}
+
+        kwargs = dict(flight_phase="cruise", Xrates=xrates, lag_list=[50, 100], DebugOption=0)
+        df_seq = Loop_6_fit_signatures(df=df, use_parallel=False, **kwargs)
+        df_par = Loop_6_fit_signatures(
+            df=df, use_parallel=True, max_workers=2, block_size=7, **kwargs)
+
+        pd.testing.assert_frame_equal(df_par, df_seq)
+        assert df_seq["ERROR_REL50"].notna().any()
+
+        # Exact pruned search, sequential and parallel, gives the same fits
+        df["ESN"] = np.repeat([1, 2, 3], n // 3)
+        df_ref = Loop_6_fit_signatures(df=df, use_parallel=False, **kwargs)
+        for use_parallel in (False, True):
+            df_pruned = Loop_6_fit_signatures(
+                df=df, use_parallel=use_parallel, max_workers=2, block_size=7,
+                pruned_search=True, **kwargs)
+            pd.testing.assert_frame_equal(df_pruned, df_ref)
+
@@ -105,3 +105,52 @@ class TestLoop8SummaryStats:
         saved_df = pd.read_csv(expected_path)
         assert not saved_df.empty
 
+
+
+# --------------------------------------------------------------------
+# Equivalence with the previous per-ESN implementation
+# --------------------------------------------------------------------
+class TestLoop8LegacyEquivalence:
+    @pytest.fixture(autouse=True)
+    def _setup_tmpdir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    @staticmethod
+    def _fleet(n=300, seed=3):
+        rng = np.random.default_rng(seed)
+        esn = rng.integers(1, 6, n)
+        df = pd.DataFrame({
+            "operator": "Op1",
+            "ESN": esn,
+            "DSCID": 52,
+            "ACID": "AC1",
+            "ENGPOS": 1,
+            "NEW_FLAG": rng.choice([0, 1], n),
+            "reportdatetime": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.permutation(n), unit="h"),
+        })
+        df.loc[df["ESN"] == 5, "NEW_FLAG"] = 0  # ESN without new data
+        labels = np.array(['IPC ETA', 'HPC ETA', 'XRATE_3', 'XRATE_4'])
+        for lag in (3, 20):
+            for var in (1, 2, 3):
+                df[f"VAR{var}_IDENTIFIER{lag}"] = labels[rng.integers(0, 4, n)]
+            for comp in ("IPC", "HPC"):
+                df[f"{comp}_DAMAGE_SHIFT{lag}"] = np.where(
+                    rng.random(n) < 0.2, np.nan, np.round(rng.normal(0.5, 0.4, n), 2))
+        return df
+
+    def test_matches_legacy_loop(self):
+        from src.backups.Loop_8_Summary_Stats_backup import (
+            Loop_8_Summary_Stats as Loop_8_legacy)
+
+        df = self._fleet()
+        kwargs = dict(lag_list=[3, 20], save_csv=False, flight_phase="cruise")
+        out = Loop_8_Summary_Stats(df, **kwargs)
+        ref = Loop_8_legacy(df, **kwargs)
+
+        # ESNs without new data are kept, the legacy loop dropped them
+        assert (out["ESN"] == 5).sum() == (df["ESN"] == 5).sum()
+        keys = ['ESN', 'reportdatetime']
+        out = out[out["ESN"] != 5].sort_values(keys).reset_index(drop=True)
+        ref = ref.sort_values(keys).reset_index(drop=True)
+        pd.testing.assert_frame_equal(out, ref[out.columns])
+        assert list(out.columns) == list(ref.columns)
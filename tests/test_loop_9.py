@@ -98,6 +98,14 @@ class TestLoop9EdgeCases:
         for df in data_dict.values():
             assert df['row_sum'].isna().all()
 
+    def test_missing_flight_phase(self, sample_data_dict):
+        """A flight phase without data: the phases are not merged, the others are still processed."""
+        del sample_data_dict['cruise']
+        data_dict, df_merged = Loop_9_combine_DSC(sample_data_dict, save_csv=False)
+        assert df_merged.empty
+        assert set(data_dict) == {'take-off', 'climb'}
+        assert data_dict['climb']['row_sum'].notna().any()
+
     def test_save_csv_creates_files(self, sample_data_dict, tmp_path):
         """Verify that CSV files are written when save_csv=True.
 
@@ -115,6 +123,19 @@ class TestLoop9EdgeCases:
         finally:
             os.chdir(cwd)
 
+    def test_deliverables_stay_csv_with_parquet_sink(self, sample_data_dict, tmp_path, monkeypatch):
+        """The merged and DN outputs are CSV even when the debug dumps go to Parquet."""
+        from src.utils.snapshot_writer import start_snapshot_sink, stop_snapshot_sink
+        (tmp_path / "Fleetstore_Data").mkdir()
+        monkeypatch.chdir(tmp_path)
+        start_snapshot_sink(fmt="parquet")
+        try:
+            Loop_9_combine_DSC(sample_data_dict, save_csv=True)
+        finally:
+            stop_snapshot_sink()
+        files = {path.name for path in (tmp_path / "Fleetstore_Data").iterdir()}
+        assert {"Loop_9_combine_DSC_merged_output.csv", "Loop_9_combine_DSC_DN_output.csv"} <= files
+
 class TestLoop9ThresholdVariations:
     def test_threshold_edge_values(self, sample_data_dict):
         """Check that row_sum reacts correctly at the threshold boundary.
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import pandas as pd
+import pytest
+
+import src.utils.async_main as async_main_module
+from src.utils.async_main import get_process_pool, main, shutdown_process_pool
+
+
+def add_pid(df, flight_phase, offset=0):
+    """Stage run in the pool workers: must be importable by the worker processes."""
+    return df.assign(pid=os.getpid(), value=df["value"] + offset, phase=flight_phase)
+
+
+def failing_stage(df, flight_phase):
+    raise ValueError("boom")
+
+
+@pytest.fixture
+def data_dict():
+    return {phase: pd.DataFrame({"ESN": [1, 2], "value": [1.0, 2.0]}) for phase in ["cruise", "climb"]}
+
+
+@pytest.fixture(autouse=True)
+def process_pool():
+    yield
+    shutdown_process_pool()
+
+
+class TestAsyncMainExecutors:
+
+    @pytest.mark.parametrize("executor", ["thread", "inline", "process"])
+    def test_executors_give_same_result(self, data_dict, executor):
+        out = asyncio.run(main(data_dict, "", add_pid, executor=executor, pool_workers=2, offset=1))
+        for phase, df in out.items():
+            assert df["value"].tolist() == [2.0, 3.0]
+            assert (df["phase"] == phase).all()
+            if executor == "process":
+                assert (df["pid"] != os.getpid()).all()
+            else:
+                assert (df["pid"] == os.getpid()).all()
+
+    def test_process_pool_reused_between_calls(self, data_dict):
+        asyncio.run(main(data_dict, "", add_pid, executor="process", pool_workers=2))
+        pool = async_main_module._process_pool
+        asyncio.run(main(data_dict, "", add_pid, executor="process"))
+        assert async_main_module._process_pool is pool
+        assert get_process_pool(3) is not pool
+
+    def test_failing_stage_keeps_input(self, data_dict):
+        out = asyncio.run(main(data_dict, "", failing_stage, executor="process", pool_workers=1))
+        pd.testing.assert_frame_equal(out["cruise"], data_dict["cruise"])
+
+    def test_unknown_executor(self, data_dict):
+        # Logged by process_flight_phase, the input data is returned
+        out = asyncio.run(main(data_dict, "", add_pid, executor="gpu"))
+        assert list(out["cruise"].columns) == ["ESN", "value"]
@@ -0,0 +1,160 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import src.utils.backfill as backfill
+import src.utils.data_ing as data_ing
+from src.utils.backfill import BackfillManifest, plan_windows, run_backfill, window_data_dict, window_key
+
+COLUMNS = ["ESN", "operator", "equipmentid", "ACID", "ENGPOS", "DSCID",
+           "reportdatetime", "datestored", "P25__PSI", "TS25S__NOM_K"]
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    """Run folder with a cruise query template and 25 hourly reports from 2025-01-02."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Queries").mkdir()
+    (tmp_path / "Queries" / "Sql_fleetstore_CRZ.sql").write_text(
+        "SELECT\n" + "\n".join(f"  ,F.[{col}]" for col in COLUMNS).replace(",", "", 1)
+        + "\n  FROM fleet AS F\n  WHERE F.[reportdatetime] >= %startTimestamp%\n  ORDER BY F.[reportdatetime]")
+    (tmp_path / "Fleetstore_Data").mkdir()
+
+    n = 25
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2025-01-02", periods=n, freq="h")
+    # File database: each worker thread opens its own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'fleet.db'}")
+    pd.DataFrame({
+        "ESN": rng.choice([1, 2, 3], size=n),
+        "operator": "Op1",
+        "equipmentid": 101,
+        "ACID": rng.choice(["AC1", "AC2"], size=n),
+        "ENGPOS": 1,
+        "DSCID": 52,
+        "reportdatetime": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "datestored": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "P25__PSI": rng.uniform(20, 65, size=n),
+        "TS25S__NOM_K": rng.uniform(400, 500, size=n),
+    }).to_sql("fleet", engine, index=False)
+    monkeypatch.setattr(data_ing, "connect_to_db_sqlalchemy", lambda pool_size=5: engine)
+    return tmp_path
+
+
+class TestPlanWindows:
+
+    def test_half_open_windows(self):
+        windows = plan_windows("2025-01-01", "2025-01-20", window_days=7)
+        assert [(str(start.date()), str(end.date())) for start, end in windows] == [
+            ("2025-01-01", "2025-01-08"), ("2025-01-08", "2025-01-15"), ("2025-01-15", "2025-01-20")]
+
+    def test_empty_range(self):
+        with pytest.raises(ValueError):
+            plan_windows("2025-01-02", "2025-01-01")
+
+
+class TestRunBackfill:
+
+    def test_windows_cover_the_range_once(self, run_dir):
+        manifest = run_backfill(str(run_dir), "2025-01-02", "2025-01-03 06:00", window_days=0.25,
+                                max_workers=2)
+        fetched = manifest.data["fetched"]["cruise"]
+        assert len(fetched) == 5
+        frames = [pd.read_parquet(run_dir / "Fleetstore_Data" / "backfill" / entry["file"])
+                  for entry in fetched.values()]
+        data = pd.concat(frames, ignore_index=True)
+        assert sum(entry["rows"] for entry in fetched.values()) == len(data)
+        # Rows out of the cruise limits are dropped, no report is fetched twice
+        assert 0 < len(data) < 25
+        assert not data["reportdatetime"].duplicated().any()
+        assert data_ing._shared_engine is None
+        # Manifest written to disk
+        assert BackfillManifest(manifest.path).data == manifest.data
+
+    def test_resumes_failed_windows(self, run_dir, monkeypatch):
+        fetch_window = backfill.fetch_window
+        calls, failed = [], []
+
+        def failing_fetch(sql_file_path, flight_phase, window, *args):
+            calls.append(window)
+            if window[0] == pd.Timestamp("2025-01-02 12:00") and not failed:
+                failed.append(window)
+                raise TimeoutError("query timeout")
+            return fetch_window(sql_file_path, flight_phase, window, *args)
+
+        monkeypatch.setattr(backfill, "fetch_window", failing_fetch)
+        manifest = run_backfill(str(run_dir), "2025-01-02", "2025-01-03", window_days=0.25)
+        assert len(calls) == 4
+        assert not manifest.is_fetched("cruise", (pd.Timestamp("2025-01-02 12:00"), pd.Timestamp("2025-01-02 18:00")))
+
+        calls.clear()
+        manifest = run_backfill(str(run_dir), "2025-01-02", "2025-01-03", window_days=0.25)
+        assert calls == [(pd.Timestamp("2025-01-02 12:00"), pd.Timestamp("2025-01-02 18:00"))]
+        assert len(manifest.data["fetched"]["cruise"]) == 4
+
+        calls.clear()
+        run_backfill(str(run_dir), "2025-01-02", "2025-01-03", window_days=0.25)
+        assert calls == []
+
+    def test_window_data_flagged_new(self, run_dir):
+        manifest = run_backfill(str(run_dir), "2025-01-02", "2025-01-03", window_days=0.5)
+        window = plan_windows("2025-01-02", "2025-01-03", 0.5)[0]
+        data_dict = window_data_dict(str(run_dir), manifest, window)
+
+        data = data_dict["cruise"]
+        assert data["NEW_FLAG"].eq(1).all()
+        assert data["reportdatetime"].min() >= window[0] and data["reportdatetime"].max() < window[1]
+        assert "days_since_prev" in data.columns
+
+        manifest.mark_processed(window)
+        assert BackfillManifest(manifest.path).is_processed(window)
+        assert window_key(window) == "2025-01-02T00:00:00_2025-01-02T12:00:00"
+
+    def test_mark_processed_twice(self, run_dir):
+        # A resumed backfill processing a window again keeps a single entry
+        manifest = run_backfill(str(run_dir), "2025-01-02", "2025-01-03", window_days=0.5)
+        first, second = plan_windows("2025-01-02", "2025-01-03", 0.5)
+        manifest.mark_processed(first)
+        manifest.mark_processed(second)
+        BackfillManifest(manifest.path).mark_processed(first)
+        assert BackfillManifest(manifest.path).data["processed"] == [window_key(second), window_key(first)]
+
+
+class TestBackfillMode:
+
+    def test_windows_processed_in_order_once(self, run_dir, monkeypatch):
+        import src.Backfill_Mode as backfill_mode
+        processed = []
+        monkeypatch.setattr(backfill_mode, "Live_Data_Mode",
+                            lambda data_dict, fit_cache_path: processed.append(data_dict["cruise"]["reportdatetime"].min()))
+        (run_dir / "working_data").mkdir()
+
+        backfill_mode.Backfill_Mode("2025-01-02", "2025-01-03", window_days=0.25)
+        assert len(processed) == 4 and processed == sorted(processed)
+        assert (run_dir / "working_data" / "timestamp.txt").read_text() == "2025-01-03 00:00:00"
+
+        backfill_mode.Backfill_Mode("2025-01-02", "2025-01-03", window_days=0.25)
+        assert len(processed) == 4
+
+    def test_window_with_failed_stage_is_retried(self, run_dir, monkeypatch):
+        import src.Backfill_Mode as backfill_mode
+        processed = []
+
+        def live_data_mode(data_dict, fit_cache_path):
+            # The fits are cached where the live runs find them
+            assert fit_cache_path == os.path.join(os.getcwd(), "working_data", "fit_cache.db")
+            processed.append(data_dict["cruise"]["reportdatetime"].min())
+            # The loops of the second window fail once
+            return {("cruise", "LOOP 6 - Signatures fit")} if len(processed) == 2 else set()
+
+        monkeypatch.setattr(backfill_mode, "Live_Data_Mode", live_data_mode)
+        (run_dir / "working_data").mkdir()
+
+        backfill_mode.Backfill_Mode("2025-01-02", "2025-01-03", window_days=0.25)
+        assert len(processed) == 2  # Stopped at the failed window, later ones not processed
+        assert not (run_dir / "working_data" / "timestamp.txt").exists()
+
+        backfill_mode.Backfill_Mode("2025-01-02", "2025-01-03", window_days=0.25)
+        assert len(processed) == 5 and processed[2] == processed[1]
@@ -0,0 +1,103 @@
+import multiprocessing
+import sys
+import time
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.utils.computation_metrics as computation_metrics
+from src.utils.computation_metrics import monitor, monitor_function, thread_pools
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    path = tmp_path / "function_log.txt"
+    monkeypatch.setattr(computation_metrics, "LOG_FILE", str(path))
+    monkeypatch.delenv("MONITOR_PROFILE", raising=False)
+    return path
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(1000))
+    return total
+
+
+class TestMonitorFunction:
+
+    def test_rows_and_log(self, log_file):
+        @monitor_function
+        def keep_half(df, flight_phase):
+            return {flight_phase: df.iloc[: len(df) // 2]}
+
+        result = keep_half(pd.DataFrame({"x": range(10)}), flight_phase="cruise")
+        assert len(result["cruise"]) == 5
+        log = log_file.read_text()
+        assert "Function: keep_half" in log
+        assert "Rows in / out: 10 / 5" in log
+        assert "Profile" not in log
+
+    def test_metrics(self, log_file):
+        with monitor("block", rows_in=3) as metrics:
+            busy(0.05)
+            block = np.ones(256 * 2**20 // 8)
+            block.sum()
+            metrics.rows_out = 2
+        del block
+        assert metrics["duration_s"] >= 0.05
+        assert metrics["cpu_user_s"] + metrics["cpu_system_s"] > 0.02
+        assert metrics["peak_rss_delta_mb"] >= 200
+        assert (metrics["rows_in"], metrics["rows_out"]) == (3, 2)
+        assert metrics["thread_pools"] == thread_pools()
+
+    def test_logged_on_error(self, log_file):
+        with pytest.raises(ValueError):
+            with monitor("failing"):
+                raise ValueError("bad input")
+        assert "Function: failing" in log_file.read_text()
+
+    def test_no_tracing_overhead(self, log_file):
+        # The wrapped code runs at full speed (no sys.settrace)
+        def loop():
+            return sum(i * i for i in range(200_000))
+
+        start = time.perf_counter()
+        loop()
+        bare = time.perf_counter() - start
+        start = time.perf_counter()
+        monitor_function(loop)()
+        assert time.perf_counter() - start < 3 * bare + 0.05
+
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="fork start method")
+    def test_forked_worker_measures_itself(self, log_file):
+        with monitor("parent"):
+            pass
+        context = multiprocessing.get_context("fork")
+        with context.Pool(1) as pool:
+            child_pid, measured_pid = pool.apply(_worker_pids)
+        assert measured_pid == child_pid
+
+
+def _worker_pids():
+    return os.getpid(), computation_metrics._process().pid
+
+
+class TestProfiling:
+
+    def test_sampling_profile_from_env(self, log_file, monkeypatch):
+        monkeypatch.setenv("MONITOR_PROFILE", "1")
+        monkeypatch.setenv("MONITOR_PROFILE_INTERVAL_MS", "1")
+
+        @monitor_function
+        def outer():
+            # Nested monitored calls are profiled as part of the outer one
+            return monitor_function(busy)(0.2)
+
+        outer()
+        log = log_file.read_text()
+        assert log.count("Profile:") == 1
+        assert "busy (test_computation_metrics.py" in log
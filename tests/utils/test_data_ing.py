@@ -0,0 +1,204 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import src.utils.data_ing as data_ing
+from src.utils.data_ing import ColumnarBuffer, data_ingestion, execute_query_from_file_path, query_run
+from src.utils.watermark_ledger import WatermarkLedger
+
+
+@pytest.fixture
+def run_dir(tmp_path, monkeypatch):
+    """Run folder with the three phase queries and a start timestamp."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Queries").mkdir()
+    for phase in ["CRZ", "CLM", "TKO"]:
+        (tmp_path / "Queries" / f"Sql_fleetstore_{phase}.sql").write_text(
+            "SELECT * FROM fleet WHERE reportdatetime > %startTimestamp%")
+    (tmp_path / "working_data").mkdir()
+    (tmp_path / "working_data" / "timestamp.txt").write_text("2025-01-01 00:00:00")
+    return tmp_path
+
+
+@pytest.fixture
+def sqlite_engine(monkeypatch):
+    engine = create_engine("sqlite://")
+    pd.DataFrame({
+        "ESN": [1, 2],
+        "reportdatetime": ["2024-12-31 00:00:00", "2025-01-02 00:00:00"],
+    }).to_sql("fleet", engine, index=False)
+    monkeypatch.setattr(data_ing, "connect_to_db_sqlalchemy", lambda pool_size=5: engine)
+    return engine
+
+
+class TestExecuteQuery:
+
+    def test_start_timestamp_replaced(self, run_dir, sqlite_engine):
+        data, timestamp = execute_query_from_file_path(
+            str(run_dir / "Queries" / "Sql_fleetstore_CRZ.sql"), sqlite_engine)
+        assert timestamp == "2025-01-01 00:00:00"
+        assert data["ESN"].tolist() == [2]
+
+
+class TestDataIngestion:
+
+    def fake_query_run(self, calls):
+        def query_run(file_name, flight_phase, timestamp_container, query_folder="Queries",
+                      tail_state=None, engine=None, **kwargs):
+            calls.append((flight_phase, engine))
+            time.sleep(0.3)
+            latest = {"Cruise": "2025-01-05", "Climb": "2025-01-03", "Take-off": "2025-01-04"}[flight_phase]
+            timestamp_container.append(pd.Timestamp(latest))
+            return pd.DataFrame({"phase": [flight_phase]}), "2025-01-01 00:00:00", timestamp_container
+        return query_run
+
+    def test_queries_run_concurrently_on_one_engine(self, run_dir, sqlite_engine, monkeypatch):
+        calls = []
+        monkeypatch.setattr(data_ing, "query_run", self.fake_query_run(calls))
+
+        start = time.perf_counter()
+        data_dict = data_ingestion(str(run_dir), max_parallel_queries=3)
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.8  # 3 queries of 0.3 s
+        assert {phase: df["phase"].iloc[0] for phase, df in data_dict.items()} == {
+            "cruise": "Cruise", "climb": "Climb", "take-off": "Take-off"}
+        assert all(engine is sqlite_engine for _, engine in calls)
+        assert data_ing._shared_engine is None  # Disposed after the run
+        # Earliest of the latest timestamps of the queries
+        assert (run_dir / "working_data" / "timestamp.txt").read_text() == "2025-01-03 00:00:00"
+
+    def test_sequential(self, run_dir, sqlite_engine, monkeypatch):
+        monkeypatch.setattr(data_ing, "query_run", self.fake_query_run([]))
+        start = time.perf_counter()
+        data_ingestion(str(run_dir), max_parallel_queries=1)
+        assert time.perf_counter() - start >= 0.9
+
+    def test_no_new_data(self, run_dir, sqlite_engine, monkeypatch):
+        # Every phase above its watermark: empty outputs, the previous start is kept
+        monkeypatch.setattr(data_ing, "query_run", lambda file_name, flight_phase, timestamp_container, **kwargs:
+                            (pd.DataFrame(), "2025-01-01 00:00:00", timestamp_container))
+        data_dict = data_ingestion(str(run_dir))
+        assert all(df.empty for df in data_dict.values())
+        assert (run_dir / "working_data" / "timestamp.txt").read_text() == "2025-01-01 00:00:00"
+
+    def test_failed_phase(self, run_dir, sqlite_engine, monkeypatch):
+        fake_query_run = self.fake_query_run([])
+
+        def query_run(file_name, flight_phase, timestamp_container, ledger=None, **kwargs):
+            ledger.observe(flight_phase, pd.DataFrame({"reportdatetime": ["2025-01-06 00:00:00"]}))
+            if flight_phase == "Climb":
+                return None  # query_run logs its errors and returns None
+            return fake_query_run(file_name, flight_phase, timestamp_container, **kwargs)
+
+        monkeypatch.setattr(data_ing, "query_run", query_run)
+        data_dict = data_ingestion(str(run_dir))
+        assert data_dict["climb"] is None and data_dict["cruise"] is not None
+        marks = WatermarkLedger(str(run_dir / "working_data" / "watermarks.json")).marks
+        assert set(marks) == {"cruise", "take-off"}
+        assert (run_dir / "working_data" / "timestamp.txt").read_text() == "2025-01-04 00:00:00"
+
+    def test_other_files_skipped(self, run_dir, sqlite_engine, monkeypatch):
+        (run_dir / "Queries" / "README.txt").write_text("not a query")
+        (run_dir / "Queries" / "Sql_fleetstore_APU.sql").write_text("SELECT 1")
+        calls = []
+        monkeypatch.setattr(data_ing, "query_run", self.fake_query_run(calls))
+        data_dict = data_ingestion(str(run_dir))
+        assert sorted(phase for phase, _ in calls) == ["Climb", "Cruise", "Take-off"]
+        assert all(df is not None for df in data_dict.values())
+
+
+@pytest.fixture
+def fleet_engine(run_dir):
+    """Query output with NaNs, values out of the cruise limits and temperatures in Kelvin."""
+    (run_dir / "Fleetstore_Data").mkdir()
+    n = 25
+    rng = np.random.default_rng(0)
+    p25 = rng.uniform(20, 65, size=n)
+    p25[[3, 7]] = np.nan
+    times = pd.date_range("2025-01-02", periods=n, freq="h")
+    engine = create_engine("sqlite://")
+    pd.DataFrame({
+        "ESN": rng.choice([1, 2, 3], size=n),
+        "operator": "Op1",
+        "equipmentid": 101,
+        "ACID": rng.choice(["AC1", "AC2"], size=n),
+        "ENGPOS": 1,
+        "DSCID": 52,
+        "reportdatetime": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "datestored": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "P25__PSI": p25,
+        "TS25S__NOM_K": rng.uniform(400, 500, size=n),
+    }).to_sql("fleet", engine, index=False)
+    return engine
+
+
+class TestStreamingQueryRun:
+
+    def test_chunked_matches_full_query(self, fleet_engine):
+        full, timestamp, full_ts = query_run(
+            "Sql_fleetstore_CRZ.sql", "Cruise", [], engine=fleet_engine)
+        streamed, _, streamed_ts = query_run(
+            "Sql_fleetstore_CRZ.sql", "Cruise", [], engine=fleet_engine, chunksize=4)
+
+        assert 0 < len(full) < 25
+        assert streamed_ts == full_ts
+        pd.testing.assert_frame_equal(streamed, full)
+
+    def test_columnar_buffer(self):
+        buffer = ColumnarBuffer()
+        chunk = pd.DataFrame({
+            "ACID": pd.array(["AC1", None], dtype="string"),
+            "P25__PSI": pd.array([1.5, None], dtype="Float64"),
+        })
+        buffer.append(chunk)
+        buffer.append(chunk.iloc[:0])
+        buffer.append(chunk.iloc[[1]])
+        assert buffer.n_rows == 3 and buffer.nbytes > 0
+        pd.testing.assert_frame_equal(
+            buffer.to_pandas(), pd.concat([chunk, chunk.iloc[[1]]], ignore_index=True))
+
+    def test_pushdown_matches_client_side_cleaning(self, run_dir, fleet_engine):
+        columns = ["ESN", "operator", "equipmentid", "ACID", "ENGPOS", "DSCID",
+                   "reportdatetime", "datestored", "P25__PSI", "TS25S__NOM_K"]
+        (run_dir / "Queries" / "Sql_pushdown_CRZ.sql").write_text(
+            "SELECT\n" + "\n".join(f"  ,F.[{col}]" for col in columns).replace(",", "", 1)
+            + "\n  FROM fleet AS F\n  WHERE F.[reportdatetime] > %startTimestamp%\n  ORDER BY F.[reportdatetime]")
+
+        client, _, _ = query_run("Sql_pushdown_CRZ.sql", "Cruise", [], engine=fleet_engine)
+        pushed, _, _ = query_run("Sql_pushdown_CRZ.sql", "Cruise", [], engine=fleet_engine, pushdown=True)
+        streamed, _, _ = query_run("Sql_pushdown_CRZ.sql", "Cruise", [], engine=fleet_engine,
+                                   pushdown=True, chunksize=4)
+
+        assert 0 < len(client) < 25
+        pd.testing.assert_frame_equal(pushed, client)
+        pd.testing.assert_frame_equal(streamed, client)
+
+
+class TestWatermarkLedger:
+
+    def test_second_run_fetches_only_new_rows(self, run_dir, fleet_engine):
+        (run_dir / "Queries" / "Sql_ledger_CRZ.sql").write_text(
+            "SELECT\n  F.[ESN]\n" + "".join(f"  ,F.[{col}]\n" for col in [
+                "operator", "equipmentid", "ACID", "ENGPOS", "DSCID", "reportdatetime", "datestored", "P25__PSI"])
+            + "  FROM fleet AS F\n  WHERE F.[reportdatetime] > %startTimestamp%\n  ORDER BY F.[reportdatetime]")
+        ledger = WatermarkLedger(str(run_dir / "working_data" / "watermarks.json"))
+        first, _, _ = query_run("Sql_ledger_CRZ.sql", "Cruise", [], engine=fleet_engine, ledger=ledger)
+        assert first["NEW_FLAG"].eq(1).all()
+        ledger.commit()
+        assert ledger.watermark("Cruise") == pd.Timestamp("2025-01-03 00:00:00")
+
+        new = pd.read_sql_query("SELECT * FROM fleet", fleet_engine).iloc[:3]
+        new["reportdatetime"] = ["2025-01-02 12:00:00", "2025-01-03 00:00:00", "2025-01-04 00:00:00"]
+        new["P25__PSI"] = 40.0
+        new.to_sql("fleet", fleet_engine, index=False, if_exists="append")
+
+        second, _, timestamps = query_run("Sql_ledger_CRZ.sql", "Cruise", [], engine=fleet_engine, ledger=ledger)
+        # Only the row above the watermark is fetched and flagged new, nothing to deduplicate
+        assert timestamps == ["2025-01-04 00:00:00"]
+        assert second.loc[second["NEW_FLAG"] == 1, "reportdatetime"].tolist() == [pd.Timestamp("2025-01-04")]
+        ledger.commit()
+        assert ledger.watermark("Cruise") == pd.Timestamp("2025-01-04 00:00:00")
+        assert ledger.watermark("Climb") is None
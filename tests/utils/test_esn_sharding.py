@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.esn_sharding import balanced_esn_shards, map_esn_shards
+
+
+def cumulative_kernel(df, scale=1.0):
+    """Per-ESN kernel: cumulative sum of each ESN, with the worker pid."""
+    return df.assign(
+        cumsum=df.groupby("ESN")["value"].cumsum() * scale,
+        pid=os.getpid())
+
+
+def failing_kernel(df):
+    if (df["ESN"] == 3).any():
+        raise ValueError("ESN 3")
+    return df
+
+
+@pytest.fixture
+def fleet_df():
+    rng = np.random.default_rng(0)
+    esn = rng.choice([5, 1, 3, 2, 4, 6], size=200, p=[0.5, 0.2, 0.1, 0.1, 0.05, 0.05])
+    return pd.DataFrame({"ESN": esn, "value": rng.normal(size=esn.size)})
+
+
+class TestBalancedEsnShards:
+
+    def test_every_esn_in_one_shard(self, fleet_df):
+        shards = balanced_esn_shards(fleet_df["ESN"], 3)
+        assert len(shards) == 3
+        assert sorted(np.concatenate(shards).tolist()) == [1, 2, 3, 4, 5, 6]
+
+    def test_balanced_by_row_count(self):
+        esn = pd.Series([1] * 6 + [2] * 4 + [3] * 4 + [4] * 2 + [5] * 2)
+        loads = sorted(esn.isin(shard).sum() for shard in balanced_esn_shards(esn, 3))
+        assert loads == [6, 6, 6]
+
+    def test_fewer_esns_than_shards(self):
+        assert len(balanced_esn_shards(pd.Series([1, 1, 2]), 8)) == 2
+
+
+class TestMapEsnShards:
+
+    def test_parallel_matches_inline(self, fleet_df):
+        esns = [3, 1, 2, 5]
+        inline = map_esn_shards(fleet_df, cumulative_kernel, n_jobs=1, esns=esns, scale=2.0)
+        parallel = map_esn_shards(fleet_df, cumulative_kernel, n_jobs=3, esns=esns, scale=2.0)
+
+        # ESN blocks in the order requested, rows of each ESN in input order
+        assert parallel["ESN"].drop_duplicates().tolist() == esns
+        assert (parallel["pid"] != os.getpid()).all()
+        pd.testing.assert_frame_equal(
+            parallel.drop(columns="pid"),
+            inline.drop(columns="pid").sort_values("ESN", key=lambda s: s.map(esns.index), kind="stable")
+            .reset_index(drop=True))
+
+    def test_kernel_error_raised(self, fleet_df):
+        with pytest.raises(ValueError, match="ESN 3"):
+            map_esn_shards(fleet_df, failing_kernel, n_jobs=2)
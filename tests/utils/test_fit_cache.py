@@ -0,0 +1,108 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.fit_cache import FitCache, fit_fingerprint
+from src.utils.signature_solver import solve_signature_fits
+from src.Loop_6_fit_signatures import Loop_6_fit_signatures
+
+
+@pytest.fixture
+def signatures():
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 1, (5, 9))
+
+
+@pytest.fixture
+def signature_combos(signatures):
+    norms = np.linalg.norm(signatures, axis=1)
+    return [(signatures[list(c)].T, norms[list(c)], [f"X{i}" for i in c])
+            for n_sig in (1, 2, 3) for c in itertools.combinations(range(5), n_sig)]
+
+
+@pytest.fixture
+def obs():
+    rng = np.random.default_rng(1)
+    obs = np.round(rng.normal(0, 1, (20, 9)), 5)
+    obs[2, 0] = np.nan
+    return obs
+
+
+class TestFitFingerprint:
+
+    def test_changes_with_signatures(self, signature_combos):
+        changed = [(F * 1.001, norms, ids) for F, norms, ids in signature_combos]
+        assert fit_fingerprint(signature_combos) == fit_fingerprint(list(signature_combos))
+        assert fit_fingerprint(signature_combos) != fit_fingerprint(changed)
+        assert fit_fingerprint(signature_combos) != fit_fingerprint(signature_combos, decimals=4)
+
+
+class TestFitCache:
+
+    def test_roundtrip(self, tmp_path, signature_combos, obs):
+        fits = solve_signature_fits(obs, signature_combos)
+        with FitCache(str(tmp_path / "fits.db"), fit_fingerprint(signature_combos)) as cache:
+            keys, hit, _ = cache.lookup(obs)
+            assert not hit.any() and keys[2] is None
+            cache.store(keys, fits, ~hit)
+
+            keys, hit, cached = cache.lookup(obs)
+            assert hit.sum() == len(obs) - 1 and not hit[2]
+            for key in fits:
+                np.testing.assert_array_equal(cached[key][hit], fits[key][hit])
+
+    def test_other_fingerprint_misses(self, tmp_path, signature_combos, obs):
+        path = str(tmp_path / "fits.db")
+        fits = solve_signature_fits(obs, signature_combos)
+        with FitCache(path, fit_fingerprint(signature_combos)) as cache:
+            keys, hit, _ = cache.lookup(obs)
+            cache.store(keys, fits, ~hit)
+        with FitCache(path, fit_fingerprint(signature_combos[:5])) as cache:
+            _, hit, _ = cache.lookup(obs)
+            assert not hit.any()
+
+    def test_lru_eviction(self, tmp_path, signature_combos, obs):
+        fits = solve_signature_fits(obs, signature_combos)
+        with FitCache(str(tmp_path / "fits.db"), fit_fingerprint(signature_combos),
+                      max_entries=5) as cache:
+            keys, hit, _ = cache.lookup(obs[:5])
+            cache.store(keys, {k: v[:5] for k, v in fits.items()}, ~hit)
+            # Use the first row again, so it becomes the most recent entry
+            cache.lookup(obs[:1])
+            keys, hit, _ = cache.lookup(obs[5:9])
+            cache.store(keys, {k: v[5:9] for k, v in fits.items()}, ~hit)
+
+            assert cache.conn.execute("SELECT COUNT(*) FROM fits").fetchone()[0] == 5
+            _, hit, _ = cache.lookup(obs[:5])
+            assert hit[0] and hit.sum() == 1
+
+
+class TestLoop6FitCache:
+
+    def test_second_run_uses_cache(self, tmp_path, signatures, capsys):
+        rng = np.random.default_rng(2)
+        obs_cols = ['PS26', 'T25', 'P30', 'T30', 'TGTU', 'NL', 'NI', 'NH', 'FF']
+        n = 12
+        df = pd.DataFrame({
+            "NEW_FLAG": [1] * n,
+            "reportdatetime": pd.date_range(start="2025-01-01", periods=n, freq="h"),
+        })
+        for col in obs_cols:
+            df[f"{col}__DEL_PC_E2E_MAV_NO_STEPS_LAG_50"] = np.round(rng.normal(0, 1, n), 5)
+        xrates = {"Cruise": pd.DataFrame(
+            np.column_stack([signatures, np.linalg.norm(signatures, axis=1)]),
+            index=[f"X{i}" for i in range(1, 6)])}
+        kwargs = dict(flight_phase="cruise", Xrates=xrates, lag_list=[50],
+                      DebugOption=0, use_parallel=False)
+        path = str(tmp_path / "fits.db")
+
+        df_ref = Loop_6_fit_signatures(df=df, **kwargs)
+        df_first = Loop_6_fit_signatures(df=df, fit_cache_path=path, **kwargs)
+        df_second = Loop_6_fit_signatures(df=df, fit_cache_path=path, **kwargs)
+
+        log = capsys.readouterr().out
+        assert f"fit cache hits 0, misses {n}" in log
+        assert f"fit cache hits {n}, misses 0" in log
+        pd.testing.assert_frame_equal(df_first, df_ref)
+        pd.testing.assert_frame_equal(df_second, df_ref)
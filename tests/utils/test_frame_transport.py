@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.frame_transport import (
+    frame_from_shared_memory,
+    frame_to_shared_memory,
+    release_shared_memory,
+)
+
+
+def shm_blocks():
+    return {f for f in os.listdir("/dev/shm") if f.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+@pytest.fixture
+def fleet_df():
+    return pd.DataFrame({
+        "ESN": [1, 2, 3],
+        "ACID": pd.array(["AC1", None, "AC3"], dtype="string"),
+        "SISTER_ESN": pd.array([2, None, 1], dtype="Int64"),
+        "reportdatetime": pd.date_range("2025-01-01", periods=3, freq="D"),
+        "VAR1_IDENTIFIER50": ["IPC ETA", None, "HPC ETA"],
+        "P25__DEL_PC": [0.1, np.nan, 0.3],
+    }, index=[10, 11, 12])
+
+
+class TestFrameTransport:
+
+    def test_arrow_roundtrip(self, fleet_df):
+        before = shm_blocks()
+        handle = frame_to_shared_memory(fleet_df)
+        assert handle[2] == "arrow"
+        pd.testing.assert_frame_equal(frame_from_shared_memory(handle), fleet_df)
+        assert shm_blocks() == before
+
+    def test_pickle_fallback(self):
+        df = pd.DataFrame({"mixed": [1, "a", None]})
+        handle = frame_to_shared_memory(df)
+        assert handle[2] == "pickle"
+        pd.testing.assert_frame_equal(frame_from_shared_memory(handle), df)
+
+    def test_read_without_unlink_then_release(self, fleet_df):
+        before = shm_blocks()
+        handle = frame_to_shared_memory(fleet_df)
+        frame_from_shared_memory(handle, unlink=False)
+        pd.testing.assert_frame_equal(frame_from_shared_memory(handle, unlink=False), fleet_df)
+        release_shared_memory(handle)
+        release_shared_memory(handle)  # Already freed: no error
+        assert shm_blocks() == before
@@ -8,7 +8,11 @@ pd.set_option('display.max_colwidth', None) # Show full column width
 pd.set_option('display.width', 0)           # Auto-adjust display width
 from datetime import datetime, timedelta
 # Adjust import path as needed
-from src.utils.merge_flight_phases_v1 import merge_flight_phases, merged_data_evaluation
+from src.utils.merge_flight_phases_v1 import (
+    merge_flight_phases,
+    merge_flight_phases_asof,
+    merged_data_evaluation,
+)
 
 class TestMergeFlightPhasesHappyPath:
     """Tests for normal, expected input data."""
@@ -177,6 +181,70 @@ class TestMergeFlightPhasesEdgeCases:
         
         assert result["reportdatetime_cruise"].iloc[0] != pd.to_datetime("2025-01-01 12:40:00")
 
+class TestMergeFlightPhasesAsof:
+    """Tests for the as-of join engine."""
+
+    @staticmethod
+    def _phase(rng, n, offset):
+        return pd.DataFrame({
+            "ESN": rng.integers(1, 4, n),
+            "operator": "OpA",
+            "ACID": rng.choice(["AC1", "AC2"], n),
+            "ENGPOS": rng.integers(1, 3, n),
+            # Unique timestamps: the legacy tie-break between equal times is not stable
+            "reportdatetime": pd.Timestamp("2025-01-01")
+                              + pd.to_timedelta(rng.choice(3000, n, replace=False) + offset, unit="min"),
+            "row_sum": rng.integers(0, 10, n),
+        })
+
+    def test_matches_legacy_merge(self):
+        rng = np.random.default_rng(0)
+        df_takeoff = self._phase(rng, 400, 0)
+        df_climb = self._phase(rng, 400, 20)
+        df_cruise = self._phase(rng, 400, 45)
+
+        result = merge_flight_phases_asof(df_takeoff, df_climb, df_cruise)
+        expected = merge_flight_phases(df_takeoff, df_climb, df_cruise)
+
+        assert result["row_sum_takeoff"].notna().any() and result["row_sum_climb"].notna().any()
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_tolerances_are_exclusive(self):
+        base_time = datetime(2025, 1, 1, 12, 0)
+        keys = {"ESN": [1001], "operator": ["OpA"], "ACID": ["AC123"], "ENGPOS": [1]}
+        df_takeoff = pd.DataFrame({**keys, "reportdatetime": [base_time], "row_sum": [10]})
+        df_climb = pd.DataFrame({**keys, "reportdatetime": [base_time + timedelta(minutes=25)], "row_sum": [20]})
+        df_cruise = pd.DataFrame({
+            "ESN": [1001] * 3, "operator": ["OpA"] * 3, "ACID": ["AC123"] * 3, "ENGPOS": [1] * 3,
+            "reportdatetime": [base_time + timedelta(minutes=m) for m in (25, 54.9, 55)],
+            "row_sum": [30, 31, 32],
+        })
+
+        result = merge_flight_phases_asof(df_takeoff, df_climb, df_cruise)
+
+        assert result["row_sum_cruise"].tolist() == [30, 31, 32]
+        # Climb at the same time as the cruise record is not a previous event
+        assert np.isnan(result["row_sum_climb"].iloc[0])
+        assert result["row_sum_climb"].iloc[1] == 20
+        assert result["row_sum_takeoff"].iloc[1] == 10
+        # Exactly 55 minutes after takeoff is out of tolerance
+        assert pd.isna(result["reportdatetime_takeoff"].iloc[2])
+
+    def test_missing_phase(self):
+        base_time = datetime(2025, 1, 1, 12, 0)
+        df_cruise = pd.DataFrame({
+            "ESN": [1001], "operator": ["OpA"], "ACID": ["AC123"], "ENGPOS": [1],
+            "reportdatetime": [base_time], "row_sum": [30],
+        })
+        df_empty = pd.DataFrame(columns=df_cruise.columns)
+
+        result = merge_flight_phases_asof(df_empty, df_empty, df_cruise)
+        assert result.shape[0] == 1
+        assert pd.isna(result["reportdatetime_takeoff"].iloc[0])
+        assert pd.isna(result["reportdatetime_climb"].iloc[0])
+
+        assert merge_flight_phases_asof(df_cruise, df_cruise, df_empty).empty
+
 class TestMergedDataEvaluationHappyPath:
     """Happy-path tests for merged_data_evaluation."""
 
@@ -324,3 +392,32 @@ class TestMergedDataEvaluationEdgeCases:
         assert summary_df["First DN fire"].iloc[0] == ts
         assert summary_df["Last DN fire"].iloc[0] == ts
 
+
+class TestMergedDataEvaluationLegacyEquivalence:
+    """The aggregated summary matches the previous per-group loop."""
+
+    def test_matches_legacy_evaluation(self):
+        from src.backups.merge_flight_phases_v1_backup import (
+            merged_data_evaluation as merged_data_evaluation_legacy)
+
+        rng = np.random.default_rng(4)
+        n = 300
+        df = pd.DataFrame({
+            "ESN": rng.integers(1, 8, n),
+            "operator": rng.choice(["OpA", "OpB"], n),
+            "ACID": "AC1",
+            "ENGPOS": rng.integers(1, 3, n),
+            "reportdatetime_takeoff": pd.Timestamp("2025-01-01")
+                                      + pd.to_timedelta(rng.permutation(n), unit="h"),
+            "row_sum_takeoff": rng.integers(0, 6, n).astype(float),
+            "row_sum_climb": rng.integers(0, 6, n).astype(float),
+            "row_sum_cruise": rng.integers(0, 6, n),
+        })
+        df.loc[rng.random(n) < 0.1, "row_sum_climb"] = np.nan
+
+        annotated, summary = merged_data_evaluation(df.copy(), threshold=3)
+        annotated_ref, summary_ref = merged_data_evaluation_legacy(df.copy(), threshold=3)
+
+        assert (summary["DN_FIRED"] == "NO").any() and (summary["DN_FIRED"] == "YES").any()
+        pd.testing.assert_frame_equal(annotated, annotated_ref)
+        pd.testing.assert_frame_equal(summary, summary_ref)
@@ -0,0 +1,69 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from src.utils.parameter_table import (
+    PARAMETER_TABLE,
+    delta_table,
+    limits_table,
+    compute_deltas,
+)
+
+
+@pytest.fixture
+def sensor_df():
+    """Two rows with every sensor / nominal pair of the delta table."""
+    table = delta_table()
+    data = {}
+    for sensor, nominal in zip(table.index, table['nominal']):
+        data[sensor] = [110.0, 95.0]
+        data[nominal] = [100.0, 100.0]
+    return pd.DataFrame(data)
+
+
+class TestTables:
+
+    def test_delta_table_has_ten_parameters(self):
+        table = delta_table()
+        assert len(table) == 10
+        assert table.loc['P25__PSI', 'nominal'] == 'PS26S__NOM_PSI'
+        assert table.loc['PS160__PSI', 'delta'] == 'P160__DEL_PC'
+
+    def test_limits_table_layout(self):
+        limits = limits_table()
+        assert list(limits.index) == [
+            'Take-off low limits', 'Take-off high limits',
+            'Climb low limits', 'Climb high limits',
+            'Cruise low limits', 'Cruise high limits']
+        # PS160 has no limits, ALT and MN1 have no nominal but do have limits
+        assert 'PS160__PSI' not in limits.columns
+        assert 'ALT__FT' in limits.columns and 'MN1' in limits.columns
+        assert limits.loc['Cruise high limits', 'FF__LBHR'] == 8500
+
+    def test_param_names_match_settings(self):
+        """Short names follow the order of the Param list in the algorithm settings."""
+        assert delta_table()['Param'].tolist()[:4] == ['PS26', 'T25', 'P30', 'T30']
+        assert PARAMETER_TABLE.index.is_unique
+
+
+class TestComputeDeltas:
+
+    def test_values(self, sensor_df):
+        deltas = compute_deltas(sensor_df)
+        assert deltas.shape == (2, 10)
+        assert np.allclose(deltas[0], 10.0)
+        assert np.allclose(deltas[1], -5.0)
+
+    def test_mask_selects_rows(self, sensor_df):
+        deltas = compute_deltas(sensor_df, mask=np.array([False, True]))
+        assert deltas.shape == (1, 10)
+        assert np.allclose(deltas, -5.0)
+
+    def test_float32_path(self, sensor_df):
+        deltas = compute_deltas(sensor_df, float32=True)
+        assert deltas.dtype == np.float32
+        assert np.allclose(deltas, compute_deltas(sensor_df), atol=1e-4)
+
+    def test_missing_column_raises(self, sensor_df):
+        with pytest.raises(KeyError):
+            compute_deltas(sensor_df.drop(columns=['NH__NOM_PC']))
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+
+from src.utils.async_main import shutdown_process_pool
+from src.utils.pipeline_runner import run_dag
+
+
+def add_column(name, delay=0.0, events=None):
+    """Stage appending a column, optionally slow, recording when it ends."""
+    def stage(df, flight_phase):
+        time.sleep(delay)
+        if events is not None:
+            events.append((flight_phase, name))
+        return df.assign(**{name: 1})
+    return stage
+
+
+def failing_stage(df, flight_phase):
+    raise ValueError("boom")
+
+
+def record_pid(df, flight_phase):
+    return df.assign(pid=os.getpid())
+
+
+def combine(data_dict, suffix=""):
+    return data_dict, {phase: list(df.columns) for phase, df in data_dict.items()}
+
+
+@pytest.fixture
+def data_dict():
+    return {phase: pd.DataFrame({"ESN": [1, 2]}) for phase in ["cruise", "climb", "take-off"]}
+
+
+class TestRunDag:
+
+    def test_stages_chained_per_phase_and_joined(self, data_dict):
+        stages = [("A", add_column("A")), ("B", add_column("B"), {})]
+        out, (joined, columns), timings = run_dag(data_dict, stages, join=("JOIN", combine, {"suffix": "x"}))
+
+        assert columns == {phase: ["ESN", "A", "B"] for phase in data_dict}
+        assert set(out) == set(data_dict)
+        assert set(timings) == {(p, s) for p in data_dict for s in ("A", "B")} | {("all", "JOIN")}
+
+    def test_phases_do_not_wait_for_each_other(self, data_dict):
+        events = []
+        stages = [
+            ("A", lambda df, flight_phase: add_column(
+                "A", 0.3 if flight_phase == "cruise" else 0.0, events)(df, flight_phase)),
+            ("B", add_column("B", 0.0, events)),
+        ]
+        run_dag(data_dict, stages)
+        # Climb and take-off complete both stages before cruise completes the first one
+        assert events.index(("climb", "B")) < events.index(("cruise", "A"))
+        assert events.index(("take-off", "B")) < events.index(("cruise", "A"))
+
+    def test_failed_stage_is_skipped(self, data_dict):
+        stages = [("A", add_column("A")), ("FAIL", failing_stage), ("B", add_column("B"))]
+        errors = set()
+        out, join_result, _ = run_dag(data_dict, stages, join=("JOIN", failing_stage), errors=errors)
+        assert list(out["cruise"].columns) == ["ESN", "A", "B"]
+        assert join_result is None
+        assert errors == {(phase, "FAIL") for phase in data_dict} | {("all", "JOIN")}
+
+    def test_max_concurrency(self, data_dict):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def stage(df, flight_phase):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return df
+
+        run_dag(data_dict, [("A", stage), ("B", stage)], max_concurrency=1)
+        assert peak[0] == 1
+
+    def test_process_executor(self, data_dict):
+        try:
+            out, _, _ = run_dag(data_dict, [("PID", record_pid)], executor="process", pool_workers=2)
+        finally:
+            shutdown_process_pool()
+        assert all((df["pid"] != os.getpid()).all() for df in out.values())
@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+import pytest
+
+from src.utils.query_builder import limit_predicates, render_query, select_columns, window_query
+
+QUERY_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "Queries")
+
+
+def read_template(phase):
+    with open(os.path.join(QUERY_FOLDER, f"Sql_fleetstore_{phase}.sql"), newline="") as f:
+        return f.read()
+
+
+class TestSelectColumns:
+
+    @pytest.mark.parametrize("phase", ["CRZ", "CLM", "TKO"])
+    def test_templates_parsed(self, phase):
+        columns = select_columns(read_template(phase))
+        assert columns["ESN"] == "DA.[EngineSerialNumber]"
+        assert columns["P25__PSI"] == "DA.[P25__PSI]"
+        assert columns["TGTS__NOM_K"].endswith(".[TGTS__NOM_K]")
+        assert "DSCID" not in columns
+
+
+class TestRenderQuery:
+
+    def test_limits_and_celsius(self):
+        query = render_query(read_template("CRZ"), "Cruise")
+        assert "DA.[P25__PSI] >= 25.0" in query
+        assert "DA.[MN1] <= 0.88" in query
+        assert "PS160__PSI] >=" not in query  # No limits for P160
+        assert "(EPS2.[TS25S__NOM_K] - 273.15) AS [TS25S__NOM_K]" in query
+        # Original condition kept, the commented out line does not hide the closing bracket
+        assert "AND (DA.deleted = 0" in query
+        assert query.rstrip().endswith("ORDER BY DA.[StartDatetime]")
+        assert "__DEL_PC" not in query
+
+    def test_deltas(self):
+        query = render_query(read_template("TKO"), "Take-off", limits=False, celsius=False, deltas=True)
+        assert "AS [PS26__DEL_PC]" in query and "AS [P160__DEL_PC]" in query
+        assert "NULLIF((EPS.[TS25S__NOM_K] - 273.15), 0)" in query
+        assert "WHERE DA.[P25__PSI]" not in query
+
+    def test_unknown_phase(self):
+        with pytest.raises(ValueError):
+            limit_predicates({"P25__PSI": "DA.[P25__PSI]"}, "Descent")
+
+
+class TestWindowQuery:
+
+    def test_window_bounds(self):
+        query = window_query(read_template("CLM"), pd.Timestamp("2025-01-01"), pd.Timestamp("2025-01-08"))
+        assert "%startTimestamp%" not in query
+        assert "DA.[StartDatetime] >= '2025-01-01 00:00:00'" in query
+        assert "WHERE DA.[StartDatetime] < '2025-01-08 00:00:00'" in query
+        # Limits added on top of the window
+        rendered = render_query(query, "Climb")
+        assert "DA.[StartDatetime] < '2025-01-08 00:00:00'" in rendered
+        assert rendered.rstrip().endswith("ORDER BY DA.[StartDatetime]")
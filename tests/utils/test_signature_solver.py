@@ -0,0 +1,124 @@
+import itertools
+import numpy as np
+import pytest
+
+from src.utils.signature_solver import (
+    stack_signature_combos,
+    signature_bounds,
+    solve_signature_fits,
+    exact_fit,
+)
+
+
+@pytest.fixture
+def signature_combos():
+    """All 1-, 2- and 3-signature combinations of 7 random signatures over 9 parameters."""
+    rng = np.random.default_rng(0)
+    signatures = rng.normal(0, 1, (7, 9))
+    norms = np.linalg.norm(signatures, axis=1)
+    ids = [f"SIG_{i}" for i in range(7)]
+    combos = []
+    for n_sig in (1, 2, 3):
+        for combo in itertools.combinations(range(7), n_sig):
+            combos.append((signatures[list(combo)].T, norms[list(combo)], [ids[i] for i in combo]))
+    return combos
+
+
+@pytest.fixture
+def observations(signature_combos):
+    """Signature combinations plus noise, with a NaN row and a zero row."""
+    rng = np.random.default_rng(1)
+    obs = []
+    for _ in range(60):
+        F, _, _ = signature_combos[rng.integers(len(signature_combos))]
+        obs.append(F @ rng.normal(0, 1, F.shape[1]) + rng.normal(0, rng.choice([0.01, 0.3, 1.0]), 9))
+    obs = np.array(obs)
+    obs[5, 2] = np.nan
+    obs[6] = 0.0
+    return obs
+
+
+def reference_fit(obs_vec, signature_combos):
+    """Exhaustive search with one lstsq per combination."""
+    obs_mag = np.linalg.norm(obs_vec)
+    best_pos, best_err = -1, np.inf
+    for pos, (F, norms, ids) in enumerate(signature_combos):
+        coeffs, err, magnitudes, fit_vec = exact_fit(F, norms, obs_vec, obs_mag)
+        if err < 0.3 and np.sum(magnitudes) < 5 * obs_mag and err < best_err:
+            best_pos, best_err = pos, err
+    return best_pos, best_err
+
+
+class TestStackSignatureCombos:
+
+    def test_groups_by_size(self, signature_combos):
+        stacks = stack_signature_combos(signature_combos)
+        assert sorted(len(positions) for positions, *_ in stacks) == [7, 21, 35]
+        for positions, F, P, norms in stacks:
+            assert P.shape == (len(positions), F.shape[2], F.shape[1])
+
+
+class TestSolveSignatureFits:
+
+    def test_matches_exhaustive_lstsq(self, signature_combos, observations):
+        fits = solve_signature_fits(observations, signature_combos, chunk_size=16)
+        n_fitted = 0
+        for r, obs_vec in enumerate(observations):
+            if np.isnan(obs_vec).any() or not obs_vec.any():
+                continue
+            best_pos, best_err = reference_fit(obs_vec, signature_combos)
+            assert fits['combo'][r] == best_pos
+            if best_pos >= 0:
+                n_fitted += 1
+                # Bit-compatible with the single-row lstsq result
+                assert fits['error_rel'][r] == best_err
+        assert n_fitted > 0
+
+    def test_skipped_rows(self, signature_combos, observations):
+        fits = solve_signature_fits(observations, signature_combos)
+        # NaN row: no magnitude, no fit
+        assert np.isnan(fits['obs_mag'][5]) and fits['combo'][5] == -1
+        # Zero row: zero magnitude, no fit
+        assert fits['obs_mag'][6] == 0.0 and fits['combo'][6] == -1
+        assert np.isnan(fits['coeffs'][6]).all()
+
+    def test_padding_for_smaller_combos(self, signature_combos):
+        F, norms, ids = signature_combos[0]
+        fits = solve_signature_fits((F[:, 0] * 2.0)[None, :], signature_combos[:7])
+        assert fits['combo'][0] == 0
+        assert fits['coeffs'][0, 0] == pytest.approx(2.0)
+        assert np.isnan(fits['coeffs'][0, 1:]).all()
+
+
+class TestPrunedSearch:
+
+    def test_bounds_below_exact_errors(self, signature_combos, observations):
+        from src.utils.signature_solver import _error_bounds
+        stacks = stack_signature_combos(signature_combos)
+        obs = observations[10:20]
+        obs_mag = np.linalg.norm(obs, axis=1)
+        estimate_sq, margin = _error_bounds(
+            signature_bounds(signature_combos, stacks), stacks, obs, obs_mag, len(signature_combos))
+        for pos, (F, norms, ids) in enumerate(signature_combos):
+            for i, obs_vec in enumerate(obs):
+                err = exact_fit(F, norms, obs_vec, obs_mag[i])[1]
+                assert estimate_sq[i, pos] - margin[pos] <= err ** 2
+
+    def test_exact_matches_exhaustive(self, signature_combos, observations):
+        groups = np.repeat(np.arange(6), 10)
+        fits = solve_signature_fits(observations, signature_combos, chunk_size=8)
+        pruned = solve_signature_fits(
+            observations, signature_combos, chunk_size=8, pruned=True, groups=groups)
+        for key in fits:
+            np.testing.assert_array_equal(pruned[key], fits[key])
+
+    def test_top_k_screening(self, signature_combos, observations):
+        fits = solve_signature_fits(observations, signature_combos)
+        approx = solve_signature_fits(
+            observations, signature_combos, pruned=True, exact=False, top_k=3)
+        fitted = approx['combo'] >= 0
+        # Approximate fits are accepted fits, never better than the exhaustive ones
+        assert fitted.any()
+        assert (approx['error_rel'][fitted] < 0.3).all()
+        assert (approx['error_rel'][fitted] >= fits['error_rel'][fitted]).all()
+
@@ -0,0 +1,102 @@
+import os
+import threading
+import pandas as pd
+import pytest
+
+from src.utils import snapshot_writer
+from src.utils.snapshot_writer import (
+    SnapshotWriter,
+    save_snapshot,
+    start_snapshot_sink,
+    stop_snapshot_sink,
+    write_snapshot,
+)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        "ESN": [1, 2, 3],
+        "reportdatetime": pd.date_range("2025-01-01", periods=3, freq="h"),
+        "P25__DEL_PC": [0.1, 0.2, 0.3],
+    })
+
+
+@pytest.fixture(autouse=True)
+def no_sink_left():
+    yield
+    stop_snapshot_sink()
+
+
+class TestWriteSnapshot:
+
+    def test_formats_and_compression(self, tmp_path, frame):
+        path = str(tmp_path / "LOOP_8_cruise.csv")
+        assert write_snapshot(frame, path) == path
+        assert write_snapshot(frame, path, "csv", "gzip").endswith("LOOP_8_cruise.csv.gz")
+        parquet_path = write_snapshot(frame, path, "parquet")
+        assert parquet_path.endswith("LOOP_8_cruise.parquet")
+        pd.testing.assert_frame_equal(pd.read_parquet(parquet_path), frame)
+        pd.testing.assert_frame_equal(
+            pd.read_csv(str(tmp_path / "LOOP_8_cruise.csv.gz"), parse_dates=["reportdatetime"]), frame)
+
+    def test_unknown_format(self, tmp_path, frame):
+        with pytest.raises(ValueError):
+            write_snapshot(frame, str(tmp_path / "x.csv"), "xlsx")
+
+
+class TestSnapshotWriter:
+
+    def test_stage_sampling(self, tmp_path, frame):
+        with SnapshotWriter(stage_every={"LOOP_6": 0, "LOOP_4": 2}) as writer:
+            for i in range(4):
+                writer.submit(frame, str(tmp_path / f"LOOP_4_{i}.csv"), stage="LOOP_4")
+                writer.submit(frame, str(tmp_path / f"LOOP_6_{i}.csv"), stage="LOOP_6")
+            writer.submit(frame, str(tmp_path / "LOOP_8.csv"), stage="LOOP_8")
+        assert sorted(os.listdir(tmp_path)) == ["LOOP_4_0.csv", "LOOP_4_2.csv", "LOOP_8.csv"]
+        assert writer.submitted == {"LOOP_4": 4, "LOOP_6": 4, "LOOP_8": 1}
+
+    def test_bounded_queue_blocks_until_written(self, tmp_path, frame, monkeypatch):
+        started, release = threading.Event(), threading.Event()
+        original = snapshot_writer.write_snapshot
+
+        def slow_write(*args, **kwargs):
+            started.set()
+            release.wait()
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(snapshot_writer, "write_snapshot", slow_write)
+        writer = SnapshotWriter(max_queue=1)
+        # One snapshot in the writer, one in the queue, the third one waits
+        writer.submit(frame, str(tmp_path / "a.csv"))
+        started.wait()
+        writer.submit(frame, str(tmp_path / "b.csv"))
+        third = threading.Thread(target=writer.submit, args=(frame, str(tmp_path / "c.csv")))
+        third.start()
+        third.join(timeout=0.2)
+        assert third.is_alive()
+
+        release.set()
+        third.join()
+        writer.close()
+        assert sorted(os.listdir(tmp_path)) == ["a.csv", "b.csv", "c.csv"]
+        with pytest.raises(RuntimeError):
+            writer.submit(frame, str(tmp_path / "d.csv"))
+
+    def test_write_errors_are_collected(self, tmp_path, frame):
+        with SnapshotWriter() as writer:
+            writer.submit(frame, str(tmp_path / "missing" / "\0" / "x.csv"))
+        assert len(writer.errors) == 1
+
+
+class TestSaveSnapshot:
+
+    def test_synchronous_csv_without_sink(self, tmp_path, frame):
+        save_snapshot(frame, str(tmp_path / "LOOP_7.csv"), stage="LOOP_7")
+        assert (tmp_path / "LOOP_7.csv").is_file()
+
+    def test_sink_written_at_shutdown(self, tmp_path, frame):
+        start_snapshot_sink(fmt="parquet")
+        save_snapshot(frame, str(tmp_path / "LOOP_7.csv"), stage="LOOP_7")
+        stop_snapshot_sink()
+        assert os.listdir(tmp_path) == ["LOOP_7.parquet"]
@@ -0,0 +1,85 @@
+import os
+import pandas as pd
+import pytest
+
+from src.utils.storage import (
+    data_path,
+    find_data_files,
+    read_frame,
+    storage_format,
+    write_frame,
+)
+
+
+@pytest.fixture
+def fleet_df():
+    """Fleetstore-like data with nullable ints, string identifiers and datetimes."""
+    times = pd.date_range(start="2025-01-01", periods=6, freq="D")
+    return pd.DataFrame({
+        "ESN": [1, 1, 1, 2, 2, 3],
+        "operator": pd.array(["Op1"] * 6, dtype="string"),
+        "ACID": pd.array(["AC1", "AC1", "AC1", "AC2", "AC2", None], dtype="string"),
+        "reportdatetime": times,
+        "datestored": times,
+        "SISTER_ESN": pd.array([2, None, 2, 1, None, None], dtype="Int64"),
+        "VAR1_IDENTIFIER50": ["IPC ETA", None, "HPC ETA", "IPC ETA", None, None],
+        "P25__DEL_PC": pd.array([0.1, None, 0.3, 0.4, 0.5, 0.6], dtype="Float64"),
+    })
+
+
+class TestParquetStorage:
+
+    def test_roundtrip_preserves_dtypes(self, tmp_path, fleet_df):
+        path = write_frame(fleet_df, data_path(str(tmp_path), "data_output_cruise"))
+        assert path.endswith(".parquet")
+        pd.testing.assert_frame_equal(read_frame(path), fleet_df)
+
+    def test_projection_and_filters(self, tmp_path, fleet_df):
+        path = write_frame(fleet_df, data_path(str(tmp_path), "data_output_cruise"))
+        df = read_frame(path, columns=["ESN", "reportdatetime", "SISTER_ESN"],
+                        esns=[1, 2], start="2025-01-02", end="2025-01-04")
+        assert list(df.columns) == ["ESN", "reportdatetime", "SISTER_ESN"]
+        assert df["ESN"].tolist() == [1, 1, 2]
+        assert df["SISTER_ESN"].dtype == "Int64"
+
+
+class TestCsvExport:
+
+    def test_csv_read_with_filters(self, tmp_path, fleet_df):
+        path = write_frame(fleet_df, data_path(str(tmp_path), "data_output_cruise", "csv"))
+        df = read_frame(path, esns=[2])
+        assert df["ESN"].tolist() == [2, 2]
+        assert df["reportdatetime"].dtype == "datetime64[ns]"
+
+    def test_csv_keeps_sub_second_datetimes(self, tmp_path, fleet_df):
+        fleet_df["datestored"] = fleet_df["datestored"] + pd.Timedelta("123456us")
+        path = write_frame(fleet_df, data_path(str(tmp_path), "data_output_cruise", "csv"))
+        df = read_frame(path)
+        pd.testing.assert_series_equal(df["datestored"], fleet_df["datestored"])
+        pd.testing.assert_series_equal(df["reportdatetime"], fleet_df["reportdatetime"])
+
+    def test_legacy_csv_mixed_precision(self, tmp_path):
+        # Older exports: seconds for reportdatetime, fractional seconds for datestored
+        path = tmp_path / "data_output_cruise.csv"
+        path.write_text("ESN,operator,ACID,reportdatetime,datestored,P25__PSI\n"
+                        "1,Op1,AC1,2025-01-01 00:00:00,2025-01-01 01:02:03.456,1.0\n"
+                        "1,Op1,AC1,2025-01-02 00:00:00,2025-01-02 01:02:03,1.0\n")
+        df = read_frame(str(path))
+        assert df["datestored"].tolist() == [pd.Timestamp("2025-01-01 01:02:03.456"),
+                                             pd.Timestamp("2025-01-02 01:02:03")]
+
+    def test_find_prefers_parquet(self, tmp_path, fleet_df):
+        for fmt in ("csv", "parquet"):
+            write_frame(fleet_df, data_path(str(tmp_path), "data_output_cruise", fmt))
+        write_frame(fleet_df, data_path(str(tmp_path), "data_output_climb", "csv"))
+        (tmp_path / "data_output_cruise.txt").write_text("not data")
+
+        assert find_data_files(str(tmp_path), "data_output_") == [
+            "data_output_climb.csv", "data_output_cruise.parquet"]
+        assert find_data_files(str(tmp_path), "DATA_OUTPUT_", "cruise") == ["data_output_cruise.parquet"]
+
+    def test_unknown_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            storage_format(os.path.join(str(tmp_path), "data.xlsx"))
+        with pytest.raises(ValueError):
+            data_path(str(tmp_path), "data", "feather")
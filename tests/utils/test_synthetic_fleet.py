@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.query_builder import select_columns
+from src.utils.synthetic_fleet import (
+    FLEETSTORE_COLUMNS,
+    MEASURED_COLUMNS,
+    PHASE_DSCID,
+    PHASE_OFFSET,
+    SENTINEL,
+    make_fleet_data,
+)
+from src.utils.xrates_reader import Xrates_reader
+
+QUERY_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "Queries")
+
+
+@pytest.fixture(scope="module")
+def xrates():
+    return dict(Xrates_reader(d) for d in range(3))
+
+
+@pytest.fixture(scope="module")
+def fleet(xrates):
+    return make_fleet_data(n_aircraft=8, flights_per_aircraft=300, shop_visit_rate=0.004, swap_rate=0.002,
+                           sentinel_rate=0.01, seed=3, xrates=xrates, return_events=True)
+
+
+class TestSchema:
+
+    @pytest.mark.parametrize("phase, flight_phase", [("CRZ", "cruise"), ("CLM", "climb"), ("TKO", "take-off")])
+    def test_query_columns(self, fleet, phase, flight_phase):
+        with open(os.path.join(QUERY_FOLDER, f"Sql_fleetstore_{phase}.sql")) as f:
+            columns = list(select_columns(f.read()))
+        columns.insert(columns.index("ENGPOS") + 1, "DSCID")
+        df = fleet[0][flight_phase]
+        assert df.columns.tolist() == columns == FLEETSTORE_COLUMNS
+        assert (df["DSCID"] == PHASE_DSCID[flight_phase]).all()
+        assert df["reportdatetime"].is_monotonic_increasing
+        assert len(df) == 8 * 2 * 300
+
+    def test_engines_share_flights(self, fleet):
+        df = fleet[0]["cruise"]
+        per_flight = df.groupby(["ACID", "reportdatetime"])["ENGPOS"].agg(["count", "nunique"])
+        assert (per_flight["count"] == 2).all() and (per_flight["nunique"] == 2).all()
+
+    def test_sentinels_and_limits(self, fleet):
+        df = fleet[0]["climb"]
+        sentinels = (df == SENTINEL).sum()
+        assert sentinels[MEASURED_COLUMNS].sum() > 0
+        assert sentinels.drop(MEASURED_COLUMNS).sum() == 0
+        assert df.isna().to_numpy().sum() > 0
+        alt = df["ALT__FT"].dropna()
+        assert alt[alt != SENTINEL].between(15000, 25000).all()
+        # Temperature nominals in Kelvin
+        assert df["TGTS__NOM_K"].dropna().min() > 273.15
+
+
+class TestEvents:
+
+    def test_shop_visit_gap(self, fleet):
+        df, events = fleet[0]["cruise"], fleet[1]
+        shop_visits = events[events["event"] == "shop visit"]
+        assert len(shop_visits) > 0
+        for _, event in shop_visits.iterrows():
+            times = df.loc[df["ESN"] == event["ESN"], "reportdatetime"]
+            # Cruise report of the flight of the event (the lease engine flies it)
+            removal = event["reportdatetime"] + PHASE_OFFSET["cruise"]
+            before, after = times[times < removal], times[times > removal]
+            if len(after):
+                assert (after.min() - before.max()) > pd.Timedelta(days=40)
+
+    def test_swaps_change_sister_engine(self, fleet):
+        df, events = fleet[0]["cruise"], fleet[1]
+        swaps = events[events["event"] == "engine swap"]
+        assert len(swaps) > 0
+        for _, event in swaps.iterrows():
+            installed = df[(df["ACID"] == event["ACID"]) & (df["ENGPOS"] == event["ENGPOS"])]
+            after = installed["reportdatetime"] >= event["reportdatetime"] + PHASE_OFFSET["cruise"]
+            assert (installed.loc[~after, "ESN"].iloc[-1]) == event["ESN"]
+            assert (installed.loc[after, "ESN"] != event["ESN"]).all()
+
+    def test_degradation_follows_xrates(self, xrates):
+        df = make_fleet_data(n_aircraft=4, flights_per_aircraft=2000, shop_visit_rate=0, swap_rate=0, damage_rate=0,
+                             degradation_per_year=(2.0, 2.0), noise_pc=0, sentinel_rate=0, nan_rate=0,
+                             flight_phases=("cruise",), xrates=xrates)["cruise"]
+        # TGT rises as the IPC / HPC efficiencies drop
+        tgt = (df["TGTU_A__DEGC"] / (df["TGTS__NOM_K"] - 273.15)).groupby(df["ESN"])
+        assert (tgt.last() > tgt.first()).all()
+
+
+class TestDeterminism:
+
+    def test_same_seed(self, xrates):
+        a = make_fleet_data(n_aircraft=3, flights_per_aircraft=50, seed=7, xrates=xrates)
+        b = make_fleet_data(n_aircraft=3, flights_per_aircraft=50, seed=7, xrates=xrates)
+        c = make_fleet_data(n_aircraft=3, flights_per_aircraft=50, seed=8, xrates=xrates)
+        for flight_phase in a:
+            pd.testing.assert_frame_equal(a[flight_phase], b[flight_phase])
+        assert not np.allclose(a["cruise"]["P25__PSI"].fillna(0), c["cruise"]["P25__PSI"].fillna(0))
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from src.utils.tail_state_store import TailStateStore, tail_retention_mask
+from src.utils.df_merger_new_v2 import df_merger_new
+from src.utils.storage import data_path, write_frame
+
+
+def history(esn, n_rows, start="2025-01-01"):
+    times = pd.date_range(start=start, periods=n_rows, freq="h")
+    return pd.DataFrame({
+        "ESN": esn,
+        "operator": "Op1",
+        "equipmentid": 101,
+        "ACID": "AC1",
+        "ENGPOS": 1,
+        "DSCID": 52,
+        "reportdatetime": times,
+        "datestored": times,
+        "P25__PSI": np.arange(n_rows, dtype=float),
+    })
+
+
+class TestTailRetentionMask:
+
+    def test_keeps_last_rows_per_esn(self):
+        df = pd.concat([history(1, 30), history(2, 5)], ignore_index=True)
+        df = df.sample(frac=1, random_state=0)  # Row order does not matter
+        # lag 5 + window 2 * 1 + 1 = 8 rows per ESN
+        keep = tail_retention_mask(df, lag_list=[5], WindowSemiWidth=1)
+        assert keep.sum() == 8 + 5
+        assert df.loc[keep & (df["ESN"] == 1), "P25__PSI"].min() == 22
+
+    def test_keeps_loop_8_buffers(self):
+        df = history(1, 40)
+        for i in (1, 2, 3):
+            df[f"VAR{i}_IDENTIFIER5"] = "XRATE_3"
+        ipc_rows = [0, 4, 9, 12, 15, 18, 35]
+        df.loc[ipc_rows, "VAR2_IDENTIFIER5"] = "IPC ETA"
+
+        keep = tail_retention_mask(df, lag_list=[5], WindowSemiWidth=1)
+
+        # Last 8 rows plus the last 5 "IPC ETA" rows
+        assert list(np.flatnonzero(keep)) == [9, 12, 15, 18] + list(range(32, 40))
+
+
+class TestTailStateStore:
+
+    def test_update_keeps_other_esns(self, tmp_path):
+        store = TailStateStore(str(tmp_path), "Cruise", lag_list=[5], WindowSemiWidth=1)
+        assert not store.exists() and store.load().empty
+
+        store.update(pd.concat([history(1, 20), history(2, 20)], ignore_index=True))
+        state = store.update(history(1, 3, start="2025-02-01"))
+
+        assert state.groupby("ESN").size().to_dict() == {1: 3, 2: 8}
+        loaded = store.load(esns=[2])
+        assert len(loaded) == 8 and (loaded["ESN"] == 2).all()
+        assert loaded["reportdatetime"].dtype == "datetime64[ns]"
+
+    def test_df_merger_uses_tail_state(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "Fleetstore_Data").mkdir()
+        store = TailStateStore(str(tmp_path / "Fleetstore_Data"), "cruise", lag_list=[5], WindowSemiWidth=1)
+        store.update(pd.concat([history(1, 20), history(2, 20)], ignore_index=True))
+
+        df_query = history(1, 2, start="2025-02-01")
+        merged = df_merger_new(df_query, "cruise", tail_state=store)
+
+        # Only the tail of the queried ESN, plus the new rows
+        assert merged.shape[0] == 8 + 2
+        assert (merged["ESN"] == 1).all()
+        assert merged["reportdatetime"].is_monotonic_decreasing
+
+        # The n_pts cap also applies to the tail state
+        assert len(df_merger_new(df_query, "cruise", tail_state=store, n_pts=5)) == 5
+
+    def test_merge_history_keeps_other_esns(self, tmp_path):
+        store = TailStateStore(str(tmp_path), "cruise", lag_list=[5], WindowSemiWidth=1)
+        assert len(store.merge_history(history(1, 3))) == 3  # No history yet
+
+        write_frame(pd.concat([history(1, 20), history(2, 20)], ignore_index=True),
+                    data_path(str(tmp_path), "data_output_cruise"))
+        # Tail of ESN 1 reprocessed with 2 new rows
+        processed = pd.concat([history(1, 20).tail(8), history(1, 2, start="2025-02-01")], ignore_index=True)
+        processed["P25__PSI"] = -1.0
+
+        merged = store.merge_history(processed)
+        assert merged.groupby("ESN").size().to_dict() == {1: 22, 2: 20}
+        assert (merged.loc[merged["ESN"] == 1, "P25__PSI"] == -1).sum() == 10
+        assert merged["reportdatetime"].is_monotonic_decreasing
+        assert len(store.merge_history(processed, n_pts=15)) == 30
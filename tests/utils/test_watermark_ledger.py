@@ -0,0 +1,84 @@
+import json
+import pandas as pd
+from sqlalchemy import create_engine
+
+from src.utils.watermark_ledger import WatermarkLedger, format_watermark
+
+TEMPLATE = (
+    "SELECT\n  F.[ESN] as ESN\n  ,F.[operator] as operator\n  ,F.[reportdatetime] as reportdatetime\n"
+    "  FROM fleet AS F\n  WHERE F.[reportdatetime] >= %startTimestamp%\n  ORDER BY F.[reportdatetime]")
+
+
+def fleet_engine():
+    engine = create_engine("sqlite://")
+    pd.DataFrame({
+        "ESN": [1, 2, 3, 4, 5],
+        "operator": ["Op1", "Op1", "Op2", "Op2", "Op3"],
+        "reportdatetime": ["2025-01-01 00:00:00", "2025-01-03 00:00:00", "2025-01-02 00:00:00",
+                           "2025-01-04 00:00:00", "2025-01-05 00:00:00"],
+    }).to_sql("fleet", engine, index=False)
+    return engine
+
+
+def write_ledger(path, marks):
+    path.write_text(json.dumps(marks))
+    return str(path)
+
+
+class TestRender:
+
+    def test_no_watermark_keeps_template(self, tmp_path):
+        ledger = WatermarkLedger(str(tmp_path / "watermarks.json"))
+        assert ledger.render(TEMPLATE, "Cruise") == TEMPLATE
+
+    def test_strict_phase_watermark(self, tmp_path):
+        ledger = WatermarkLedger(write_ledger(tmp_path / "watermarks.json", {
+            "cruise": {"*": "2025-01-03 00:00:00"}}))
+        query = ledger.render(TEMPLATE, "Cruise")
+        assert "%startTimestamp%" not in query
+        esns = pd.read_sql_query(query, fleet_engine())["ESN"].tolist()
+        assert esns == [4, 5]  # The row at the watermark is not fetched again
+
+    def test_per_operator_watermarks(self, tmp_path):
+        path = write_ledger(tmp_path / "watermarks.json", {
+            "cruise": {"*": "2025-01-03 00:00:00", "Op1": "2025-01-03 00:00:00", "Op2": "2025-01-01 12:00:00"}})
+        query = WatermarkLedger(path, per_operator=True).render(TEMPLATE, "Cruise")
+        # Op2 reports late: its row of 2025-01-02 is still fetched
+        assert pd.read_sql_query(query, fleet_engine())["ESN"].tolist() == [3, 4, 5]
+        # Operator marks are ignored without per_operator
+        assert pd.read_sql_query(WatermarkLedger(path).render(TEMPLATE, "Cruise"), fleet_engine())["ESN"].tolist() == [4, 5]
+
+
+class TestObserveCommit:
+
+    def test_marks_staged_until_commit(self, tmp_path):
+        path = str(tmp_path / "working_data" / "watermarks.json")
+        ledger = WatermarkLedger(path, per_operator=True)
+        raw = pd.read_sql_query("SELECT * FROM fleet", fleet_engine())
+        ledger.observe("Cruise", raw.iloc[:3])
+        ledger.observe("Cruise", raw.iloc[3:])
+        ledger.observe("Climb", raw.iloc[:1])
+        assert ledger.watermark("Cruise") is None
+
+        marks = ledger.commit()
+        assert marks["cruise"] == {"*": "2025-01-05 00:00:00", "Op1": "2025-01-03 00:00:00",
+                                   "Op2": "2025-01-04 00:00:00", "Op3": "2025-01-05 00:00:00"}
+        assert marks["climb"] == {"*": "2025-01-01 00:00:00", "Op1": "2025-01-01 00:00:00"}
+        assert WatermarkLedger(path).marks == marks
+
+        # A mark never moves back
+        ledger.observe("Climb", pd.DataFrame({"reportdatetime": ["2024-12-01 00:00:00"], "operator": ["Op1"]}))
+        assert ledger.commit()["climb"]["*"] == "2025-01-01 00:00:00"
+
+    def test_new_rows(self, tmp_path):
+        ledger = WatermarkLedger(write_ledger(tmp_path / "watermarks.json", {
+            "cruise": {"*": "2025-01-03 00:00:00", "Op2": "2025-01-01 12:00:00"}}), per_operator=True)
+        data = pd.DataFrame({
+            "operator": pd.array(["Op1", "Op2", "Op3", None], dtype="string"),
+            "reportdatetime": pd.to_datetime(["2025-01-02", "2025-01-02", "2025-01-04", "2025-01-03"])})
+        assert ledger.new_rows(data, "Cruise").tolist() == [False, True, True, False]
+        assert ledger.new_rows(data, "Climb") is None
+
+    def test_millisecond_marks(self):
+        assert format_watermark(pd.Timestamp("2025-01-02 03:04:05.678901")) == "2025-01-02 03:04:05.678"
+        assert format_watermark(pd.Timestamp("2025-01-02")) == "2025-01-02 00:00:00"